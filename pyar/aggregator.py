@@ -4,11 +4,12 @@ import os
 import random
 import shutil
 import string
-from collections import OrderedDict
+from collections import namedtuple
 import numpy as np
-from pyar import tabu, file_manager
+from pyar import tabu, file_manager, profiling, resources
 from pyar.Molecule import Molecule
 from pyar.data_analysis import clustering
+from pyar.data_analysis.dedup import DedupIndex
 from pyar.old_optimiser import optimise
 import re
 from pyar.Molecule import atomic_data
@@ -42,7 +43,10 @@ def aggregate(molecules,
               number_of_pathways,
               tabu_on,
               grid_on,
-              site):
+              site,
+              parallel_branches=1,
+              max_qc_jobs=None,
+              core_sets=None):
     """
     New aggregate module
 
@@ -67,6 +71,15 @@ def aggregate(molecules,
     :param maximum_number_of_seeds: The maximum number of seeds to be selected
         for the next cycle.
     :type maximum_number_of_seeds: int
+    :param parallel_branches: Number of worker processes for growing the
+        independent branches of the pathway tree.
+    :type parallel_branches: int
+    :param max_qc_jobs: Maximum number of QC jobs running at the same time
+        over all the branches; parallel_branches if None.
+    :type max_qc_jobs: int
+    :param core_sets: cores to pin each of the max_qc_jobs QC jobs to, from
+        resources.split_cores; no pinning if None.
+    :type core_sets: list(tuple(int))
     :return: None
 
     """
@@ -115,8 +128,8 @@ def aggregate(molecules,
         pathways_to_calculate = old_path_to_new_path(monomers_to_be_added,
                                                      old_path)
     else:
-        pathways_to_calculate = select_pathways(monomers_to_be_added,
-                                                number_of_pathways)
+        pathways_to_calculate = list(select_pathways(monomers_to_be_added,
+                                                     number_of_pathways))
 
         aggregator_logger.info(
             "  The following Afbau paths will be carried out")
@@ -126,52 +139,180 @@ def aggregate(molecules,
                 paths_for_print += p.name
             aggregator_logger.info(paths_for_print)
 
-    seed_storage = OrderedDict()
+    # Pathways sharing a prefix (e.g. a -> ab -> abb) reach the same
+    # aggregate; each distinct prefix is computed once and its seeds are
+    # handed to all the pathways that continue through it.
+    root_id = ag_id
+    levels = prefix_levels(pathways_to_calculate, first_pathway)
 
-    initial_storage = copy.deepcopy(seed_storage)
-    initial_aggregate_id = ag_id
+    def make_job(node, this_seed):
+        node_id = prefix_id(root_id, node.prefix)
+        ag_home = os.path.join(starting_directory, f"{node_id}_{node.pathway:03d}")
+        return ag_home, (node_id, this_seed, node.monomer, number_of_orientations, qc_params,
+                         maximum_number_of_seeds, tabu_on, grid_on, site)
 
-    outside_counter = first_pathway
-    inside_counter = 1
-
-    for i in pathways_to_calculate:
-        aggregator_logger.info(f"  Path: {i}")
-        for this_monomer in i:
-            if len(seed_storage) < 1:
-                ag_id = update_id(ag_id, this_monomer.name)
-                seed_storage[ag_id] = [this_monomer]
-                continue
-            this_seed = seed_storage[ag_id]
-            ag_id = update_id(ag_id, this_monomer.name)
-            ag_home = "{}_{:03d}".format(ag_id, outside_counter)
-            if not os.path.exists(ag_home):
-                file_manager.make_directories(ag_home)
-            os.chdir(ag_home)
-
-            seed_storage[ag_id] = add_one(ag_id,
-                                          this_seed,
-                                          this_monomer,
-                                          number_of_orientations,
-                                          qc_params,
-                                          maximum_number_of_seeds,
-                                          tabu_on, grid_on, site)
-            os.chdir(starting_directory)
-            if len(seed_storage[ag_id]) == 0:
-                aggregator_logger.info(f"No molecules were found from {ag_id}"
-                                       f"to continue this pathway.")
-                aggregator_logger.info('Breaking! 😟')
-                break
-            seed_storage.popitem(last=False)
-            inside_counter += 1
-        outside_counter += 1
-        seed_storage = copy.copy(initial_storage)
-        ag_id = initial_aggregate_id
+    status = grow_pathway_tree(levels, make_job, parallel_branches, max_qc_jobs, core_sets)
+    if status is StopIteration:
+        return StopIteration
+    os.chdir(starting_directory)
 
     if hm_orientations == 'auto' and number_of_orientations <= 256:
         number_of_orientations += 8
     return
 
 
+PrefixNode = namedtuple('PrefixNode', ['key', 'parent', 'prefix', 'monomer', 'pathway', 'path'])
+
+
+def prefix_levels(pathways, first_pathway=0):
+    """
+    Arrange the pathways as a prefix trie.
+
+    :param pathways: monomer addition orders
+    :param first_pathway: number of the first pathway, used in directory names
+    :return: nodes grouped by depth; each node is created once, for the
+        first pathway that passes through it.
+    """
+    levels = []
+    seen = set()
+    for pathway_number, pathway in enumerate(pathways, start=first_pathway):
+        names = [m.name for m in pathway]
+        for depth, monomer in enumerate(pathway):
+            key = ''.join(names[:depth + 1])
+            if key in seen:
+                continue
+            seen.add(key)
+            if len(levels) <= depth:
+                levels.append([])
+            parent = ''.join(names[:depth]) or None
+            levels[depth].append(PrefixNode(key, parent, names[:depth + 1], monomer, pathway_number,
+                                            ''.join(names)))
+    return levels
+
+
+def prefix_id(root_id, names):
+    """Aggregate id after adding the monomers in names to the empty aggregate"""
+    for name in names:
+        root_id = update_id(root_id, name)
+    return root_id
+
+
+def grow_branch(job):
+    """Run add_one for one node of the pathway trie in its own directory"""
+    ag_home, add_one_arguments = job
+    if not os.path.exists(ag_home):
+        file_manager.make_directories(ag_home)
+    os.chdir(ag_home)
+    branch_handler = None
+    if _qc_job_slots is not None:
+        # Each worker logs the branches it grows to their own directories
+        branch_handler = logging.FileHandler(os.path.join(ag_home, 'pyar_branch.log'), 'a')
+        branch_handler.setFormatter(logging.Formatter('%(message)s'))
+        logging.getLogger('pyar').addHandler(branch_handler)
+    try:
+        return add_one(*add_one_arguments)
+    finally:
+        if branch_handler is not None:
+            logging.getLogger('pyar').removeHandler(branch_handler)
+            branch_handler.close()
+
+
+# Queue of QC job slots shared by all the pathway workers, limiting the QC
+# jobs running at the same time; each slot holds the cores its job is pinned
+# to, or None.  None when the pathways are grown in this process.
+_qc_job_slots = None
+
+
+def init_pathway_worker(qc_job_slots, level):
+    global _qc_job_slots
+    _qc_job_slots = qc_job_slots
+    pyar_logger = logging.getLogger('pyar')
+    for handler in pyar_logger.handlers[:]:
+        pyar_logger.removeHandler(handler)
+    pyar_logger.setLevel(level)
+
+
+def optimise_in_budget(molecule, qc_params):
+    """optimise, waiting for a free QC job slot when running in a pathway worker"""
+    if _qc_job_slots is None:
+        return optimise(molecule, qc_params)
+    cores = _qc_job_slots.get()
+    try:
+        resources.pin(cores)
+        return optimise(molecule, qc_params)
+    finally:
+        _qc_job_slots.put(cores)
+
+
+def grow_pathway_tree(levels, make_job, parallel_branches=1, max_qc_jobs=None, core_sets=None):
+    """
+    Grow every node of the pathway trie from the seeds of its parent.
+
+    With parallel_branches > 1 the nodes run in a pool of worker processes
+    as soon as their parent is finished, while at most max_qc_jobs QC jobs
+    run at the same time over all the workers, each pinned to one of
+    core_sets if given.
+
+    :param levels: nodes grouped by depth, from prefix_levels
+    :param make_job: function(node, parent seeds) returning (directory, add_one arguments)
+    :return: StopIteration if a stop signal was found
+    """
+    cwd = os.getcwd()
+    children = {}
+    for level in levels[1:]:
+        for node in level:
+            children.setdefault(node.parent, []).append(node)
+
+    stopped = False
+    started = set()
+
+    def start(node, this_seed):
+        # A pathway starts at the first node it does not share with an earlier one
+        if node.pathway not in started:
+            started.add(node.pathway)
+            aggregator_logger.info(f"  Path: {node.path}")
+        return make_job(node, this_seed)
+
+    def finished(node, new_seeds):
+        nonlocal stopped
+        if new_seeds is StopIteration:
+            stopped = True
+            return []
+        if not new_seeds:
+            aggregator_logger.info(f"No molecules were found from {node.key} "
+                                   f"to continue the pathways through it.")
+            aggregator_logger.info('Breaking! 😟')
+            return []
+        aggregator_logger.info(f"  Path prefix {node.key}: {len(new_seeds)} seeds")
+        return [(child, new_seeds) for child in children.get(node.key, [])]
+
+    jobs = [(child, [root.monomer]) for root in levels[0] for child in children.get(root.key, [])]
+    if parallel_branches <= 1:
+        while jobs and not stopped:
+            node, this_seed = jobs.pop(0)
+            jobs.extend(finished(node, grow_branch(start(node, this_seed))))
+            os.chdir(cwd)
+        return StopIteration if stopped else None
+
+    import concurrent.futures
+    import multiprocessing
+    qc_job_slots = multiprocessing.Queue()
+    for slot in range(max_qc_jobs or parallel_branches):
+        qc_job_slots.put(core_sets[slot % len(core_sets)] if core_sets else None)
+    with concurrent.futures.ProcessPoolExecutor(parallel_branches, initializer=init_pathway_worker,
+                                                initargs=(qc_job_slots, aggregator_logger.getEffectiveLevel())) \
+            as executor:
+        pending = {executor.submit(grow_branch, start(node, this_seed)): node for node, this_seed in jobs}
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                node = pending.pop(future)
+                for child, this_seed in finished(node, future.result()):
+                    if not stopped:
+                        pending[executor.submit(grow_branch, start(child, this_seed))] = child
+    return StopIteration if stopped else None
+
+
 def old_path_to_new_path(monomers_to_be_added, old_path):
     complete_pathways = []
     for each in old_path:
@@ -352,6 +493,104 @@ def read_orientations(molecule_id, noo):
 
 #     return less_than_ideal
 
+class EnergyWindowScheduler:
+    """
+    Energy-window pruning of the block optimizations in add_one.
+
+    Every orientation is optimized for at most max_rounds rounds, as before.
+    No budget is shared between the orientations or seeds: the rounds a
+    pruned orientation does not run are saved, not handed to the others.
+    spent counts the optimizations run, and is written with every decision
+    so that the saving can be measured against a run without a window.
+    After each round the unfinished orientations are ranked by their current
+    energy, and those more than window kcal/mol above the lowest converged
+    energy seen so far which did not go down since the previous round are
+    dropped.  Only converged energies move the minimum; the partial energy
+    of an unfinished optimization may be missing (None or 0.0), and such an
+    orientation is kept.  Every decision is appended to log_file.
+
+    :param window: energy window in kcal/mol; no pruning if None
+    :param max_rounds: optimization rounds per orientation
+    :param log_file: csv file for the pruning decisions
+    """
+
+    def __init__(self, window=None, max_rounds=10, log_file=None):
+        self.window = window
+        self.max_rounds = max_rounds
+        self.log_file = log_file
+        self.spent = 0
+        self.best_energy = None
+        self.previous_energies = {}
+        self.decisions = []
+
+    def rounds_left(self, molecules, round_number):
+        """True if molecules remain and round_number (from 0) is within max_rounds"""
+        return bool(molecules) and round_number < self.max_rounds
+
+    def spend(self, number_of_optimizations):
+        self.spent += number_of_optimizations
+
+    @staticmethod
+    def partial_energy(molecule):
+        """Energy of the molecule, None if it was not obtained"""
+        return float(molecule.energy) if molecule.energy else None
+
+    def observe(self, converged):
+        """Update the running minimum from the converged molecules"""
+        energies = [e for e in map(self.partial_energy, converged) if e is not None]
+        if energies and (self.best_energy is None or min(energies) < self.best_energy):
+            self.best_energy = min(energies)
+
+    def prune(self, molecules, round_number):
+        """Return the unconverged molecules to be optimized in the next round"""
+        if self.window is None or self.best_energy is None:
+            return molecules
+        ranked = sorted(molecules, key=lambda m: (self.partial_energy(m) is None, self.partial_energy(m) or 0.0))
+        kept = []
+        for molecule in ranked:
+            energy = self.partial_energy(molecule)
+            previous = self.previous_energies.get(molecule.name)
+            improved = energy is None or previous is None or energy < previous - 1e-6
+            relative = None if energy is None else (energy - self.best_energy) * 627.51
+            keep = improved or relative <= self.window
+            if energy is not None:
+                self.previous_energies[molecule.name] = energy
+            self.record(round_number, molecule.name, energy, relative, improved, keep)
+            if keep:
+                kept.append(molecule)
+            else:
+                aggregator_logger.info(f"      Pruned {molecule.name}: {relative:.2f} kcal/mol above the minimum")
+        return kept
+
+    def record(self, round_number, name, energy, relative, improved, kept):
+        decision = {'round': round_number, 'name': name, 'energy': energy, 'relative_energy': relative,
+                    'improved': improved, 'decision': 'kept' if kept else 'pruned',
+                    'optimizations': self.spent}
+        self.decisions.append(decision)
+        if self.log_file is None:
+            return
+        import csv
+        new_file = not os.path.exists(self.log_file)
+        with open(self.log_file, 'a', newline='') as fp:
+            writer = csv.DictWriter(fp, fieldnames=list(decision))
+            if new_file:
+                writer.writeheader()
+            writer.writerow(decision)
+
+
+def remove_similar_with_energy(molecules):
+    """
+    clustering.remove_similar on the molecules with an energy; those
+    without one cannot be compared and are all kept.
+    """
+    with_energy = [m for m in molecules if m.energy is not None]
+    if len(with_energy) < 2:
+        return molecules
+    kept = clustering.remove_similar(with_energy)
+    return [m for m in molecules if m.energy is None or m in kept]
+
+
+@profiling.timed('aggregator.add_one')
 def add_one(aggregate_id, seeds, monomer, hm_orientations, qc_params, maximum_number_of_seeds, tabu_on, grid_on, site):
     if check_stop_signal():
         aggregator_logger.info("Function: add_one")
@@ -362,7 +601,14 @@ def add_one(aggregate_id, seeds, monomer, hm_orientations, qc_params, maximum_nu
     
     if qc_params.get('software'):
         
-        list_of_optimized_molecules = []
+        # Only the unique minima go on to clustering.  The loop used to hand
+        # every converged orientation to choose_geometries, whose final
+        # remove_similar dropped the duplicates after they had weighted the
+        # clusters; with the index they are dropped as they converge, and a
+        # duplicate only replaces its stored twin if its energy is lower.
+        minima = DedupIndex()
+        scheduler = EnergyWindowScheduler(qc_params.get('energy_window'),
+                                          log_file=os.path.join(cwd, f'pruning_{aggregate_id}.csv'))
         for seed_count, each_seed in enumerate(seeds):
             if check_stop_signal():
                 aggregator_logger.info("Function: add_one")
@@ -385,27 +631,36 @@ def add_one(aggregate_id, seeds, monomer, hm_orientations, qc_params, maximum_nu
             else:
                 all_orientations = read_orientations(mol_id, hm_orientations)
             not_converged = all_orientations[:]
-            status_list = [False for _ in not_converged]
-            for i in range(10):
-                if len(not_converged) > 0:
-                    aggregator_logger.info(f"    Round {i + 1:d} of block optimizations with {len(not_converged):d} molecules")
-                    qc_params["opt_threshold"] = 'loose'
-                    status_list = [optimise(each_mol, qc_params) for each_mol in not_converged]
-                    converged = [n for n, s in zip(not_converged, status_list) if s is True]
-                    list_of_optimized_molecules.extend(converged)
-                    not_converged = [n for n, s in zip(not_converged, status_list) if s == 'CycleExceeded' and not tabu.broken(n)]
-                    not_converged = clustering.remove_similar(not_converged)
-                else:
-                    aggregator_logger.info("    All molecules are processed")
-                    break
+            i = 0
+            while scheduler.rounds_left(not_converged, i):
+                aggregator_logger.info(f"    Round {i + 1:d} of block optimizations with {len(not_converged):d} molecules")
+                qc_params["opt_threshold"] = 'loose'
+                with profiling.span('aggregator.block_round', aggregate=aggregate_id, round=i + 1,
+                                    molecules=len(not_converged)):
+                    status_list = [optimise_in_budget(each_mol, qc_params) for each_mol in not_converged]
+                profiling.count('aggregator.optimizations', len(not_converged))
+                scheduler.spend(len(not_converged))
+                converged = [n for n, s in zip(not_converged, status_list) if s is True]
+                new_minima = minima.update(converged)
+                profiling.count('aggregator.converged', len(converged))
+                profiling.count('aggregator.new_minima', len(new_minima))
+                scheduler.observe(converged)
+                aggregator_logger.info(f"    {len(new_minima)} new minima, {len(minima)} unique so far")
+                not_converged = [n for n, s in zip(not_converged, status_list) if s == 'CycleExceeded' and not tabu.broken(n)]
+                not_converged = scheduler.prune(not_converged, i + 1)
+                not_converged = remove_similar_with_energy(not_converged)
+                i += 1
+            if not_converged:
+                aggregator_logger.info(f"    The following molecules are not converged after {i} rounds")
+                for n in not_converged:
+                    aggregator_logger.info(f"      {n.name}")
             else:
-                aggregator_logger.info("    The following molecules are not converged after 10 rounds")
-                for n, s in zip(not_converged, status_list):
-                    if s == 'CycleExceeded' and not tabu.broken(n):
-                        aggregator_logger.info("      ", n.name)
+                aggregator_logger.info("    All molecules are processed")
             os.chdir(cwd)
-        
-        
+
+        aggregator_logger.info(f"  {scheduler.spent} block optimizations for {len(seeds)} seeds")
+        list_of_optimized_molecules = list(minima)
+
         if os.path.exists('selected'):
             os.chdir('selected')
             optimized_molecules = [i.name for i in list_of_optimized_molecules]
@@ -437,7 +692,7 @@ def add_one(aggregate_id, seeds, monomer, hm_orientations, qc_params, maximum_nu
         less_than_ideal = []
         for each_file in selected_seeds:
             not_refined = copy.deepcopy(each_file)
-            status = optimise(each_file, qc_params)
+            status = optimise_in_budget(each_file, qc_params)
             if status is True:
                 xyz_file = f'job_{each_file.name}/result_{each_file.name}.xyz'
                 shutil.copy(xyz_file, '.')
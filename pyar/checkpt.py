@@ -1,9 +1,12 @@
 import pickle
 
+from pyar import profiling
+
 
 # import pandas as pd
 # import numpy as np
 
+@profiling.timed('checkpoint.dump')
 def dumpchk(jobdict, location, logger):
     with open(f'{location}/jobs.pkl', 'wb') as f:
         pickle.dump(jobdict, f)
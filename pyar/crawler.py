@@ -1,26 +1,166 @@
+"""
+Collect the results of pyar runs into an index.
+
+The run directory is walked for xyz files, and only the files that are new
+or whose modification time or size changed since the previous crawl are
+parsed, in a process pool.  The results are kept in an SQLite index
+(formula, energy, path, identity hash, lineage), which is exported to
+data.csv after every crawl.
+"""
+import hashlib
+import json
+import multiprocessing
 import os
+import sqlite3
 
+import numpy as np
 import pandas as pd
 
 from pyar import Molecule
 from pyar.interface import babel
 
+COLUMNS = ['path', 'mtime', 'size', 'n_atoms', 'formula', 'energy', 'smile', 'inchi',
+           'identity', 'lineage', 'atoms', 'coordinates']
+
+# Columns of data.csv, with the names and order of the original crawler;
+# the identity and lineage from the index are appended
+CSV_COLUMNS = {'n_atoms': 'n_atoms', 'formula': 'formula', 'path': 'Name', 'atoms': 'Atoms',
+               'coordinates': 'coordinates', 'energy': 'Energy', 'smile': 'SMILE', 'inchi': 'InChi',
+               'identity': 'identity', 'lineage': 'lineage'}
+
 
 def make_formula(at_ls):
     # Creating an empty dictionary
     freq = {items: at_ls.count(items) for items in at_ls}
-    return ''.join(f"{key}{value}" for key, value in freq.items()), files in os.walk(starting_point):
+    return ''.join(f"{key}{value}" for key, value in freq.items())
+
+
+def find_files(starting_point, exclude_pattern, pattern):
+    """
+    Absolute paths of the xyz files below starting_point with their (mtime,
+    size).  Directories whose path below starting_point contains
+    exclude_pattern are not entered.
+    """
+    starting_point = os.path.abspath(starting_point)
+    found = {}
+    for root, dirs, files in os.walk(starting_point):
+        if exclude_pattern:
+            dirs[:] = [d for d in dirs
+                       if exclude_pattern not in os.path.relpath(os.path.join(root, d), starting_point)]
         for file in files:
-            if pattern in file and os.path.splitext(file)[-1] == '.xyz' and exclude_pattern not in root:
+            if pattern in file and os.path.splitext(file)[-1] == '.xyz':
                 xyz_file = os.path.join(root, file)
-                inchi_string = babel.make_inchi_string_from_xyz(xyz_file)
-                smile_string = babel.make_smile_string_from_xyz(xyz_file)
-                atoms_list, mol_coordinates, name, title, energy = Molecule.read_xyz(xyz_file)
-                nat = len(atoms_list)
-                formula = make_formula(atoms_list)
-                ne.append([nat, formula, xyz_file, atoms_list, mol_coordinates, energy, smile_string, inchi_string])
-    df = pd.DataFrame(ne, columns=['n_atoms', 'formula', 'Name', 'Atoms', 'coordinates', 'Energy', 'SMILE', 'InChi'])
-    df.to_csv('data.csv')
+                stat = os.stat(xyz_file)
+                found[xyz_file] = (stat.st_mtime, stat.st_size)
+    return found
+
+
+def identity_hash(formula, inchi, smile):
+    """Short hash identifying the chemical species"""
+    key = inchi or smile or formula
+    return hashlib.sha1(f"{formula}|{key}".encode()).hexdigest()[:16]
+
+
+def lineage(xyz_file, starting_point):
+    """Directory path of the file relative to the run directory, e.g. aggregates/ag_a_002/seed_001"""
+    return os.path.relpath(os.path.dirname(os.path.abspath(xyz_file)), os.path.abspath(starting_point))
+
+
+def parse_file(job):
+    """
+    Read one xyz file and compute its identity; returns a row of the index.
+    Unreadable files get an empty row, so that they are not parsed again
+    until they change.
+    """
+    xyz_file, mtime, size, starting_point, identities = job
+    try:
+        atoms_list, mol_coordinates, name, title, energy = Molecule.read_xyz(xyz_file)
+    except (Exception, SystemExit):
+        return (xyz_file, mtime, size) + (None,) * (len(COLUMNS) - 3)
+    inchi_string = smile_string = ''
+    if identities:
+        inchi_string = babel_string(babel.make_inchi_string_from_xyz, xyz_file)
+        smile_string = babel_string(babel.make_smile_string_from_xyz, xyz_file)
+    formula = make_formula(atoms_list)
+    return (xyz_file, mtime, size, len(atoms_list), formula, energy, smile_string, inchi_string,
+            identity_hash(formula, inchi_string, smile_string), lineage(xyz_file, starting_point),
+            json.dumps(atoms_list), json.dumps(mol_coordinates.tolist()))
+
+
+def babel_string(make_string, xyz_file):
+    """InChI or SMILES string of the file; empty if babel fails"""
+    try:
+        return make_string(xyz_file)
+    except (Exception, SystemExit):
+        return ''
+
+
+def to_csv(df, csv_file, starting_point=None):
+    """
+    Write the index in the layout of the original data.csv; the names are
+    given below starting_point, as the original crawler did, if it is given.
+    """
+    table = df[list(CSV_COLUMNS)].rename(columns=CSV_COLUMNS)
+    if starting_point is not None:
+        table['Name'] = [os.path.join(starting_point, os.path.relpath(path, os.path.abspath(starting_point)))
+                         for path in table['Name']]
+    table['n_atoms'] = table['n_atoms'].astype('Int64')
+    table['Atoms'] = [str(json.loads(atoms)) if isinstance(atoms, str) else None for atoms in table['Atoms']]
+    table['coordinates'] = [str(np.array(json.loads(coordinates))) if isinstance(coordinates, str) else None
+                            for coordinates in table['coordinates']]
+    table.to_csv(csv_file)
+
+
+def open_index(index_file):
+    connection = sqlite3.connect(index_file)
+    connection.execute('CREATE TABLE IF NOT EXISTS structures ('
+                       'path TEXT PRIMARY KEY, mtime REAL, size INTEGER, n_atoms INTEGER, formula TEXT, '
+                       'energy REAL, smile TEXT, inchi TEXT, identity TEXT, lineage TEXT, '
+                       'atoms TEXT, coordinates TEXT)')
+    connection.execute('CREATE INDEX IF NOT EXISTS structures_formula ON structures (formula, energy)')
+    return connection
+
+
+def collect_data(starting_point='./', exclude_pattern='tmp', pattern='result', index_file='pyar_index.sqlite',
+                 csv_file='data.csv', processes=None, identities=True):
+    """
+    Update the index with the new and changed xyz files.
+
+    :param starting_point: run directory to crawl
+    :param exclude_pattern: skip directories whose path below starting_point contains this
+    :param pattern: only files whose names contain this
+    :param index_file: SQLite index
+    :param csv_file: the whole index is exported to this file; skipped if None
+    :param processes: size of the process pool; os.cpu_count() if None
+    :param identities: compute InChI and SMILES strings with babel
+    :return: the index as a DataFrame
+    """
+    connection = open_index(index_file)
+    known = {path: (mtime, size) for path, mtime, size in connection.execute('SELECT path, mtime, size FROM structures')}
+    found = find_files(starting_point, exclude_pattern, pattern)
+
+    removed = [(path,) for path in known if path not in found]
+    changed = [(path, mtime, size, starting_point, identities)
+               for path, (mtime, size) in found.items() if known.get(path) != (mtime, size)]
+    print(f"{len(found)} files: {len(changed)} new or changed, {len(removed)} removed")
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes > 1 and len(changed) > 1:
+        with multiprocessing.Pool(processes) as pool:
+            rows = pool.map(parse_file, changed, chunksize=max(1, len(changed) // (4 * processes)))
+    else:
+        rows = [parse_file(job) for job in changed]
+
+    with connection:
+        connection.executemany('DELETE FROM structures WHERE path = ?', removed)
+        connection.executemany(f"INSERT OR REPLACE INTO structures VALUES ({', '.join('?' * len(COLUMNS))})",
+                               rows)
+    df = pd.read_sql_query('SELECT * FROM structures ORDER BY formula, energy', connection)
+    connection.close()
+    if csv_file:
+        to_csv(df, csv_file, starting_point)
+    return df
 
 
 def main():
@@ -29,8 +169,12 @@ def main():
     parser.add_argument('--starting-directory', default='./')
     parser.add_argument('--exclude', default='tmp')
     parser.add_argument('--pattern', default='result')
+    parser.add_argument('--index', default='pyar_index.sqlite', help='SQLite index file')
+    parser.add_argument('-np', '--processes', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--no-identities', action='store_true', help='Do not compute InChI and SMILES strings')
     args = parser.parse_args()
-    collect_data(args.starting_directory, args.exclude, args.pattern)
+    collect_data(args.starting_directory, args.exclude, args.pattern, index_file=args.index,
+                 processes=args.processes, identities=not args.no_identities)
 
 
 if __name__ == "__main__":
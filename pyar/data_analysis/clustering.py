@@ -1,34 +1,46 @@
-import itertools
 import logging
 import operator
 import os
 import numpy as np
 import pandas as pd
-from sklearn.cluster import DBSCAN, KMeans
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial.distance import cdist
+from sklearn.cluster import DBSCAN, KMeans, SpectralClustering, MiniBatchKMeans, Birch
+from sklearn.decomposition import PCA
 from sklearn.mixture import GaussianMixture
+from sklearn.neighbors import NearestNeighbors, kneighbors_graph
 from sklearn.preprocessing import StandardScaler
-from sklearn.metrics.pairwise import rbf_kernel
+from sklearn.random_projection import GaussianRandomProjection
 import hdbscan
 import pyar.property
+from pyar import profiling
 import pyar.representations
 
 cluster_logger = logging.getLogger('pyar.cluster')
 
+@profiling.timed('clustering.remove_similar')
 def remove_similar(list_of_molecules):
     final_list = list_of_molecules[:]
     cluster_logger.debug('Number of molecules before similarity elimination,  {}'.format(len(final_list)))
-    for a, b in itertools.combinations(list_of_molecules, 2):
-        energy_difference = calc_energy_difference(a, b)
-        fingerprint_distance = calc_fingerprint_distance(a, b)
-        if abs(energy_difference) < 1e-5 and abs(fingerprint_distance) < 1.0:
-            if energy_difference < 0:
-                if a in final_list:
-                    cluster_logger.debug('Removing {}'.format(a.name))
-                    final_list.remove(a)
-            else:
-                if b in final_list:
-                    cluster_logger.debug('Removing {}'.format(b.name))
-                    final_list.remove(b)
+    if len(list_of_molecules) < 2:
+        print_energy_table(final_list)
+        return final_list
+    energies = np.array([float(m.energy) for m in list_of_molecules])
+    fingerprints = pyar.representations.fingerprints([m.atoms_list for m in list_of_molecules],
+                                                     [m.coordinates for m in list_of_molecules])
+    energy_differences = energies[:, np.newaxis] - energies[np.newaxis, :]
+    fingerprint_distances = cdist(fingerprints, fingerprints)
+    similar = (np.abs(energy_differences) < 1e-5) & (fingerprint_distances < 1.0)
+    for i, j in zip(*np.nonzero(np.triu(similar, k=1))):
+        a, b = list_of_molecules[i], list_of_molecules[j]
+        if energy_differences[i, j] < 0:
+            if a in final_list:
+                cluster_logger.debug('Removing {}'.format(a.name))
+                final_list.remove(a)
+        else:
+            if b in final_list:
+                cluster_logger.debug('Removing {}'.format(b.name))
+                final_list.remove(b)
     cluster_logger.debug('Number of molecules after similarity elimination,  {}'.format(len(final_list)))
     print_energy_table(final_list)
     return final_list
@@ -44,6 +56,7 @@ def calc_fingerprint_distance(a, b):
     )
 
 
+@profiling.timed('clustering.choose_geometries')
 def choose_geometries(list_of_molecules, maximum_number_of_seeds=12):
     if len(list_of_molecules) < 2:
         cluster_logger.info("Not enough data to cluster (only %d), returning original" % len(list_of_molecules))
@@ -57,15 +70,10 @@ def choose_geometries(list_of_molecules, maximum_number_of_seeds=12):
     algorithm = os.environ.get('PYAR_CLUSTERING_ALGORITHM', 'hdbscan').lower()
     cluster_logger.info(f'Clustering on {len(list_of_molecules)} geometries using {algorithm}')
 
-    # Use MBTR for feature representation
-    dt = np.array([pyar.representations.mbtr_descriptor(m.atoms_list, m.coordinates) for m in list_of_molecules])
-
-    # Scale the data
-    scaler = StandardScaler()
-    dt_scaled = scaler.fit_transform(dt)
+    if algorithm in SCALABLE_ALGORITHMS:
+        return choose_representatives(list_of_molecules, maximum_number_of_seeds, algorithm)
 
-    # Save features to CSV
-    pd.DataFrame(dt_scaled).to_csv("mbtr_features.csv")
+    dt_scaled = mbtr_features(list_of_molecules)
 
     try:
         labels = generate_labels(dt_scaled, algorithm, maximum_number_of_seeds)
@@ -87,6 +95,102 @@ def choose_geometries(list_of_molecules, maximum_number_of_seeds=12):
     else:
         return reduced_best_from_each_cluster
 
+def mbtr_features(list_of_molecules):
+    """Standardised MBTR features, also saved to mbtr_features.csv"""
+    dt = np.array([pyar.representations.mbtr_descriptor(m.atoms_list, m.coordinates) for m in list_of_molecules])
+    dt_scaled = StandardScaler().fit_transform(dt)
+    pd.DataFrame(dt_scaled).to_csv("mbtr_features.csv")
+    return dt_scaled
+
+
+SCALABLE_ALGORITHMS = ('minibatch_kmeans', 'birch')
+
+# Centres of the last MiniBatchKMeans fit for each (number of clusters,
+# feature dimension), the starting point of the next fit in the same space
+_previous_centres = {}
+
+
+def choose_representatives(list_of_molecules, maximum_number_of_seeds=12, algorithm='minibatch_kmeans',
+                           projection=None, n_components=32):
+    """
+    Select seeds in a single pass with a scalable clustering backend.
+
+    Duplicates are removed first, the MBTR features are optionally projected
+    to a few dozen dimensions, and the remaining geometries are divided into
+    maximum_number_of_seeds clusters, whose lowest energy members are
+    returned.  If a cluster ends up empty, the lowest energy geometries not
+    yet selected fill the gap, so that exactly maximum_number_of_seeds are
+    returned.
+
+    :param list_of_molecules: candidate geometries
+    :param maximum_number_of_seeds: number of representatives
+    :param algorithm: 'minibatch_kmeans' or 'birch'
+    :param projection: 'pca', 'random' or 'none'; PYAR_CLUSTERING_PROJECTION
+        or 'pca' if not given
+    :param n_components: dimension after the projection
+    :return: list of selected molecules
+    """
+    candidates = remove_similar(list_of_molecules)
+    if len(candidates) <= maximum_number_of_seeds:
+        return candidates
+
+    if projection is None:
+        projection = os.environ.get('PYAR_CLUSTERING_PROJECTION', 'pca').lower()
+    dt = project_features(mbtr_features(candidates), projection, n_components)
+
+    try:
+        labels = scalable_labels(dt, algorithm, maximum_number_of_seeds)
+    except Exception as e:
+        cluster_logger.exception(f"Clustering algorithm {algorithm} failed")
+        cluster_logger.exception(e)
+        return candidates
+    selected = select_best_from_each_cluster(labels, candidates)[:maximum_number_of_seeds]
+    remaining = sorted((m for m in candidates if m not in selected), key=lambda m: m.energy)
+    return selected + remaining[:maximum_number_of_seeds - len(selected)]
+
+
+def project_features(dt, projection='pca', n_components=32):
+    """Reduce the feature dimension with PCA or a Gaussian random projection"""
+    n_components = min(n_components, dt.shape[0], dt.shape[1])
+    if projection == 'none' or n_components == dt.shape[1]:
+        return dt
+    if projection == 'random':
+        return GaussianRandomProjection(n_components=n_components, random_state=42).fit_transform(dt)
+    if projection != 'pca':
+        cluster_logger.warning(f"Unknown projection: {projection}. Using PCA.")
+    return PCA(n_components=n_components, random_state=42).fit_transform(dt)
+
+
+def scalable_labels(dt, algorithm='minibatch_kmeans', n_clusters=12, warm_start=True):
+    """
+    Labels from MiniBatchKMeans or from a BIRCH tree with a global clustering step.
+
+    With warm_start, MiniBatchKMeans starts from the centres of the previous
+    fit with the same number of clusters and feature dimension (e.g. the
+    selection for the previous seeds of a pathway) instead of k-means++
+    restarts; the centres are refined on the new features, so a start from
+    a different set of geometries only costs iterations.  BIRCH builds its
+    tree in a single pass and is not warm started.
+    """
+    if algorithm == 'birch':
+        return Birch(n_clusters=n_clusters, threshold=birch_threshold(dt)).fit_predict(dt)
+    key = (n_clusters, dt.shape[1])
+    if warm_start and key in _previous_centres:
+        model = MiniBatchKMeans(n_clusters=n_clusters, init=_previous_centres[key], n_init=1,
+                                batch_size=min(1024, len(dt)), random_state=42)
+    else:
+        model = MiniBatchKMeans(n_clusters=n_clusters, batch_size=min(1024, len(dt)), n_init=3, random_state=42)
+    labels = model.fit_predict(dt)
+    _previous_centres[key] = model.cluster_centers_
+    return labels
+
+
+def birch_threshold(dt, sample_size=1000):
+    """Half the median nearest-neighbour distance of a sample, as BIRCH subcluster radius"""
+    sample = dt[np.random.default_rng(42).permutation(len(dt))[:sample_size]]
+    return 0.5 * float(np.median(k_distances(sample, 1)))
+
+
 def generate_labels(dt, algorithm='hdbscan', maximum_number_of_seeds=8):
     if algorithm == 'kmeans':
         return kmeans_clustering(dt, maximum_number_of_seeds)
@@ -97,7 +201,10 @@ def generate_labels(dt, algorithm='hdbscan', maximum_number_of_seeds=8):
     elif algorithm == 'gaussian_mixture':
         return gaussian_mixture_clustering(dt, maximum_number_of_seeds)
     elif algorithm == 'rbf_kernel':
+        # The number of clusters follows from the affinity threshold, as before
         return rbf_kernel_clustering(dt)
+    elif algorithm in SCALABLE_ALGORITHMS:
+        return scalable_labels(dt, algorithm, maximum_number_of_seeds)
     else:
         cluster_logger.warning(f"Unknown algorithm: {algorithm}. Using HDBSCAN.")
         return hdbscan_clustering(dt)
@@ -119,27 +226,103 @@ def gaussian_mixture_clustering(dt, n_components):
     gm = GaussianMixture(n_components=n_components, random_state=42)
     return gm.fit_predict(dt)
 
-def rbf_kernel_clustering(dt, threshold=0.99):
-    similarities = rbf_kernel(dt)
-    n_samples = similarities.shape[0]
-    labels = np.zeros(n_samples, dtype=int)
-    current_label = 0
-    for i in range(n_samples):
-        if labels[i] == 0:
-            current_label += 1
-            labels[i] = current_label
-            for j in range(i+1, n_samples):
-                if similarities[i, j] > threshold:
-                    labels[j] = current_label
+def rbf_kernel_clustering(dt, threshold=0.99, n_clusters=None, n_neighbors=10, gamma=None):
+    """
+    Cluster on a sparse RBF affinity graph.
+
+    Only the k nearest neighbours of every point are kept, with weights
+    exp(-gamma * d^2). By default, as used by generate_labels, the
+    clusters are the connected components of the edges with affinity above
+    threshold, so that their number is chosen by the data.  With
+    n_clusters, the graph is instead the precomputed affinity of a spectral
+    clustering into that many clusters.
+
+    :param dt: (N, D) feature matrix
+    :param threshold: affinity above which two points are in the same cluster
+    :param n_clusters: number of clusters for the spectral clustering
+    :param n_neighbors: neighbours per point in the graph
+    :param gamma: RBF width; 1 / D by default, as in sklearn's rbf_kernel
+    :return: labels
+    """
+    n_samples = len(dt)
+    if gamma is None:
+        gamma = 1.0 / dt.shape[1]
+    n_neighbors = min(n_neighbors, n_samples - 1)
+    graph = kneighbors_graph(dt, n_neighbors, mode='distance', include_self=False)
+    graph = graph.maximum(graph.T).tocsr()
+    graph.data = np.exp(-gamma * graph.data ** 2)
+    if n_clusters is not None and n_clusters < n_samples:
+        model = SpectralClustering(n_clusters=n_clusters, affinity='precomputed', random_state=42)
+        return model.fit_predict(graph)
+    graph.data[graph.data <= threshold] = 0.0
+    graph.eliminate_zeros()
+    _, labels = connected_components(graph, directed=False)
     return labels
 
-def determine_dbscan_params(dt):
-    # Simple heuristic for DBSCAN parameters
-    distances = np.sort(np.sum((dt[:, None, :] - dt[None, :, :]) ** 2, axis=-1), axis=1)
-    eps = np.median(distances[:, 1])
-    min_samples = 2
+
+def determine_dbscan_params(dt, min_samples=2, exact=False, tile_size=256):
+    """
+    Choose eps for DBSCAN at the knee of the sorted k-distance curve.
+
+    The distance of every point to its (min_samples - 1)-th neighbour is
+    obtained from a nearest-neighbour query, so that memory grows as
+    O(N k) instead of the O(N^2 D) of a broadcast distance array.
+
+    :param dt: (N, D) feature matrix
+    :param min_samples: DBSCAN min_samples; also sets k
+    :param exact: compute the k-distances from tiled pairwise distances
+    :param tile_size: number of rows per tile for the exact calculation
+    :return: eps, min_samples
+    """
+    k = max(1, min(min_samples - 1, len(dt) - 1))
+    if exact:
+        k_dist = tiled_k_distances(dt, k, tile_size)
+    else:
+        k_dist = k_distances(dt, k)
+    eps = knee_of_curve(np.sort(k_dist))
+    if not eps > 0:
+        eps = float(np.median(k_dist)) or 0.5
+    cluster_logger.debug(f'DBSCAN parameters: eps={eps:.4f}, min_samples={min_samples}')
     return eps, min_samples
 
+
+def k_distances(dt, k):
+    """Distance of each point to its k-th nearest neighbour (itself excluded)"""
+    neighbours = NearestNeighbors(n_neighbors=k + 1).fit(dt)
+    distances, _ = neighbours.kneighbors(dt)
+    return distances[:, k]
+
+
+def tiled_k_distances(dt, k, tile_size=256):
+    """
+    Exact k-th neighbour distances from pairwise distances computed in
+    (tile_size, N) blocks.
+    """
+    dt = np.asarray(dt, dtype=float)
+    squared_norms = np.einsum('ij,ij->i', dt, dt)
+    k_dist = np.empty(len(dt))
+    for start in range(0, len(dt), tile_size):
+        stop = min(start + tile_size, len(dt))
+        block = squared_norms[start:stop, np.newaxis] + squared_norms[np.newaxis, :] \
+            - 2.0 * dt[start:stop] @ dt.T
+        np.maximum(block, 0.0, out=block)
+        block[np.arange(stop - start), np.arange(start, stop)] = np.inf
+        k_dist[start:stop] = np.sqrt(np.partition(block, k - 1, axis=1)[:, k - 1])
+    return k_dist
+
+
+def knee_of_curve(values):
+    """
+    Value at the knee of an increasing curve: the point farthest from the
+    chord joining its ends.
+    """
+    n = len(values)
+    if n < 3 or values[-1] == values[0]:
+        return float(values[-1]) if n else 0.0
+    x = np.linspace(0.0, 1.0, n)
+    y = (values - values[0]) / (values[-1] - values[0])
+    return float(values[np.argmax(x - y)])
+
 # def select_best_from_each_cluster(labels, list_of_molecules):
 #     unique_labels = np.unique(labels)
 #     cluster_logger.info(f"The distribution of file in each cluster: {np.bincount(labels)}")
@@ -0,0 +1,149 @@
+"""
+Incremental duplicate detection for optimized structures.
+
+Structures are bucketed in a dictionary by a cheap invariant: the formula,
+the energy rounded to energy_threshold and a few quantiles of the sorted
+interatomic distance spectrum rounded to spectrum_resolution.  A new
+structure is compared with the exact fingerprint (and optionally RMSD)
+criterion only against the members of its own bucket and of the neighbouring
+buckets it could fall in through rounding, so that adding a structure costs
+close to O(1).
+
+The buckets probed for a structure hold every structure whose energy is
+within energy_threshold and whose distance quantiles are each within
+spectrum_resolution / 2 of its own.  A duplicate by the fingerprint
+criterion whose distance spectrum differs by more than that is not found.
+"""
+import collections
+import itertools
+import logging
+
+import numpy as np
+from scipy.spatial.distance import pdist
+
+import pyar.representations
+from pyar import profiling
+
+dedup_logger = logging.getLogger('pyar.dedup')
+
+
+def formula(atoms_list):
+    """
+    Formula string in Hill order: C, then H, then the other elements
+    alphabetically; all alphabetically without carbon, e.g. 'CH4O', 'H2O'.
+    """
+    counts = collections.Counter(a.capitalize() for a in atoms_list)
+    if 'C' in counts:
+        order = ['C'] + (['H'] if 'H' in counts else []) + sorted(set(counts) - {'C', 'H'})
+    else:
+        order = sorted(counts)
+    return ''.join(f"{element}{counts[element] if counts[element] > 1 else ''}" for element in order)
+
+
+def distance_spectrum(coordinates, quantiles=(0.25, 0.5, 0.75, 1.0)):
+    """Quantiles of the sorted interatomic distances"""
+    if len(coordinates) < 2:
+        return np.zeros(len(quantiles))
+    return np.quantile(pdist(coordinates), quantiles)
+
+
+class DedupIndex:
+    """
+    Hash index of unique structures that can be queried as soon as each
+    optimization finishes.
+
+    Two structures are duplicates if their energies differ by less than
+    energy_threshold and their fingerprints by less than
+    fingerprint_threshold (the criteria of clustering.remove_similar), and,
+    if rmsd_threshold is given, their permutation-invariant RMSD is below it.
+    """
+
+    def __init__(self, energy_threshold=1e-5, fingerprint_threshold=1.0, spectrum_resolution=0.5,
+                 rmsd_threshold=None):
+        self.energy_threshold = energy_threshold
+        self.fingerprint_threshold = fingerprint_threshold
+        self.spectrum_resolution = spectrum_resolution
+        self.rmsd_threshold = rmsd_threshold
+        self.buckets = collections.defaultdict(list)
+        self.molecules = []
+
+    def __len__(self):
+        return len(self.molecules)
+
+    def __iter__(self):
+        return iter(self.molecules)
+
+    def keys(self, molecule):
+        """
+        The bucket key of the molecule followed by the keys of the
+        neighbouring buckets that a duplicate could have been rounded into.
+
+        A quantile within half a bin of this one's rounds to its bin or to
+        the neighbouring bin on the side this one is nearer to, and an energy
+        within energy_threshold falls in its bin or one of the two next to it.
+        """
+        name = formula(molecule.atoms_list)
+        energy_bin = int(np.floor(float(molecule.energy) / self.energy_threshold))
+        scaled = distance_spectrum(np.asarray(molecule.coordinates, dtype=float)) / self.spectrum_resolution
+        nearest = np.round(scaled).astype(int)
+        spectrum_bins = [(bin_, bin_ + (1 if value >= bin_ else -1)) for value, bin_ in zip(scaled, nearest)]
+        return [(name, energy_bin + shift, spectrum_key)
+                for shift in (0, -1, 1)
+                for spectrum_key in itertools.product(*spectrum_bins)]
+
+    def find(self, molecule):
+        """Return the stored duplicate of the molecule, or None"""
+        energy = float(molecule.energy)
+        fingerprint = None
+        for key in self.keys(molecule):
+            for entry in self.buckets.get(key, []):
+                stored, stored_fingerprint = entry
+                if abs(float(stored.energy) - energy) >= self.energy_threshold:
+                    continue
+                if fingerprint is None:
+                    fingerprint = pyar.representations.fingerprint(molecule.atoms_list, molecule.coordinates)
+                if np.linalg.norm(stored_fingerprint - fingerprint) >= self.fingerprint_threshold:
+                    continue
+                if self.rmsd_threshold is not None and not self.same_structure(stored, molecule):
+                    continue
+                return stored
+        return None
+
+    def same_structure(self, a, b):
+        from pyar.rmsd import molecule_rmsd
+        return molecule_rmsd(a, b) < self.rmsd_threshold
+
+    def add(self, molecule):
+        """
+        Insert the molecule unless it duplicates a stored one.
+
+        :return: True if the molecule is new
+        """
+        duplicate = self.find(molecule)
+        if duplicate is not None:
+            dedup_logger.debug(f'{molecule.name} is a duplicate of {duplicate.name}')
+            if float(molecule.energy) < float(duplicate.energy):
+                self.replace(duplicate, molecule)
+            return False
+        key = self.keys(molecule)[0]
+        fingerprint = pyar.representations.fingerprint(molecule.atoms_list, molecule.coordinates)
+        self.buckets[key].append((molecule, fingerprint))
+        self.molecules.append(molecule)
+        return True
+
+    def replace(self, old, new):
+        """Keep the lower energy one of two duplicates"""
+        self.remove(old)
+        self.add(new)
+
+    def remove(self, molecule):
+        for key in self.keys(molecule)[:1]:
+            self.buckets[key] = [entry for entry in self.buckets[key] if entry[0] is not molecule]
+            if not self.buckets[key]:
+                del self.buckets[key]
+        self.molecules = [m for m in self.molecules if m is not molecule]
+
+    @profiling.timed('dedup.update')
+    def update(self, molecules):
+        """Add several molecules and return the new ones"""
+        return [m for m in molecules if self.add(m)]
@@ -0,0 +1,277 @@
+"""
+Energy and gradient engines.
+
+An engine is any callable ``engine(atoms_list, coordinates)`` that returns
+the energy (Hartree) and the gradient (Hartree/Angstrom, same shape as the
+coordinates) of one geometry.  Drivers in pyar that only need energies and
+gradients, such as the relaxed bond scan in pyar.scan, work with any of
+them.
+
+The Morse and Lennard-Jones engines are mock engines for testing those
+drivers; they are not offered by pyar-cli --software, and are reached
+through get_engine only when the software in qc_params is 'morse' or
+'lennard_jones'.
+
+Functions
+---------
+
+get_engine(qc_params)
+morse_engine(depth, width)
+lennard_jones_engine(epsilon)
+ase_engine(calculator)
+mlatom_engine(model)
+xtb_library_engine(method, charge, uhf)
+optimise_with_engine(engine, atoms_list, coordinates)
+"""
+import logging
+import threading
+
+import numpy as np
+
+import pyar.data.new_atomic_data as atomic_data
+
+engines_logger = logging.getLogger('pyar.engines')
+
+ev_to_hartree = 1.0 / 27.211386245988
+bohr_to_angstrom = 0.529177210903
+
+# Energy change (Hartree) and gradient norm (Hartree/Bohr) thresholds of the
+# xtb optimisation levels, as in xtb's ANCopt
+xtb_convergence_thresholds = {'crude': (5e-4, 1e-2), 'sloppy': (1e-4, 6e-3), 'loose': (5e-5, 4e-3),
+                              'lax': (2e-5, 2e-3), 'normal': (5e-6, 1e-3), 'tight': (1e-6, 8e-4),
+                              'vtight': (1e-7, 2e-4), 'extreme': (5e-8, 5e-5)}
+
+_xtb_calculators = threading.local()
+
+
+def pair_terms(atoms_list, coordinates):
+    """Unique atom pairs, their separation vectors, distances and sums of covalent radii"""
+    coordinates = np.asarray(coordinates, dtype=float)
+    i, j = np.triu_indices(len(coordinates), k=1)
+    vectors = coordinates[i] - coordinates[j]
+    distances = np.linalg.norm(vectors, axis=1)
+    radii = np.array([atomic_data.covalent_radius[a] for a in atoms_list])
+    return i, j, vectors, distances, radii[i] + radii[j]
+
+
+def pair_gradient(number_of_atoms, i, j, vectors, distances, d_energy):
+    """Cartesian gradient from the derivatives of a pair potential with respect to the distances"""
+    forces = (d_energy / distances)[:, np.newaxis] * vectors
+    gradient = np.zeros((number_of_atoms, 3))
+    np.add.at(gradient, i, forces)
+    np.add.at(gradient, j, -forces)
+    return gradient
+
+
+def morse_engine(depth=0.1, width=1.5):
+    """
+    Morse pair potential with the equilibrium distance at the sum of the
+    covalent radii; a cheap mock engine for testing drivers.
+
+    :param depth: well depth in Hartree
+    :param width: width parameter in 1/Angstrom
+    """
+
+    def engine(atoms_list, coordinates):
+        i, j, vectors, distances, r0 = pair_terms(atoms_list, coordinates)
+        x = np.exp(-width * (distances - r0))
+        energy = np.sum(depth * (1.0 - x) ** 2 - depth)
+        d_energy = 2.0 * depth * width * (1.0 - x) * x
+        return energy, pair_gradient(len(atoms_list), i, j, vectors, distances, d_energy)
+
+    return engine
+
+
+def lennard_jones_engine(epsilon=0.01):
+    """
+    Lennard-Jones pair potential with the minimum at the sum of the
+    covalent radii; a cheap mock engine for testing drivers.
+
+    :param epsilon: well depth in Hartree
+    """
+
+    def engine(atoms_list, coordinates):
+        i, j, vectors, distances, r0 = pair_terms(atoms_list, coordinates)
+        s6 = (r0 / distances) ** 6
+        energy = np.sum(epsilon * (s6 ** 2 - 2.0 * s6))
+        d_energy = 12.0 * epsilon * (s6 - s6 ** 2) / distances
+        return energy, pair_gradient(len(atoms_list), i, j, vectors, distances, d_energy)
+
+    return engine
+
+
+def ase_engine(calculator):
+    """Engine from an ASE calculator (energies in eV, forces in eV/Angstrom)"""
+    from ase import Atoms
+
+    def engine(atoms_list, coordinates):
+        atoms = Atoms(symbols=atoms_list, positions=coordinates)
+        atoms.calc = calculator
+        energy = atoms.get_potential_energy() * ev_to_hartree
+        gradient = -atoms.get_forces() * ev_to_hartree
+        return energy, gradient
+
+    return engine
+
+
+def mlatom_engine(model):
+    """Engine from a model of the bundled MLatom (e.g. pyar.mlatom.aiqm1.aiqm1())"""
+    from pyar.mlatom import data
+
+    def engine(atoms_list, coordinates):
+        molecule = data.molecule.from_numpy(np.asarray(coordinates, dtype=float),
+                                            np.array([atomic_data.atomic_number[a] for a in atoms_list]))
+        model.predict(molecule=molecule, calculate_energy=True, calculate_energy_gradients=True)
+        return molecule.energy, molecule.get_energy_gradients()
+
+    return engine
+
+
+def xtb_library():
+    """
+    The Python bindings of the xtb C API: 'tblite' (tblite.interface) or
+    'xtb-python' (xtb.interface), or None if neither is installed
+    """
+    try:
+        import tblite.interface  # noqa: F401
+        return 'tblite'
+    except ImportError:
+        pass
+    try:
+        import xtb.interface  # noqa: F401
+        return 'xtb-python'
+    except ImportError:
+        return None
+
+
+def xtb_calculators():
+    """The xtb calculators of this thread"""
+    if not hasattr(_xtb_calculators, 'cache'):
+        _xtb_calculators.cache = {}
+    return _xtb_calculators.cache
+
+
+def xtb_library_engine(method='GFN2-xTB', charge=0, uhf=0):
+    """
+    Engine evaluating xtb in process through tblite or xtb-python.
+
+    One calculator is kept per (method, atoms, charge, uhf) and thread for
+    the life of the process, so the parametrisation is loaded once and every
+    further geometry only updates the positions.  The threads of
+    scan_orientations share the engine but not its calculators, which hold
+    the geometry between update() and singlepoint().
+
+    :return: engine, or None if neither library is installed
+    """
+    library = xtb_library()
+    if library is None:
+        return None
+
+    def calculator(numbers, positions):
+        calculators = xtb_calculators()
+        key = (library, method, tuple(numbers), charge, uhf)
+        if key not in calculators:
+            if library == 'tblite':
+                from tblite.interface import Calculator
+                calc = Calculator(method, numbers, positions, charge=charge, uhf=uhf)
+                calc.set('verbosity', 0)
+            else:
+                from xtb.interface import Calculator
+                from xtb.libxtb import VERBOSITY_MUTED
+                from xtb.utils import get_method
+                calc = Calculator(get_method(method), numbers, positions, charge=charge, uhf=uhf)
+                calc.set_verbosity(VERBOSITY_MUTED)
+            calculators[key] = calc
+        else:
+            calculators[key].update(positions)
+        return calculators[key]
+
+    def engine(atoms_list, coordinates):
+        numbers = np.array([atomic_data.atomic_number[a.capitalize()] for a in atoms_list])
+        positions = np.asarray(coordinates, dtype=float) / bohr_to_angstrom
+        results = calculator(numbers, positions).singlepoint()
+        if library == 'tblite':
+            energy, gradient = results.get('energy'), results.get('gradient')
+        else:
+            energy, gradient = results.get_energy(), results.get_gradient()
+        return energy, np.asarray(gradient) / bohr_to_angstrom
+
+    return engine
+
+
+def optimise_with_engine(engine, atoms_list, coordinates, max_cycles=350, gradient_threshold=1e-3,
+                         energy_threshold=None):
+    """
+    Minimise the energy of the engine with L-BFGS.
+
+    Converged, as in xtb, when the norm of the gradient is below
+    gradient_threshold and the energy changed by less than energy_threshold
+    in the last step.
+
+    :param gradient_threshold: gradient norm in Hartree/Bohr
+    :param energy_threshold: energy change in Hartree; not checked if None
+    :return: energy, optimized coordinates and True if converged
+    """
+    from scipy.optimize import minimize
+
+    shape = np.shape(coordinates)
+    evaluated = {}
+    state = {'x': np.ravel(np.asarray(coordinates, dtype=float)), 'energy': None, 'converged': False}
+
+    def energy_and_gradient(x):
+        energy, gradient = engine(atoms_list, x.reshape(shape))
+        evaluated[x.tobytes()] = energy, np.ravel(gradient)
+        return evaluated[x.tobytes()]
+
+    def check_convergence(x):
+        energy, gradient = evaluated.get(x.tobytes()) or energy_and_gradient(x)
+        gradient_norm = np.linalg.norm(gradient) * bohr_to_angstrom
+        energy_change = np.inf if state['energy'] is None else abs(energy - state['energy'])
+        state.update(x=np.array(x), energy=energy,
+                     converged=gradient_norm <= gradient_threshold and
+                     (energy_threshold is None or energy_change <= energy_threshold))
+        evaluated.clear()
+        evaluated[x.tobytes()] = energy, gradient
+        if state['converged']:
+            raise StopIteration
+
+    try:
+        minimize(energy_and_gradient, state['x'], jac=True, method='L-BFGS-B', callback=check_convergence,
+                 options={'maxiter': max_cycles, 'gtol': 1e-12, 'ftol': 1e-15})
+    except StopIteration:
+        pass
+    if state['energy'] is None:
+        # Stopped before the first step
+        state['energy'] = (evaluated.get(state['x'].tobytes()) or energy_and_gradient(state['x']))[0]
+    return float(state['energy']), state['x'].reshape(shape), bool(state['converged'])
+
+
+def get_engine(qc_params, charge=0, multiplicity=1):
+    """
+    Energy and gradient engine for the software in qc_params; 'morse' and
+    'lennard_jones' give the mock engines used in the tests.
+
+    :return: engine, or None if the software offers no in-process energies and gradients
+    """
+    software = qc_params.get('software')
+    if software == 'morse':
+        return morse_engine()
+    if software == 'lennard_jones':
+        return lennard_jones_engine()
+    if software in ('aiqm1_mlatom', 'mlatom_aiqm1'):
+        from pyar.mlatom.aiqm1 import aiqm1
+        return mlatom_engine(aiqm1())
+    if software == 'xtb':
+        engine = xtb_library_engine(xtb_method(qc_params), charge, multiplicity - 1)
+        if engine is None:
+            engines_logger.info('Neither tblite nor xtb-python is available')
+        return engine
+    return None
+
+
+def xtb_method(qc_params):
+    method = qc_params.get('method') or ''
+    for name in ('GFN1-xTB', 'GFN2-xTB'):
+        if method.lower() in (name.lower(), name[:4].lower()):
+            return name
+    return 'GFN2-xTB'
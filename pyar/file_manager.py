@@ -23,6 +23,8 @@ import os
 import shutil
 import sys
 
+from pyar import profiling
+
 file_manager_logger = logging.getLogger('pyar.file_manager')
 
 
@@ -187,6 +189,132 @@ def check_stop(filename):
         sys.exit(0)
 
 
+#: Files copied back from the scratch directory to the job directory, with
+#: the restart files of the engine (pyar.interface.registry.restart_files)
+SCRATCH_ARTEFACTS = ('result_*', 'trial_*', 'traj_*', '*.out', '*.log', '*.arc', 'energy', 'xtbopt.xyz')
+
+
+def scratch_root():
+    """
+    Directory for the job scratch directories from PYAR_SCRATCH: 'tmpdir'
+    for $TMPDIR, 'shm' for /dev/shm or a path; None if not set.
+    """
+    location = os.environ.get('PYAR_SCRATCH')
+    if not location:
+        return None
+    if location == 'tmpdir':
+        import tempfile
+        return tempfile.gettempdir()
+    if location == 'shm':
+        return '/dev/shm'
+    return location
+
+
+def file_states(directory):
+    """(size, modification time) of every file below directory, by path"""
+    states = {}
+    for root, dirs, files in os.walk(directory):
+        for f in files:
+            path = os.path.join(root, f)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                states[path] = (stat.st_size, stat.st_mtime_ns)
+    return states
+
+
+def output_size(directory, staged=None):
+    """
+    Bytes of the files left in directory that are new or were changed
+    since staged (the file_states after staging in); files written and
+    deleted during the job are not counted.
+    """
+    staged = staged or {}
+    return sum(state[0] for path, state in file_states(directory).items() if staged.get(path) != state)
+
+
+def record_scratch_usage(software, size):
+    """Add a line (software, output bytes) to the file PYAR_SCRATCH_ACCOUNTING"""
+    accounting_file = os.environ.get('PYAR_SCRATCH_ACCOUNTING')
+    if accounting_file:
+        with open(accounting_file, 'a') as fp:
+            fp.write(f"{software},{size}\n")
+
+
+def scratch_usage(accounting_file):
+    """Number of jobs and bytes of output left in scratch at their end, for each software"""
+    usage = {}
+    if os.path.exists(accounting_file):
+        with open(accounting_file) as fp:
+            for line in fp:
+                software, size = line.rsplit(',', 1)
+                jobs, total = usage.get(software, (0, 0))
+                usage[software] = (jobs + 1, total + int(size))
+    return usage
+
+
+class JobScratch(object):
+    """
+    Run a job in a scratch directory on local or tmpfs storage.
+
+    On entering, the files of the current (job) directory are copied to a
+    new directory under scratch_root() and the working directory is changed
+    to it.  On leaving, the SCRATCH_ARTEFACTS and the restart files of the
+    engine (e.g. the Turbomole control and mos, ORCA's .gbw) are copied
+    back, also when the job failed part-way, so that a rerun in the job
+    directory can restart from them.  The scratch directory is removed if
+    the job succeeded, or kept for debugging if it failed.  Without
+    PYAR_SCRATCH the job runs in place.
+
+        with file_manager.JobScratch('xtb') as scratch:
+            ...
+            scratch.succeeded = status is True
+    """
+
+    def __init__(self, software, root=None):
+        self.software = software
+        self.root = root or scratch_root()
+        self.job_dir = None
+        self.directory = None
+        self.staged = {}
+        self.succeeded = False
+        from pyar.interface.registry import restart_files
+        self.artefacts = SCRATCH_ARTEFACTS + tuple(restart_files(software))
+
+    def __enter__(self):
+        if self.root is None:
+            return self
+        with profiling.span('scratch.stage_in'):
+            self.stage_in()
+        os.chdir(self.directory)
+        file_manager_logger.debug(f'Running in scratch directory {self.directory}')
+        return self
+
+    def stage_in(self):
+        import tempfile
+        self.job_dir = os.getcwd()
+        self.directory = tempfile.mkdtemp(prefix=f'pyar_{os.path.basename(self.job_dir)}_', dir=self.root)
+        for name in os.listdir(self.job_dir):
+            if os.path.isfile(name):
+                shutil.copy2(name, self.directory)
+        self.staged = file_states(self.directory)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.directory is None:
+            return False
+        os.chdir(self.job_dir)
+        with profiling.span('scratch.stage_out'):
+            for pattern in self.artefacts:
+                for name in glob.glob(os.path.join(self.directory, pattern)):
+                    if os.path.isfile(name):
+                        shutil.copy2(name, self.job_dir)
+        record_scratch_usage(self.software, output_size(self.directory, self.staged))
+        if self.succeeded and exc_type is None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        else:
+            file_manager_logger.info(f'      Scratch directory of the failed job kept: {self.directory}')
+        return False
+
+
 def main():
     pass
 
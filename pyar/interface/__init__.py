@@ -2,12 +2,31 @@ import os
 from pyar.mlatom.data import molecule  # noqa: F401
 
 
+_executables = {}
+
+
 def which(program):
-    import os
+    """
+    Full path of an executable, or None.
+
+    The environment variable PYAR_<PROGRAM>_EXE (e.g. PYAR_XTB_EXE)
+    overrides the search of PATH.  Results are cached, so that PATH is
+    scanned once per program and run; use clear_executable_cache() after
+    changing the environment.
+    """
+    if program not in _executables:
+        _executables[program] = find_executable(program)
+    return _executables[program]
 
+
+def find_executable(program):
     def is_exe(exec_path):
         return os.path.isfile(exec_path) and os.access(exec_path, os.X_OK)
 
+    override = os.environ.get(f"PYAR_{os.path.basename(program).upper().replace('-', '_')}_EXE")
+    if override:
+        return override if is_exe(override) else None
+
     file_path, file_name = os.path.split(program)
     if file_path:
         if is_exe(program):
@@ -21,6 +40,15 @@ def which(program):
     return None
 
 
+def executable(program):
+    """Command to start program with: its path from which, or the bare name"""
+    return which(program) or program
+
+
+def clear_executable_cache():
+    _executables.clear()
+
+
 # from pyar.interface.mlatom_aiqm1 import MlatomAiqm1
 
 class SF(object):
@@ -39,6 +67,13 @@ class SF(object):
                       molecule.coordinates, self.start_xyz_file,
                       job_name=self.job_name)
 
+    def keep_partial_geometry(self, coordinates, energy=0.0):
+        """
+        Write the last geometry of an optimization that ran out of cycles
+        over the start geometry, so that the next round continues from it.
+        """
+        write_xyz(self.atoms_list, coordinates, self.start_xyz_file, job_name=self.job_name, energy=energy)
+
 
 def write_xyz(atoms_list, coordinates, filename, job_name='no_name', energy=0.0):
     with open(filename, 'w') as fp:
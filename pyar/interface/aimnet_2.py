@@ -1,7 +1,7 @@
 import logging
 import pyar  # noqa: F401
 # from time import sleep
-from pyar.interface import SF, write_xyz, which  # noqa: F401
+from pyar.interface import SF, executable, write_xyz, which  # noqa: F401
 import os
 import subprocess as subp
 import numpy as np
@@ -50,7 +50,7 @@ class Aimnet2(SF):
         self.inp_min_file = 'trial_' + self.job_name + '_min.xyz'
         self.out_file = 'trial_' + self.job_name + '.out'
         
-        self.cmd = f"python {aimnet2_script} {model_path} --traj result.traj {self.inp_file} {self.inp_min_file}"
+        self.cmd = f"{executable('python')} {aimnet2_script} {model_path} --traj result.traj {self.inp_file} {self.inp_min_file}"
         if self.charge != 0:
             self.cmd = "{} -c {}".format(self.cmd, self.charge)
 
@@ -1,7 +1,7 @@
 import logging
 import pyar  # noqa: F401
 # from time import sleep
-from pyar.interface import SF, write_xyz, which  # noqa: F401
+from pyar.interface import SF, executable, write_xyz, which  # noqa: F401
 import os
 import subprocess as subp
 import numpy as np
@@ -34,7 +34,7 @@ class AIQM1(SF):
         self.inp_min_file = 'trial_' + self.job_name + '_min.xyz'
         self.out_file = 'trial_' + self.job_name + '.out'
         
-        self.cmd = f"python {aiqm1_opt}  {self.inp_file} -c {self.charge} -m {self.multiplicity}  {self.inp_min_file}"
+        self.cmd = f"{executable('python')} {aiqm1_opt}  {self.inp_file} -c {self.charge} -m {self.multiplicity}  {self.inp_min_file}"
         if self.charge != 0:
             self.cmd = "{} -c {}".format(self.cmd, self.charge)
 
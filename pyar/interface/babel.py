@@ -23,7 +23,7 @@ import sys
 
 import numpy as np
 
-from pyar.interface import SF, which
+from pyar.interface import SF, executable, which
 
 
 class OBabel(SF):
@@ -47,7 +47,7 @@ class OBabel(SF):
 
         with open('tmp.log', 'w') as logfile, open('tmp.xyz', 'w') as xyzfile:
             try:
-                subp.check_call(["obminimize", "-ff", "uff", '-n',
+                subp.check_call([executable("obminimize"), "-ff", "uff", '-n',
                                  max_cycles, self.start_xyz_file],
                                 stdout=xyzfile, stderr=logfile)
             except subp.CalledProcessError as e:
@@ -70,7 +70,7 @@ class OBabel(SF):
         """
         """
         with open(self.job_name + '.ene', 'w') as energy_file:
-            out = subp.Popen(["obenergy", "-ff", "uff", self.result_xyz_file], stdout=energy_file, stderr=energy_file)
+            out = subp.Popen([executable("obenergy"), "-ff", "uff", self.result_xyz_file], stdout=energy_file, stderr=energy_file)
         output, error = out.communicate()
         poll = out.poll()
         exit_status = out.returncode
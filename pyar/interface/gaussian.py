@@ -18,12 +18,11 @@ GNU General Public License for more details.
 """
 
 import os
-import subprocess as subp
 
 import numpy as np
 
 from pyar import interface
-from pyar.interface import SF
+from pyar.interface import SF, runner
 
 
 class Gaussian(SF):
@@ -39,7 +38,7 @@ class Gaussian(SF):
         basis = qc_params['basis']
         if basis.lower() == 'def2-svp':
             basis = 'def2SVP'
-        self.keyword = f"%nprocshared={qc_params['nprocs']}3\n" \
+        self.keyword = f"%nprocshared={qc_params['nprocs']}\n" \
                        f"%chk=trial_{self.job_name}.chk\n" \
                        f"%mem=2GB\n" \
                        f"# {qc_params['method']} {basis} " \
@@ -61,7 +60,6 @@ class Gaussian(SF):
         :return:This object will return the optimization status. It will
         optimize a structure.
         """
-        # TODO: Add a return 'CycleExceeded'
         logfile = "trial_{}.out".format(self.job_name)
 
         # max_opt_cycles = options['opt_cycles']
@@ -71,35 +69,33 @@ class Gaussian(SF):
         # if convergence != 'normal':
         #     opt_keywords += f", {convergence}"
         # self.keyword += f" opt=({opt_keywords})"
-        self.prepare_input()
-        with open(self.out_file, 'w') as fopt:
-            out = subp.Popen(["g16", self.inp_file], stdout=fopt, stderr=fopt)
-        out.communicate()
-        out.poll()
-        exit_status = out.returncode
-        if exit_status == 0:
-            file_pointer = open(self.out_file, "r")
-            this_line = file_pointer.readlines()
-            check_1 = 0
-            check_2 = 0
-
-            for j in this_line:
-                if "Optimization completed" in j:
-                    check_1 = 1
-                if "SCF Done" in j:
-                    check_2 = 1
-
-            if ("Normal termination" in this_line[-1]) and check_1 == 1 and check_2 == 1:
-                self.energy = self.get_energy()
-                self.optimized_coordinates = self.get_coords()
-                interface.write_xyz(self.atoms_list, self.optimized_coordinates, self.result_xyz_file, self.job_name,
-                                    energy=self.energy)
-                file_pointer.close()
-                return True
-            else:
-                print("Error: OPTIMIZATION PROBABLY FAILED.")
-                print("Location: {}".format(os.getcwd()))
-                return False
+        default_keyword = self.keyword
+
+        def quadratic_convergence():
+            self.keyword = default_keyword.replace("SCF=(MaxCycle=", "SCF=(XQC,MaxCycle=")
+            self.prepare_input()
+
+        return runner.run_with_fallbacks(
+            [('default settings', [interface.executable("g16"), self.inp_file], self.prepare_input),
+             ('SCF=XQC', [interface.executable("g16"), self.inp_file], quadratic_convergence)],
+            self.out_file, self.status)
+
+    def status(self, result):
+        """Optimization status of a Gaussian run"""
+        status = runner.classify(result, self.out_file,
+                                 success=lambda text: "Normal termination" in text.rstrip().split("\n")[-1]
+                                 and "Optimization completed" in text and "SCF Done" in text,
+                                 cycle_exceeded=["Number of steps exceeded"],
+                                 scf_failure=["Convergence failure -- run terminated."])
+        if status is True:
+            self.energy = self.get_energy()
+            self.optimized_coordinates = self.get_coords()
+            interface.write_xyz(self.atoms_list, self.optimized_coordinates, self.result_xyz_file, self.job_name,
+                                energy=self.energy)
+        else:
+            print(f"Error: OPTIMIZATION PROBABLY FAILED ({status}).")
+            print("Location: {}".format(os.getcwd()))
+        return status
 
     def get_coords(self):
         """
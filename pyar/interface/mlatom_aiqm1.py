@@ -1,6 +1,7 @@
 import logging  # noqa: F401
 import pyar.mlatom as ml
-from time import sleep  # noqa: F401
+from collections import namedtuple
+from time import sleep, time
 from pyar.mlatom.data import molecule  # noqa: F401 
 import numpy as np
 from pyar import interface
@@ -11,6 +12,37 @@ import sys  # noqa: F401
 
 mlatom_logger = logging.getLogger('pyar.mlatom')
 
+GaussianTermination = namedtuple('GaussianTermination', ['status', 'log_file', 'last_line', 'waited'])
+
+
+def wait_for_termination(log_file, timeout=90.0, poll_interval=0.2):
+    """
+    Wait until Gaussian writes its termination line to the log file.
+
+    :param log_file: Gaussian log file
+    :param timeout: maximum waiting time in seconds
+    :param poll_interval: time in seconds between checks of the log file
+    :return: GaussianTermination with status 'normal', 'error', 'timeout'
+             or 'missing' (no log file was written before the timeout)
+    """
+    start = time()
+    last_line = ''
+    while True:
+        if os.path.isfile(log_file):
+            with open(log_file) as fp:
+                lines = [line for line in fp.readlines() if line.strip()]
+            if lines:
+                last_line = lines[-1].strip()
+            if 'Normal termination' in last_line:
+                return GaussianTermination('normal', log_file, last_line, time() - start)
+            if 'Error termination' in last_line:
+                return GaussianTermination('error', log_file, last_line, time() - start)
+        waited = time() - start
+        if waited >= timeout:
+            status = 'timeout' if os.path.isfile(log_file) else 'missing'
+            return GaussianTermination(status, log_file, last_line, waited)
+        sleep(poll_interval)
+
 
 class MlatomAiqm1(SF):
     def __init__(self, molecule, qc_params=None):  # noqa: F811
@@ -25,6 +57,11 @@ class MlatomAiqm1(SF):
 
         self.inp_file = 'trial_' + self.job_name + '.xyz'
         # self.out_file = 'trial_' + self.job_name + '.log'
+        self.out_file = 'gaussian.log'
+        self.termination_timeout = 90.0
+        if qc_params is not None:
+            self.termination_timeout = qc_params.get('termination_timeout', self.termination_timeout)
+        self.termination = None
 
         self.aiqm1 = ml.models.methods(method='AIQM1')
 
@@ -53,15 +90,19 @@ class MlatomAiqm1(SF):
             # future = ml.optimize_geometry(model=self.aiqm1, initial_molecule=initial_molecule)
             # self.optimized_molecule = future.result().optimized_molecule
             self.optimized_molecule =  ml.optimize_geometry(model=self.aiqm1, initial_molecule=initial_molecule).optimized_molecule
-            sleep(90)
-    
-            self.out_file = 'gaussian.log'
-            
+            self.termination = wait_for_termination(self.out_file, timeout=self.termination_timeout)
+            mlatom_logger.debug("Gaussian termination: {} after {:.1f} s".format(self.termination.status,
+                                                                                self.termination.waited))
+
             # Check if the file exists
-            if not os.path.isfile(self.out_file):
+            if self.termination.status == 'missing':
                 mlatom_logger.info("Error: File does not exist.")
                 return None
-    
+            if self.termination.status == 'timeout':
+                mlatom_logger.info("Error: Gaussian did not terminate within {} s".format(self.termination_timeout))
+                mlatom_logger.info("Location: {}".format(os.getcwd()))
+                return None
+
             file_pointer = open(self.out_file, "r")
             this_line = file_pointer.readlines()
             check_1 = 0 
@@ -25,7 +25,7 @@ import sys
 import numpy as np
 
 from pyar import interface
-from pyar.interface import SF, which
+from pyar.interface import SF, executable, runner, which
 
 
 class Mopac(SF):
@@ -47,6 +47,8 @@ class Mopac(SF):
         self.optimized_coordinates = []
         self.energy = 0.0
         keyword = f'PM7 PRECISE LET DDMIN=0.0 CYCLES=10000 charge={molecule.charge}'
+        if qc_params.get('nprocs'):
+            keyword += f" THREADS={qc_params['nprocs']}"
         self.prepare_input(keyword=keyword)
 
     def prepare_input(self, keyword=""):
@@ -60,7 +62,7 @@ class Mopac(SF):
         """
         keyword_line = '-xkPM7' if not keyword else '-xk' + keyword
         with open(self.inp_file, 'w') as fminp, open('tmp.log', 'w') as ferr:
-            out = subp.Popen(["obabel", "-ixyz", self.start_xyz_file, "-omop", keyword_line],
+            out = subp.Popen([executable("obabel"), "-ixyz", self.start_xyz_file, "-omop", keyword_line],
                              stdout=fminp, stderr=ferr)
             output, error = out.communicate()
         exit_status = out.returncode
@@ -76,23 +78,27 @@ class Mopac(SF):
         # TODO: Add a return 'CycleExceeded'
 
         logfile = "trial_{}.log".format(self.job_name)
-        with open(logfile, 'w') as fopt:
-            out = subp.Popen(["mopac", self.inp_file], stdout=fopt, stderr=fopt)
-        out.communicate()
-        out.poll()
-        exit_status = out.returncode
-        if exit_status == 0:
-            if os.path.exists(self.arc_file):
-                self.energy = self.get_energy()
-                self.optimized_coordinates = self.get_coords()
-                interface.write_xyz(self.atoms_list, self.optimized_coordinates, self.result_xyz_file,
-                                    self.job_name, energy=self.energy)
-                return True
-            else:
-                print("Error: File ", self.arc_file, "was not found.")
-                print("Check for partial optimization.")
-                print("Location: {}".format(os.getcwd()))
-                return False
+        return runner.run_with_fallbacks([('default settings', [executable("mopac"), self.inp_file], None)],
+                                         logfile, self.status)
+
+    def status(self, result):
+        """Optimization status of a MOPAC run"""
+        if result.timed_out:
+            return 'Timeout'
+        if result.returncode != 0:
+            print("Error: MOPAC exited with {} in {}".format(result.returncode, os.getcwd()))
+            return 'Crashed'
+        if os.path.exists(self.arc_file):
+            self.energy = self.get_energy()
+            self.optimized_coordinates = self.get_coords()
+            interface.write_xyz(self.atoms_list, self.optimized_coordinates, self.result_xyz_file,
+                                self.job_name, energy=self.energy)
+            return True
+        else:
+            print("Error: File ", self.arc_file, "was not found.")
+            print("Check for partial optimization.")
+            print("Location: {}".format(os.getcwd()))
+            return False
 
     def get_energy(self):
         """
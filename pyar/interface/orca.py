@@ -19,11 +19,10 @@ GNU General Public License for more details.
 
 import logging
 import os
-import subprocess as subp
 
 import numpy as np
 
-from pyar.interface import SF, write_xyz, which
+from pyar.interface import SF, executable, runner, write_xyz
 
 orca_logger = logging.getLogger('pyar.orca')
 
@@ -33,6 +32,7 @@ class Orca(SF):
 
         super(Orca, self).__init__(molecule)
 
+        self.molecule = molecule
         self.start_coords = molecule.coordinates
         self.inp_file = 'trial_' + self.job_name + '.inp'
         self.out_file = 'trial_' + self.job_name + '.out'
@@ -69,38 +69,47 @@ class Orca(SF):
         :return:This object will return the optimization status. It will
         optimize a structure.
         """
-        # TODO: Add a return 'CycleExceeded'
-
         # max_cycles = options['opt_cycles']  # noqa: F841
         # gamma = options['gamma']  # noqa: F841
         # convergence = options['opt_threshold']  # noqa: F841
 
         self.keyword = self.keyword + '!Opt'
-        self.prepare_input()
-
-        with open(self.out_file, 'w') as fopt:
-            out = subp.Popen([which("orca"), self.inp_file], stdout=fopt, stderr=fopt)
-        out.communicate()
-        out.poll()
-        exit_status = out.returncode
-        if exit_status == 0:
-            f = open(self.out_file, "r")
-            line = f.readlines()
-            if "****ORCA TERMINATED NORMALLY****" in line[-2]:
-                self.energy = self.get_energy()
-                self.optimized_coordinates = np.loadtxt(self.inp_file[:-4] + ".xyz", dtype=float, skiprows=2,
-                                                        usecols=(1, 2, 3))
-                write_xyz(self.atoms_list,
-                          self.optimized_coordinates,
-                          self.result_xyz_file, energy=self.energy)
-                f.close()
-                return True
-            else:
-                print("Error: OPTIMIZATION PROBABLY FAILED. "
-                      "CHECK THE .out FILE FOR PARTIAL OPTIMIZTION ")
-                print("Check for partial optimization.")
-                print("Location: {}".format(os.getcwd()))
-                return False
+        default_keyword = self.keyword
+
+        def slow_convergence():
+            self.keyword = default_keyword + '\n! SlowConv PModel'
+            self.prepare_input()
+
+        return runner.run_with_fallbacks(
+            [('default settings', [executable("orca"), self.inp_file], self.prepare_input),
+             ('SlowConv and the PModel guess', [executable("orca"), self.inp_file], slow_convergence)],
+            self.out_file, self.status)
+
+    def status(self, result):
+        """Optimization status of an ORCA run"""
+        status = runner.classify(result, self.out_file,
+                                 success=lambda text: "****ORCA TERMINATED NORMALLY****" in text,
+                                 cycle_exceeded=["The optimization did not converge"],
+                                 scf_failure=["SCF NOT CONVERGED"])
+        if status is True:
+            self.energy = self.get_energy()
+            self.optimized_coordinates = np.loadtxt(self.inp_file[:-4] + ".xyz", dtype=float, skiprows=2,
+                                                    usecols=(1, 2, 3))
+            write_xyz(self.atoms_list,
+                      self.optimized_coordinates,
+                      self.result_xyz_file, energy=self.energy)
+        elif status == 'CycleExceeded':
+            self.energy = self.get_energy()
+            # ORCA keeps the last geometry in <basename>.xyz; the next round starts from it
+            last_geometry = self.inp_file[:-4] + ".xyz"
+            if os.path.isfile(last_geometry):
+                self.optimized_coordinates = np.loadtxt(last_geometry, dtype=float, skiprows=2, usecols=(1, 2, 3))
+                self.keep_partial_geometry(self.optimized_coordinates, self.energy)
+                self.molecule.coordinates = self.optimized_coordinates
+        else:
+            orca_logger.info(f"      ORCA optimization failed ({status}); "
+                             f"check {self.out_file} in {os.getcwd()}")
+        return status
 
     def get_energy(self):
         """
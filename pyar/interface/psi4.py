@@ -17,11 +17,10 @@ GNU General Public License for more details.
 """
 
 import os
-import subprocess as subp
 
 import numpy as np
 
-from pyar.interface import SF, write_xyz
+from pyar.interface import SF, executable, runner, write_xyz
 
 
 class Psi4(SF):
@@ -62,30 +61,28 @@ class Psi4(SF):
         :return:This object will return the optimization status. It will
         optimize a structure.
         """
-        # TODO: Add a return 'CycleExceeded'
-
-        with open(self.out_file, 'w') as fopt:
-            out = subp.Popen(["psi4", self.inp_file], stdout=fopt, stderr=fopt)
-        out.communicate()
-        out.poll()
-        exit_status = out.returncode
-        if exit_status == 0:
-            f = open(self.out_file, "r")
-            if "  **** Optimization is complete!" in f.read():
-                print("Optimized")
-                self.energy = self.get_energy()
-                self.optimized_coordinates = self.get_coordinates()
-                write_xyz(self.atoms_list,
-                          self.optimized_coordinates,
-                          self.result_xyz_file, energy=self.energy)
-                f.close()
-                return True
-            else:
-                print("Error: OPTIMIZATION PROBABLY FAILED. "
-                      "CHECK THE .out FILE FOR PARTIAL OPTIMIZTION ")
-                print("Check for partial optimization.")
-                print("Location: {}".format(os.getcwd()))
-                return False
+        return runner.run_with_fallbacks([('default settings', [executable("psi4"), self.inp_file], None)],
+                                         self.out_file, self.status)
+
+    def status(self, result):
+        """Optimization status of a Psi4 run"""
+        status = runner.classify(result, self.out_file,
+                                 success=lambda text: "  **** Optimization is complete!" in text,
+                                 cycle_exceeded=["Could not converge geometry optimization"],
+                                 scf_failure=["Could not converge SCF iterations"])
+        if status is True:
+            print("Optimized")
+            self.energy = self.get_energy()
+            self.optimized_coordinates = self.get_coordinates()
+            write_xyz(self.atoms_list,
+                      self.optimized_coordinates,
+                      self.result_xyz_file, energy=self.energy)
+        else:
+            print("Error: OPTIMIZATION PROBABLY FAILED. "
+                  "CHECK THE .out FILE FOR PARTIAL OPTIMIZTION ")
+            print("Check for partial optimization.")
+            print("Location: {}".format(os.getcwd()))
+        return status
 
     def get_energy(self):
         """
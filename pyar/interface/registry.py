@@ -0,0 +1,181 @@
+"""
+Registry of the quantum chemistry and machine learning engines.
+
+Every software name accepted by pyar-cli --software is described by an
+EngineSpec: the interface class that runs it, the executables it needs,
+how to ask for its version and what it can do.  The optimisers create the
+interface objects through make_geometry, and the command line checks the
+engine with check_engine before any job is started, so that a missing
+program is reported at once rather than hours into a run.
+
+Executables are resolved through pyar.interface.which, which caches them
+and honours PYAR_<PROGRAM>_EXE overrides; the interfaces start the programs
+through pyar.interface.executable, so that an override need not be on PATH.
+"""
+import logging
+import os
+import subprocess as subp
+from collections import namedtuple
+from importlib import import_module
+
+from pyar.interface import which
+
+registry_logger = logging.getLogger('pyar.registry')
+
+EngineSpec = namedtuple('EngineSpec', ['module', 'class_name', 'executables', 'version_command',
+                                       'gradient_only', 'native_optimizer', 'batching', 'threaded',
+                                       'restart_files'], defaults=((),))
+EngineSpec.__doc__ = """
+module, class_name: interface class in pyar.interface
+executables: programs that must be on PATH, or given by PYAR_<PROGRAM>_EXE
+version_command: command printing the version, or None
+gradient_only: the engine only gives energies and gradients; pyar or ASE optimises
+native_optimizer: the program optimises the geometry itself
+batching: many geometries can be evaluated in one call
+threaded: a job uses qc_params['nprocs'] threads
+restart_files: patterns of the files, besides the results, a later job can restart from
+"""
+
+# The input and orbitals of a Turbomole job, enough to restart it
+TURBOMOLE_FILES = ('control', 'coord', 'basis', 'auxbasis', 'mos', 'alpha', 'beta', 'gradient')
+
+ENGINES = {
+    'mlatom_aiqm1': EngineSpec('mlatom_aiqm1', 'MlatomAiqm1', (), None, False, True, False, True, ('*.chk',)),
+    'gaussian': EngineSpec('gaussian', 'Gaussian', ('g16',), None, False, True, False, True, ('*.chk',)),
+    'orca': EngineSpec('orca', 'Orca', ('orca',), None, False, True, False, True, ('*.gbw',)),
+    'orca-aiqm1': EngineSpec('orca_aiqm1', 'OrcaAIQM1', ('orca',), None, False, True, False, True, ('*.gbw',)),
+    'xtb': EngineSpec('xtb', 'Xtb', ('xtb',), ('xtb', '--version'), False, True, False, True, ('xtbrestart',)),
+    'xtb_turbo': EngineSpec('xtbturbo', 'XtbTurbo', ('xtb', 'define'), ('xtb', '--version'),
+                            True, False, False, True, TURBOMOLE_FILES + ('xtbrestart',)),
+    'turbomole': EngineSpec('turbomole', 'Turbomole', ('define', 'jobex', 'ridft'), None, False, True, False, True,
+                            TURBOMOLE_FILES),
+    'psi4': EngineSpec('psi4', 'Psi4', ('psi4',), ('psi4', '--version'), False, True, False, False),
+    'mopac': EngineSpec('mopac', 'Mopac', ('mopac', 'obabel'), None, False, True, False, True),
+    'aimnet_2': EngineSpec('aimnet_2', 'Aimnet2', ('python',), None, True, False, True, True),
+    'aiqm1_mlatom': EngineSpec('aiqm1_mlatom', 'AIQM1', ('python',), None, True, False, True, True),
+    'xtb-aimnet2': EngineSpec('xtb_aimnet2', 'XtbAimnet2', ('xtb', 'python'), ('xtb', '--version'),
+                              False, True, False, True),
+    'xtb-aiqm1': EngineSpec('xtb_aiqm1', 'XtbAIQM1', ('xtb', 'python'), ('xtb', '--version'),
+                            False, True, False, True),
+    'obabel': EngineSpec('babel', 'OBabel', ('obabel',), ('obabel', '-V'), False, True, False, False),
+}
+
+_versions = {}
+
+
+class EngineNotAvailable(Exception):
+    pass
+
+
+def get_spec(software):
+    try:
+        return ENGINES[software]
+    except KeyError:
+        raise EngineNotAvailable(f"Unknown software: {software}. "
+                                 f"Known engines are {', '.join(sorted(ENGINES))}")
+
+
+def restart_files(software):
+    """Patterns of the restart files of the engine; none for unknown software"""
+    return ENGINES[software].restart_files if software in ENGINES else ()
+
+
+def missing_executables(software):
+    return [program for program in get_spec(software).executables if which(program) is None]
+
+
+def mlatom_gaussian():
+    """
+    The Gaussian executable the bundled MLatom optimises with, found as in
+    pyar.mlatom.interfaces.gaussian_interface.check_gaussian: g16 or g09 in
+    $GAUSS_EXEDIR.  None if $GAUSS_EXEDIR is not set, in which case MLatom
+    falls back to ASE and writes no gaussian.log for MlatomAiqm1 to read.
+    """
+    gauss_exedir = os.environ.get('GAUSS_EXEDIR', '')
+    if not gauss_exedir:
+        return None
+    root = gauss_exedir.split('bsd')[0]
+    for version in ('g16', 'g09'):
+        if version in root:
+            return root + version
+    return None
+
+
+def version(software, timeout=10):
+    """First line of the version output of the engine, cached; None if unknown"""
+    spec = get_spec(software)
+    if spec.version_command is None:
+        return None
+    if software not in _versions:
+        program, *arguments = spec.version_command
+        executable = which(program)
+        line = None
+        if executable is not None:
+            try:
+                out = subp.run([executable, *arguments], stdout=subp.PIPE, stderr=subp.STDOUT,
+                               timeout=timeout, universal_newlines=True).stdout
+                lines = [each for each in out.splitlines() if 'version' in each.lower()] or out.splitlines()
+                line = lines[0].strip() if lines else None
+            except (OSError, subp.SubprocessError) as e:
+                registry_logger.debug(f"Could not get the version of {software}: {e}")
+        _versions[software] = line
+    return _versions[software]
+
+
+def in_process(software, qc_params=None):
+    """True if the engine will run in process, without its executables"""
+    if software == 'xtb' and (qc_params or {}).get('xtb_driver') in ('auto', 'library'):
+        from pyar.engines import xtb_library
+        return xtb_library() is not None
+    return False
+
+
+def check_engine(software, qc_params=None):
+    """
+    Make sure that the engine can run.
+
+    :raises EngineNotAvailable: for unknown software or missing executables
+    :return: the EngineSpec
+    """
+    spec = get_spec(software)
+    if software == 'mlatom_aiqm1' and mlatom_gaussian() is None:
+        raise EngineNotAvailable(f"{software} optimises with Gaussian through MLatom. "
+                                 f"Set GAUSS_EXEDIR to the g16 or g09 directory.")
+    missing = [] if in_process(software, qc_params) else missing_executables(software)
+    if missing:
+        raise EngineNotAvailable(f"{software} needs {', '.join(missing)}, which could not be found. "
+                                 f"Add it to PATH or set PYAR_<PROGRAM>_EXE.")
+    registry_logger.info(f"Engine: {software} {version(software) or ''}".rstrip())
+    return spec
+
+
+def threads_per_job(software, qc_params):
+    """Number of threads one job of the engine uses"""
+    if software in ENGINES and ENGINES[software].threaded:
+        return int(qc_params.get('nprocs') or 1)
+    return 1
+
+
+def concurrent_jobs(software, qc_params, cpu_count=None):
+    """How many jobs of the engine fit on this machine at the same time"""
+    cpu_count = cpu_count or os.cpu_count() or 1
+    return max(1, cpu_count // threads_per_job(software, qc_params))
+
+
+def interface_class(software):
+    spec = get_spec(software)
+    return getattr(import_module(f'pyar.interface.{spec.module}'), spec.class_name)
+
+
+def make_geometry(molecule, qc_params):
+    """The interface object that optimises molecule with qc_params['software']"""
+    software = qc_params['software']
+    gamma = qc_params.get('gamma', None)
+    if software == 'xtb_turbo' and gamma == 0.0:
+        software = 'xtb'
+    if software == 'obabel':
+        return interface_class(software)(molecule)
+    geometry = interface_class(software)(molecule, qc_params)
+    if software == 'orca-aiqm1' and gamma is not None:
+        geometry.set_gamma(gamma)
+    return geometry
@@ -0,0 +1,148 @@
+"""
+Run the external QC programs with a wall-clock timeout and a memory limit.
+
+Every program is started in its own process group, so that on timeout the
+program and everything it spawned (mpirun, the ORCA modules, ...) are
+killed together.  The outcome is classified as one of the optimisation
+statuses of the interfaces (True, 'CycleExceeded', 'SCFFailed', 'Crashed',
+'Timeout' or False) and, on failure, the job can be retried with fallback
+settings such as a looser threshold or a different initial guess.
+
+The limits default to the environment variables PYAR_JOB_TIMEOUT (seconds)
+and PYAR_JOB_MEMORY (MB), which pyar-cli sets from --job-timeout and
+--job-memory.
+"""
+import logging
+import os
+import signal
+import subprocess as subp
+import time
+from collections import namedtuple
+
+from pyar import profiling
+
+runner_logger = logging.getLogger('pyar.runner')
+
+RunResult = namedtuple('RunResult', ['returncode', 'timed_out', 'elapsed'])
+
+# Statuses after which a job is tried again with the next fallback
+RETRY_ON = ('SCFFailed', 'Crashed')
+
+
+def job_limits():
+    """Timeout in seconds and memory limit in MB from the environment; None if not set"""
+    timeout = os.environ.get('PYAR_JOB_TIMEOUT')
+    memory = os.environ.get('PYAR_JOB_MEMORY')
+    return (float(timeout) if timeout else None), (int(memory) if memory else None)
+
+
+def _limit_memory(memory_limit):
+    def set_limit():
+        import resource
+        limit = memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    return set_limit
+
+
+def kill_group(process, grace=5.0):
+    """Terminate the process group of process, killing it if it does not stop within grace seconds"""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            process.wait(timeout=grace)
+            return
+        except subp.TimeoutExpired:
+            continue
+
+
+def run(command, output_file, stdin_file=None, timeout=None, memory_limit=None):
+    """
+    Run command with its stdout and stderr written to output_file.
+
+    :param command: list of arguments
+    :param stdin_file: file to use as stdin
+    :param timeout: wall-clock limit in seconds; PYAR_JOB_TIMEOUT if None
+    :param memory_limit: address space limit in MB; PYAR_JOB_MEMORY if None
+    :return: RunResult
+    """
+    default_timeout, default_memory = job_limits()
+    timeout = default_timeout if timeout is None else timeout
+    memory_limit = default_memory if memory_limit is None else memory_limit
+    start = time.time()
+    stdin = open(stdin_file) if stdin_file else subp.DEVNULL
+    try:
+        with open(output_file, 'w') as output:
+            try:
+                process = subp.Popen(command, stdin=stdin, stdout=output, stderr=subp.STDOUT,
+                                     start_new_session=True,
+                                     preexec_fn=_limit_memory(memory_limit) if memory_limit else None)
+            except OSError as e:
+                runner_logger.error(f'      Could not start {command[0]}: {e}')
+                return RunResult(None, False, 0.0)
+            try:
+                returncode = process.wait(timeout=timeout)
+                timed_out = False
+            except subp.TimeoutExpired:
+                runner_logger.info(f'      {command[0]} exceeded {timeout:.0f} s in {os.getcwd()}; killed')
+                kill_group(process)
+                returncode = process.returncode
+                timed_out = True
+    finally:
+        if stdin_file:
+            stdin.close()
+    return RunResult(returncode, timed_out, time.time() - start)
+
+
+def classify(result, output_file, success, cycle_exceeded=(), scf_failure=()):
+    """
+    Optimisation status from the result of run and the output.
+
+    :param success: function(output text) returning True if the job finished normally
+    :param cycle_exceeded: texts in the output meaning that the optimisation ran out of cycles
+    :param scf_failure: texts in the output meaning that the SCF did not converge
+    :return: True, 'CycleExceeded', 'SCFFailed', 'Crashed' or 'Timeout'
+    """
+    if result.timed_out:
+        return 'Timeout'
+    try:
+        with open(output_file, errors='replace') as fp:
+            text = fp.read()
+    except OSError:
+        text = ''
+    if any(marker in text for marker in scf_failure):
+        return 'SCFFailed'
+    if any(marker in text for marker in cycle_exceeded):
+        return 'CycleExceeded'
+    if result.returncode != 0:
+        return 'Crashed'
+    if success(text):
+        return True
+    return False
+
+
+def run_with_fallbacks(attempts, output_file, status_of, retry_on=RETRY_ON, timeout=None, memory_limit=None):
+    """
+    Run the attempts in turn until one does not fail with a status in retry_on.
+
+    :param attempts: list of (description, command, prepare); prepare is
+        None or a function that writes the input of the attempt
+    :param status_of: function(RunResult) returning the status, usually via classify
+    :return: status of the last attempt
+    """
+    status = False
+    for i, (description, command, prepare) in enumerate(attempts):
+        if i:
+            runner_logger.info(f'      {status}: retrying with {description} in {os.getcwd()}')
+        if prepare is not None:
+            prepare()
+        with profiling.span(f'runner.{os.path.basename(command[0])}', attempt=i):
+            result = run(command, output_file, timeout=timeout, memory_limit=memory_limit)
+        with profiling.span('runner.parse'):
+            status = status_of(result)
+        if status is True or status not in retry_on:
+            break
+    return status
@@ -241,7 +241,7 @@ class Turbomole(SF):
         """
         with open('jobex.out', 'w') as fj:
             try:
-                subp.check_call(['jobex', '-ri', '-c', str(max_cycles)], stdout=fj,
+                subp.check_call([interface.executable('jobex'), '-ri', '-c', str(max_cycles)], stdout=fj,
                                 stderr=fj)
             except subp.CalledProcessError as e:
                 turbomole_logger.debug('jobex failed, check %s/jobex.out'
@@ -302,7 +302,7 @@ def run_single_point():
 
     with open('ridft.out', 'w') as fj:
         try:
-            subp.check_call(['ridft'], stdout=fj, stderr=fj)
+            subp.check_call([interface.executable('ridft')], stdout=fj, stderr=fj)
         except subp.CalledProcessError as e:
             turbomole_logger.debug('rdift failed, check %s/rdift.out'
                                    % os.getcwd())
@@ -447,7 +447,7 @@ def prepare_control(basis="def2-SVP", func="b-p", ri="on",
 
         with open(define_log_file, 'w') as fout, open('define.inp') as fin:
             try:
-                subp.check_call(['define'], stdin=fin, stdout=fout,
+                subp.check_call([interface.executable('define')], stdin=fin, stdout=fout,
                                 stderr=fout, universal_newlines=False)
             except subp.CalledProcessError as e:
                 turbomole_logger.debug('Error in define')
@@ -525,7 +525,7 @@ def generate_internal_coordinates():
 
         with open(define_log_file, 'w') as fout, open(define_input_file) as fin:
             try:
-                subp.check_call(['define'], stdin=fin, stdout=fout,
+                subp.check_call([interface.executable('define')], stdin=fin, stdout=fout,
                                 stderr=fout, universal_newlines=False)
             except subp.CalledProcessError as e:
                 if e.output:
@@ -646,7 +646,7 @@ def run_turbomole_module(module):
     output_file = module + '.out'
     with open(output_file, 'w') as fc:
         try:
-            subp.check_call([module], stdout=fc, stderr=fc)
+            subp.check_call([interface.executable(module)], stdout=fc, stderr=fc)
         except subp.CalledProcessError as e:
             time.sleep(1)
             turbomole_logger.info('Error in %s' % module)
@@ -666,7 +666,7 @@ def check_geometry_convergence():
 
     with open('convgrep.out', 'w') as fc:
         try:
-            subp.check_call(['convgrep'], stdout=fc, stderr=fc)
+            subp.check_call([interface.executable('convgrep')], stdout=fc, stderr=fc)
         except subp.CalledProcessError as e:
             fc.write(e.output)
             turbomole_logger.error('Convgrep failed')
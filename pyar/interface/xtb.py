@@ -19,12 +19,11 @@ GNU General Public License for more details.
 """
 import logging
 import os
-import subprocess as subp
 import sys
 
 import numpy as np
 
-from pyar.interface import SF, which, write_xyz
+from pyar.interface import SF, executable, runner, which, write_xyz
 
 xtb_logger = logging.getLogger('pyar.xtb')
 
@@ -32,13 +31,25 @@ xtb_logger = logging.getLogger('pyar.xtb')
 class Xtb(SF):
 
     def __init__(self, molecule, method):
-        if which('xtb') is None:
+        self.engine = None
+        if method.get('xtb_driver') in ('auto', 'library'):
+            from pyar.engines import get_engine
+            self.engine = get_engine(dict(method, software='xtb'), molecule.charge, molecule.multiplicity)
+            if self.engine is None and method.get('xtb_driver') == 'library':
+                xtb_logger.error('xtb driver library requires tblite or xtb-python')
+                sys.exit()
+        if self.engine is None and which('xtb') is None:
             xtb_logger.error('set XTB path')
             sys.exit()
 
         super(Xtb, self).__init__(molecule)
+        self.molecule = molecule
+        self.start_coordinates = molecule.coordinates
+        self.opt_threshold = method.get('opt_threshold') or 'normal'
+        self._energy = None
+        self._optimized_coordinates = None
 
-        self.cmd = f"xtb {self.start_xyz_file} -opt {method['opt_threshold']}"
+        self.cmd = f"{executable('xtb')} {self.start_xyz_file} -opt {method['opt_threshold']}"
 
         if self.charge != 0:
             self.cmd = "{} -chrg {}".format(self.cmd, self.charge)
@@ -56,19 +67,23 @@ class Xtb(SF):
                   'GradFailed',
                   'UpdateFailed',
                   'CycleExceeded',
+                  'Crashed',
+                  'Timeout',
                   False
         """
         if gamma is not None:
             xtb_logger.error('not implemented in this module. Use xtb_turbo')
 
-        with open('xtb.out', 'w') as output_file_pointer:
-            try:
-                out = subp.check_call(self.cmd.split(), stdout=output_file_pointer, stderr=output_file_pointer)  # noqa: F841
-            except Exception as e:
-                xtb_logger.info('    Optimization failed')
-                xtb_logger.error(f"      {e}")
-                return False
+        if self.engine is not None:
+            return self.optimize_in_memory(max_cycles)
 
+        return runner.run_with_fallbacks(
+            [('default settings', self.cmd.split(), None),
+             ('electronic temperature 1000 K', self.cmd.split() + ['--etemp', '1000'], None)],
+            'xtb.out', self.status)
+
+    def status(self, result):
+        """Optimization status of an xtb run"""
         if os.path.isfile('.xtboptok'):
 
             write_xyz(self.atoms_list, self.optimized_coordinates, self.result_xyz_file,
@@ -77,20 +92,63 @@ class Xtb(SF):
             os.rename('xtbopt.log', self.trajectory_xyz_file)
             os.remove('.xtboptok')
             return True
+        elif result.timed_out:
+            return 'Timeout'
         elif os.path.isfile('.sccnotconverged') or os.path.isfile('NOT_CONVERGED'):
             xtb_logger.info('      SCF Convergence failure in {} run in {}'.format(self.start_xyz_file, os.getcwd()))
+            for marker in ('.sccnotconverged', 'NOT_CONVERGED'):
+                if os.path.isfile(marker):
+                    os.remove(marker)
             return 'SCFFailed'
+        elif result.returncode != 0:
+            xtb_logger.info('    Optimization failed')
+            xtb_logger.error(f"      xtb exited with {result.returncode} in {os.getcwd()}")
+            return 'Crashed'
         else:
             xtb_logger.info('      Something went wrong with {} run in {}'.format(self.start_xyz_file, os.getcwd()))
             return False
 
+    def optimize_in_memory(self, max_cycles=350):
+        """
+        Optimize with the xtb library loaded in this process; only the
+        result file is written.
+        """
+        from pyar.engines import optimise_with_engine, xtb_convergence_thresholds
+        energy_threshold, gradient_threshold = xtb_convergence_thresholds.get(self.opt_threshold,
+                                                                              xtb_convergence_thresholds['normal'])
+        xtb_logger.debug(f'      {self.job_name}: xtb library driver, L-BFGS')
+        try:
+            energy, coordinates, converged = optimise_with_engine(
+                self.engine, self.atoms_list, self.start_coordinates, max_cycles=max_cycles,
+                gradient_threshold=gradient_threshold, energy_threshold=energy_threshold)
+        except Exception as e:
+            xtb_logger.info('    Optimization failed')
+            xtb_logger.error(f"      {e}")
+            return False
+        self._energy = energy
+        self._optimized_coordinates = coordinates
+        if not converged:
+            xtb_logger.info('      Optimization did not converge in {} cycles in {}'.format(max_cycles,
+                                                                                          os.getcwd()))
+            self.keep_partial_geometry(coordinates, energy)
+            self.molecule.coordinates = coordinates
+            return 'CycleExceeded'
+        write_xyz(self.atoms_list, self.optimized_coordinates, self.result_xyz_file,
+                  job_name=self.job_name,
+                  energy=self.energy)
+        return True
+
     @property
     def optimized_coordinates(self):
         """"""
+        if self._optimized_coordinates is not None:
+            return self._optimized_coordinates
         return np.loadtxt('xtbopt.xyz', dtype=float, skiprows=2, usecols=(1, 2, 3))
 
     @property
     def energy(self):
+        if self._energy is not None:
+            return self._energy
         if os.path.exists('energy'):
             with open('energy') as fp:
                 return float(fp.readlines()[-2].split()[1])
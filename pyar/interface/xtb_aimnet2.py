@@ -6,7 +6,7 @@ import sys
 import numpy as np
 import torch
 
-from pyar.interface import SF, which, write_xyz
+from pyar.interface import SF, executable, which, write_xyz
 import pkg_resources
 import os
 
@@ -32,7 +32,7 @@ class XtbAimnet2(SF):
 
         super(XtbAimnet2, self).__init__(molecule)
 
-        self.xtb_cmd = f"xtb {self.start_xyz_file} -opt {method['opt_threshold']}"
+        self.xtb_cmd = f"{executable('xtb')} {self.start_xyz_file} -opt {method['opt_threshold']}"
 
         if self.charge != 0:
             self.xtb_cmd = "{} -chrg {}".format(self.xtb_cmd, self.charge)
@@ -41,7 +41,7 @@ class XtbAimnet2(SF):
         if self.multiplicity == 1 and self.scftype is not 'rhf':
             self.xtb_cmd = "{} -{}".format(self.xtb_cmd, self.scftype)
 
-        self.aimnet2_cmd = f"python {aimnet2_script} {model_path} --traj result.traj {self.xtb_optimized_xyz_file} {self.aimnet2_optimized_xyz_file}"
+        self.aimnet2_cmd = f"{executable('python')} {aimnet2_script} {model_path} --traj result.traj {self.xtb_optimized_xyz_file} {self.aimnet2_optimized_xyz_file}"
 
         if self.charge != 0:
             self.aimnet2_cmd = "{} -c {}".format(self.aimnet2_cmd, self.charge)
@@ -5,7 +5,7 @@ import sys
 
 import numpy as np
 
-from pyar.interface import SF, which, write_xyz
+from pyar.interface import SF, executable, which, write_xyz
 import pkg_resources
 import os
 
@@ -25,7 +25,7 @@ class XtbAIQM1(SF):
 
         super(XtbAIQM1, self).__init__(molecule)
 
-        self.xtb_cmd = f"xtb {self.start_xyz_file} -opt {method['opt_threshold']}"
+        self.xtb_cmd = f"{executable('xtb')} {self.start_xyz_file} -opt {method['opt_threshold']}"
 
         if self.charge != 0:
             self.xtb_cmd = "{} -chrg {}".format(self.xtb_cmd, self.charge)
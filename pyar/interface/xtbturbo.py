@@ -50,7 +50,7 @@ class XtbTurbo(SF):
         self.coord_file = 'coord'
         self.energy_file = 'energy'
 
-        self.egrad_program = ['xtb', 'coord', '-grad']
+        self.egrad_program = [interface.executable('xtb'), 'coord', '-grad']
         if self.charge > 0:
             self.egrad_program += ['-chrg', str(self.charge)]
         if self.multiplicity != 1:
@@ -56,8 +56,9 @@ class aiqm1(models.torchani_model):
         self.qm_program_kwargs = qm_program_kwargs
         modelname = self.method.lower().replace('*','star').replace('@','at')
         ani_nn_children = []
+        self.ani_nns = [ani_nns_in_aiqm1(method=self.method, model_index=ii) for ii in range(8)]
         for ii in range(8):
-            nn_i = models.model_tree_node(name=f'{modelname}_nn{ii}', operator='predict', model=ani_nns_in_aiqm1(method=self.method, model_index=ii))
+            nn_i = models.model_tree_node(name=f'{modelname}_nn{ii}', operator='predict', model=self.ani_nns[ii])
             ani_nn_children.append(nn_i)
         ani_nns = models.model_tree_node(name=f'{modelname}_nn', children=ani_nn_children, operator='average')
         shift = models.model_tree_node(name=f'{modelname}_atomic_energy_shift', operator='predict', model=atomic_energy_shift(method=self.method))
@@ -79,17 +80,47 @@ class aiqm1(models.torchani_model):
             errmsg = 'Either molecule or molecular_database should be provided in input'
             raise ValueError(errmsg)
         
+        # Polyatomic molecules are passed to the model tree together so that the ANI networks see them as one batch
+        molDB_batch = data.molecular_database()
         for mol in molDB.molecules:
-            self.predict_for_molecule(molecule=mol,
-                                    calculate_energy=calculate_energy, calculate_energy_gradients=calculate_energy_gradients, calculate_hessian=calculate_hessian)
+            if len(mol.atoms) > 1 and self.is_chno(mol):
+                molDB_batch.molecules.append(mol)
+            else:
+                self.predict_for_molecule(molecule=mol,
+                                        calculate_energy=calculate_energy, calculate_energy_gradients=calculate_energy_gradients, calculate_hessian=calculate_hessian)
+        if len(molDB_batch.molecules) == 0: return
+        
+        self.aiqm1_model.predict(molecular_database=molDB_batch,
+                                calculate_energy=calculate_energy, calculate_energy_gradients=calculate_energy_gradients, calculate_hessian=calculate_hessian)
+        properties = [] ; atomic_properties = []
+        if calculate_energy: properties.append('energy')
+        if calculate_energy_gradients: atomic_properties.append('energy_gradients')
+        if calculate_hessian: properties.append('hessian')
+        modelname = self.method.lower().replace('*','star').replace('@','at')
+        for mol in molDB_batch.molecules:
+            mol.__dict__[f'{modelname}_nn'].standard_deviation(properties=properties+atomic_properties)
+    
+    def predict_ani_nns(self, molecular_database=None, calculate_energy_gradients=False, batch_size=None):
+        '''
+        Batched prediction with the ANI part of AIQM1 only, see :func:`predict_ani_nns_ensemble`.
+        '''
+        if batch_size == None: batch_size = ani_nns_in_aiqm1.batch_size
+        return predict_ani_nns_ensemble(self.ani_nns, molecular_database,
+                                        calculate_energy_gradients=calculate_energy_gradients, batch_size=batch_size)
+    
+    @staticmethod
+    def is_chno(molecule):
+        for atom in molecule.atoms:
+            if not atom.atomic_number in [1, 6, 7, 8]:
+                return False
+        return True
         
     def predict_for_molecule(self, molecule=None,
                 calculate_energy=True, calculate_energy_gradients=False, calculate_hessian=False):
         
-        for atom in molecule.atoms:
-            if not atom.atomic_number in [1, 6, 7, 8]:
-                print(' * Warning * Molecule contains elements other than CHNO, no calculations performed')
-                return
+        if not self.is_chno(molecule):
+            print(' * Warning * Molecule contains elements other than CHNO, no calculations performed')
+            return
         
         if len(molecule.atoms) == 1:
             molecule.energy = self.atomic_energies[self.method][molecule.atoms[0].atomic_number]
@@ -146,6 +177,7 @@ class atomic_energy_shift():
 
 class ani_nns_in_aiqm1():
     species_order = [1, 6, 7, 8]
+    batch_size = 256
     
     def __init__(self, method='AIQM1', model_index = 0):
         if method == 'AIQM1':
@@ -225,7 +257,8 @@ class ani_nns_in_aiqm1():
         self.nn = nn
     
     def predict(self, molecular_database=None, molecule=None,
-                calculate_energy=True, calculate_energy_gradients=False, calculate_hessian=False):
+                calculate_energy=True, calculate_energy_gradients=False, calculate_hessian=False, batch_size=None):
+        if batch_size == None: batch_size = self.batch_size
         if molecular_database != None:
             molDB = molecular_database
         elif molecule != None:
@@ -235,24 +268,107 @@ class ani_nns_in_aiqm1():
             errmsg = 'Either molecule or molecular_database should be provided in input'
             raise ValueError(errmsg)
         
-        species_to_tensor = ChemicalSymbolsToInts(self.species_order)
+        if calculate_hessian:
+            for mol in molDB.molecules:
+                self.predict_for_molecule(molecule=mol,
+                                          calculate_energy=calculate_energy, calculate_energy_gradients=calculate_energy_gradients, calculate_hessian=calculate_hessian)
+            return
         
-        for mol in molDB.molecules:
-            atomic_numbers = np.array([atom.atomic_number for atom in mol.atoms])
-            xyz_coordinates = torch.tensor(np.array(mol.xyz_coordinates).astype('float')).to(self.device).requires_grad_(calculate_energy_gradients or calculate_hessian)
-            xyz_coordinates = xyz_coordinates.unsqueeze(0)
-            species = species_to_tensor(atomic_numbers).to(self.device).unsqueeze(0)
-            ANI_NN_energy = self.model((species, xyz_coordinates)).energies
-            if calculate_energy: mol.energy = float(ANI_NN_energy)
-            if calculate_energy_gradients or calculate_hessian:
-                ANI_NN_energy_gradients = torch.autograd.grad(ANI_NN_energy.sum(), xyz_coordinates, create_graph=True, retain_graph=True)[0]
+        for ibatch in range(0, len(molDB.molecules), batch_size):
+            molecules = molDB.molecules[ibatch:ibatch+batch_size]
+            species, xyz_coordinates = self.batch_tensors(molecules)
+            energies, gradients = self.evaluate(species, xyz_coordinates, calculate_energy_gradients=calculate_energy_gradients)
+            for imol, mol in enumerate(molecules):
+                if calculate_energy: mol.energy = float(energies[imol])
                 if calculate_energy_gradients:
-                    grads = ANI_NN_energy_gradients[0].detach().cpu().numpy()
                     for iatom in range(len(mol.atoms)):
-                        mol.atoms[iatom].energy_gradients = grads[iatom]
-            if calculate_hessian:
-                ANI_NN_hessian = torchani.utils.hessian(xyz_coordinates, energies=ANI_NN_energy)
-                mol.hessian = ANI_NN_hessian[0].detach().cpu().numpy()
+                        mol.atoms[iatom].energy_gradients = gradients[imol][iatom]
+
+    def predict_for_molecule(self, molecule=None,
+                             calculate_energy=True, calculate_energy_gradients=False, calculate_hessian=False):
+        species_to_tensor = ChemicalSymbolsToInts(self.species_order)
+        atomic_numbers = np.array([atom.atomic_number for atom in molecule.atoms])
+        xyz_coordinates = torch.tensor(np.array(molecule.xyz_coordinates).astype('float')).to(self.device).requires_grad_(calculate_energy_gradients or calculate_hessian)
+        xyz_coordinates = xyz_coordinates.unsqueeze(0)
+        species = species_to_tensor(atomic_numbers).to(self.device).unsqueeze(0)
+        ANI_NN_energy = self.model((species, xyz_coordinates)).energies
+        if calculate_energy: molecule.energy = float(ANI_NN_energy)
+        if calculate_energy_gradients or calculate_hessian:
+            ANI_NN_energy_gradients = torch.autograd.grad(ANI_NN_energy.sum(), xyz_coordinates, create_graph=True, retain_graph=True)[0]
+            if calculate_energy_gradients:
+                grads = ANI_NN_energy_gradients[0].detach().cpu().numpy()
+                for iatom in range(len(molecule.atoms)):
+                    molecule.atoms[iatom].energy_gradients = grads[iatom]
+        if calculate_hessian:
+            ANI_NN_hessian = torchani.utils.hessian(xyz_coordinates, energies=ANI_NN_energy)
+            molecule.hessian = ANI_NN_hessian[0].detach().cpu().numpy()
+
+    def batch_tensors(self, molecules):
+        '''
+        Pad species (with -1, which TorchANI treats as a dummy atom) and coordinates (with zeros)
+        of molecules with different numbers of atoms into single batch tensors.
+        '''
+        return pad_molecules(molecules, species_order=self.species_order, device=self.device)
+
+    def evaluate(self, species, xyz_coordinates, calculate_energy_gradients=False):
+        '''
+        Evaluate the network for a padded batch in one call.
+
+        Returns:
+            energies (numpy array of shape (nmols,)) and gradients (numpy array of shape (nmols, natoms_max, 3)
+            or None if they were not requested); gradients of padding atoms are zero.
+        '''
+        xyz_coordinates = xyz_coordinates.clone().requires_grad_(calculate_energy_gradients)
+        energies = self.model((species, xyz_coordinates)).energies
+        gradients = None
+        if calculate_energy_gradients:
+            gradients = torch.autograd.grad(energies.sum(), xyz_coordinates)[0].detach().cpu().numpy()
+        return energies.detach().cpu().numpy(), gradients
+
+def pad_molecules(molecules, species_order=ani_nns_in_aiqm1.species_order, device='cpu'):
+    natoms_max = max(len(mol.atoms) for mol in molecules)
+    species_index = {atomic_number: ii for ii, atomic_number in enumerate(species_order)}
+    species = np.full((len(molecules), natoms_max), -1, dtype=np.int64)
+    xyz_coordinates = np.zeros((len(molecules), natoms_max, 3))
+    for imol, mol in enumerate(molecules):
+        natoms = len(mol.atoms)
+        species[imol, :natoms] = [species_index[atom.atomic_number] for atom in mol.atoms]
+        xyz_coordinates[imol, :natoms] = mol.xyz_coordinates
+    return torch.tensor(species, device=device), torch.tensor(xyz_coordinates, device=device)
+
+def predict_ani_nns_ensemble(ensemble, molecular_database, calculate_energy_gradients=False, batch_size=256):
+    '''
+    Run every member of an ANI ensemble (e.g., the 8 networks of AIQM1) once per batch of molecules.
+
+    Arguments:
+        ensemble (list): instances of :class:`ani_nns_in_aiqm1`.
+        molecular_database (:class:`pyar.mlatom.data.molecular_database`): molecules with CHNO atoms only.
+        calculate_energy_gradients (bool, optional): whether to calculate energy gradients.
+        batch_size (int, optional): maximum number of molecules padded into one batch.
+
+    Returns:
+        dict with per-molecule ``energy`` and ``energy_standard_deviation`` (numpy arrays of shape (nmols,)) and,
+        if requested, ``energy_gradients`` and ``energy_gradients_standard_deviation`` (lists of (natoms, 3) arrays).
+    '''
+    molecules = molecular_database.molecules
+    nmodels = len(ensemble)
+    energies = np.zeros((nmodels, len(molecules)))
+    gradients = [np.zeros((nmodels, len(mol.atoms), 3)) for mol in molecules] if calculate_energy_gradients else None
+    for ibatch in range(0, len(molecules), batch_size):
+        batch = molecules[ibatch:ibatch+batch_size]
+        species, xyz_coordinates = ensemble[0].batch_tensors(batch)
+        for imodel, member in enumerate(ensemble):
+            batch_energies, batch_gradients = member.evaluate(species, xyz_coordinates, calculate_energy_gradients=calculate_energy_gradients)
+            energies[imodel, ibatch:ibatch+len(batch)] = batch_energies
+            if calculate_energy_gradients:
+                for imol, mol in enumerate(batch):
+                    gradients[ibatch+imol][imodel] = batch_gradients[imol, :len(mol.atoms)]
+    results = {'energy': energies.mean(axis=0),
+               'energy_standard_deviation': energies.std(axis=0)}
+    if calculate_energy_gradients:
+        results['energy_gradients'] = [grad.mean(axis=0) for grad in gradients]
+        results['energy_gradients_standard_deviation'] = [grad.std(axis=0) for grad in gradients]
+    return results
 
 if __name__ == '__main__':
     pass
@@ -6,7 +6,7 @@
   !---------------------------------------------------------------------------! 
 '''
 import numpy as np
-import copy, tempfile
+import copy
 import warnings
 warnings.filterwarnings("ignore")
 from pyar.mlatom import constants
@@ -15,7 +15,6 @@ from pyar.mlatom import stopper
     
 try:
     import ase
-    from ase import io
     from ase.calculators.calculator import Calculator, all_changes
     from ase.thermochemistry import IdealGasThermo
     import ase.units as units
@@ -26,25 +25,16 @@ def optimize_geometry(initial_molecule, model, convergence_criterion_for_forces,
     if optimization_algorithm == None:
         optimization_algorithm = 'LBFGS'
     
-    optimization_trajectory = data.molecular_trajectory()
-    globals()['initial_molecule'] = initial_molecule
-    globals()['optimization_trajectory'] = optimization_trajectory
-    
-    # Ugly solution because no time to understand what 'atoms' in ASE is exactly (probably corresponds to MLatom's 'molecular_database')
-    # more like 'molecule', the 'atoms' object defines a collection of atoms
-    with tempfile.TemporaryDirectory() as tmpdirname: # todo: new atoms object directly, with something like molecule.ase()
-        xyzfilename = f'{tmpdirname}/tmp.xyz'
-        initial_molecule.write_file_with_xyz_coordinates(filename=xyzfilename)
-        atoms = io.read(xyzfilename, index=':', format='xyz')[0]
-    # atoms.set_calculator(MLatomCalculator(model=model, save_optimization_trajectory=True))
+    atoms = ase_atoms(initial_molecule)
     # atoms.set_calculator() is deprecated
-    atoms.calc = MLatomCalculator(model=model, save_optimization_trajectory=True)
+    atoms.calc = MLatomCalculator(model=model, molecule=initial_molecule, save_optimization_trajectory=True,
+                                  trajectory_buffer_size=maximum_number_of_steps+1)
     
     from ase import optimize
     opt = optimize.__dict__[optimization_algorithm](atoms)
     opt.run(fmax=convergence_criterion_for_forces, steps=maximum_number_of_steps)
     
-    return optimization_trajectory
+    return atoms.calc.get_optimization_trajectory()
 
 def transition_state(initial_molecule, model, 
                      convergence_criterion_for_forces,
@@ -62,16 +52,9 @@ def transition_state(initial_molecule, model,
 def dimer_method(initial_molecule, model, 
                  convergence_criterion_for_forces,
                  maximum_number_of_steps,  **kwargs):
-    optimization_trajectory = data.molecular_trajectory()
-    globals()['initial_molecule'] = initial_molecule
-    globals()['optimization_trajectory'] = optimization_trajectory
-
-    with tempfile.TemporaryDirectory() as tmpdirname: # todo: new atoms object directly
-        xyzfilename = f'{tmpdirname}/tmp.xyz'
-        initial_molecule.write_file_with_xyz_coordinates(filename=xyzfilename)
-        atoms = io.read(xyzfilename, index=':', format='xyz')[0]
-
-    atoms.calc = MLatomCalculator(model=model, save_optimization_trajectory=True)
+    atoms = ase_atoms(initial_molecule)
+    atoms.calc = MLatomCalculator(model=model, molecule=initial_molecule, save_optimization_trajectory=True,
+                                  trajectory_buffer_size=maximum_number_of_steps+1)
 
     from ase.dimer import DimerControl, MinModeAtoms, MinModeTranslate
 
@@ -82,23 +65,14 @@ def dimer_method(initial_molecule, model,
             dim_rlx.run(fmax=convergence_criterion_for_forces,
                         steps=maximum_number_of_steps)
     
-    return optimization_trajectory
+    return atoms.calc.get_optimization_trajectory()
 
 def nudged_elastic_band(initial_molecule, final_molecule, model, 
                         convergence_criterion_for_forces,
                         maximum_number_of_steps,
                         number_of_middle_images=3, **kwargs):
-    optimization_trajectory = data.molecular_trajectory()
-    globals()['initial_molecule'] = initial_molecule
-    globals()['optimization_trajectory'] = optimization_trajectory
-
-    with tempfile.TemporaryDirectory() as tmpdirname: # todo: new atoms object directly
-        xyzfilename = f'{tmpdirname}/tmp_init.xyz'
-        initial_molecule.write_file_with_xyz_coordinates(filename=xyzfilename)
-        initial = io.read(xyzfilename, index=':', format='xyz')[0]
-        xyzfilename = f'{tmpdirname}/tmp_final.xyz'
-        final_molecule.write_file_with_xyz_coordinates(filename=xyzfilename)
-        final = io.read(xyzfilename, index=':', format='xyz')[0]
+    initial = ase_atoms(initial_molecule)
+    final = ase_atoms(final_molecule)
 
     from ase.neb import NEB
     from ase.optimize import MDMin
@@ -108,55 +82,125 @@ def nudged_elastic_band(initial_molecule, final_molecule, model,
     neb = NEB(images)
     neb.interpolate()
     for image in images[1:number_of_middle_images+1]:
-        image.calc = MLatomCalculator(model=model, save_optimization_trajectory=True)
+        image.calc = MLatomCalculator(model=model, molecule=initial_molecule, save_optimization_trajectory=True)
     optimizer = MDMin(neb, trajectory='A2B.traj')
     optimizer.run(fmax=maximum_number_of_steps,
                   steps=maximum_number_of_steps)
 
 
+def ase_atoms(molecule):
+    '''
+    ASE Atoms object with the elements and XYZ coordinates (in Angstrom) of an MLatom molecule.
+    '''
+    return ase.Atoms(symbols=[atom.element_symbol for atom in molecule.atoms], positions=molecule.xyz_coordinates)
+
 class MLatomCalculator(Calculator):
+    '''
+    ASE calculator evaluating energies and forces with an MLatom model.
+
+    The coordinates of a private copy of the molecule are updated in place on every call and,
+    if requested, the steps are recorded in array buffers held by the calculator, so that
+    several calculators can be used in the same process at the same time.
+
+    Arguments:
+        model (:class:`mlatom.models.model` or :class:`mlatom.models.methods`): model providing energies and gradients.
+        molecule (:class:`mlatom.data.molecule`, optional): molecule with charge, multiplicity, etc. Built from the ASE atoms if not given.
+        save_optimization_trajectory (bool, optional): whether to record every evaluated step.
+        trajectory_buffer_size (int, optional): initial number of steps preallocated in the trajectory buffers; they grow when full.
+    '''
     implemented_properties = ['energy', 'forces']
-    def __init__(self, model, save_optimization_trajectory = False):
+    def __init__(self, model, molecule=None, save_optimization_trajectory = False, trajectory_buffer_size=200):
         super(MLatomCalculator, self).__init__()
         self.model = model
         self.save_optimization_trajectory = save_optimization_trajectory
+        self.trajectory_buffer_size = max(int(trajectory_buffer_size), 1)
+        self.molecule = None
+        if molecule is not None:
+            self.set_molecule(molecule)
+
+    def set_molecule(self, molecule):
+        self.molecule = molecule.copy()
+        self.molecular_labels = set(self.molecule.__dict__.keys())
+        self.atomic_labels = [set(atom.__dict__.keys()) for atom in self.molecule.atoms]
+        natoms = len(self.molecule.atoms)
+        self.number_of_steps = 0
+        self.trajectory_coordinates = np.zeros((self.trajectory_buffer_size, natoms, 3))
+        self.trajectory_energies = np.zeros(self.trajectory_buffer_size)
+        self.trajectory_gradients = np.zeros((self.trajectory_buffer_size, natoms, 3))
+
+    def reset_molecule(self):
+        # Drop everything the model attached during the previous call, otherwise model trees would reuse old results
+        for label in list(self.molecule.__dict__.keys()):
+            if label not in self.molecular_labels:
+                del self.molecule.__dict__[label]
+        for atom, labels in zip(self.molecule.atoms, self.atomic_labels):
+            for label in list(atom.__dict__.keys()):
+                if label not in labels:
+                    del atom.__dict__[label]
+
+    def record_step(self, coordinates, energy, gradients):
+        if self.number_of_steps == len(self.trajectory_energies):
+            self.trajectory_coordinates = np.concatenate((self.trajectory_coordinates, np.zeros_like(self.trajectory_coordinates)))
+            self.trajectory_energies = np.concatenate((self.trajectory_energies, np.zeros_like(self.trajectory_energies)))
+            self.trajectory_gradients = np.concatenate((self.trajectory_gradients, np.zeros_like(self.trajectory_gradients)))
+        self.trajectory_coordinates[self.number_of_steps] = coordinates
+        self.trajectory_energies[self.number_of_steps] = energy
+        self.trajectory_gradients[self.number_of_steps] = gradients
+        self.number_of_steps += 1
+
+    def get_optimization_trajectory(self):
+        '''
+        Build a :class:`mlatom.data.molecular_trajectory` from the recorded steps.
+        The last step keeps all properties calculated by the model.
+        '''
+        optimization_trajectory = data.molecular_trajectory()
+        for istep in range(self.number_of_steps):
+            if istep == self.number_of_steps - 1:
+                step_molecule = self.molecule.copy()
+            else:
+                step_molecule = self.molecule.copy(atomic_labels=[], molecular_labels=[label for label in self.molecular_labels if label != 'atoms'])
+                step_molecule.xyz_coordinates = self.trajectory_coordinates[istep]
+                for iatom, atom in enumerate(step_molecule.atoms):
+                    atom.energy_gradients = np.copy(self.trajectory_gradients[istep][iatom])
+                step_molecule.energy = self.trajectory_energies[istep]
+            optimization_trajectory.steps.append(data.molecular_trajectory_step(step=istep, molecule=step_molecule))
+        return optimization_trajectory
 
     def calculate(self, atoms=None, properties=['energy'], system_changes=all_changes):
         super(MLatomCalculator, self).calculate(atoms, properties, system_changes)
-        global initial_molecule
-        # Ugly solution because no time to understand what 'atoms' in ASE is exactly (probably corresponds to MLatom's 'molecular_database')
-        with tempfile.TemporaryDirectory() as tmpdirname:
-            xyzfilename = f'{tmpdirname}/tmp.xyz'
-            io.write(xyzfilename, self.atoms, format='extxyz', plain=True)
-            
-            current_molecule = initial_molecule.copy()
-            mol_from_file = data.molecule()
-            mol_from_file.read_from_xyz_file(filename=xyzfilename)
-            coordinates = mol_from_file.xyz_coordinates
-            current_molecule.xyz_coordinates = coordinates
-            
-            self.model.predict(molecule=current_molecule, calculate_energy=True, calculate_energy_gradients=True)
-            if not 'energy' in current_molecule.__dict__:
-                pythonpackage = True # or False, depending on your use case
-                if pythonpackage: 
-                    raise ValueError('model did not return any energy')
-                else: stopper.stopMLatom('model did not return any energy')
-            
-            if self.save_optimization_trajectory:
-                global optimization_trajectory
-                istep = len(optimization_trajectory.steps)
-                optimization_trajectory.steps.append(data.molecular_trajectory_step(step=istep, molecule=current_molecule))
-            
-            energy = current_molecule.energy
-            forces = -current_molecule.get_energy_gradients()
-
-            energy *= ase.units.Hartree
-            forces *= ase.units.Hartree
-
-            self.results['energy'] = energy
-
-            if 'forces' in properties:
-                self.results['forces'] = forces
+        if self.molecule is None:
+            molecule = data.molecule()
+            for element_symbol in self.atoms.get_chemical_symbols():
+                molecule.atoms.append(data.atom(element_symbol=element_symbol))
+            molecule.xyz_coordinates = self.atoms.get_positions()
+            self.set_molecule(molecule)
+
+        current_molecule = self.molecule
+        self.reset_molecule()
+        positions = self.atoms.get_positions()
+        for iatom, atom in enumerate(current_molecule.atoms):
+            atom.xyz_coordinates = positions[iatom].copy()
+        
+        self.model.predict(molecule=current_molecule, calculate_energy=True, calculate_energy_gradients=True)
+        if not 'energy' in current_molecule.__dict__:
+            pythonpackage = True # or False, depending on your use case
+            if pythonpackage: 
+                raise ValueError('model did not return any energy')
+            else: stopper.stopMLatom('model did not return any energy')
+        
+        energy = current_molecule.energy
+        gradients = current_molecule.get_energy_gradients()
+        if self.save_optimization_trajectory:
+            self.record_step(positions, energy, gradients)
+        forces = -gradients
+
+        energy *= ase.units.Hartree
+        forces *= ase.units.Hartree
+
+        self.results['energy'] = energy
+
+        if 'forces' in properties:
+            self.results['forces'] = forces
 
 def thermochemistry(molecule):
     energy = molecule.energy * units.Hartree
@@ -173,11 +217,7 @@ def thermochemistry(molecule):
     if molecule.shape.lower() == 'linear': geometry = 'linear'
     spin = (molecule.multiplicity - 1) / 2
     
-    # Ugly solution because no time to understand what 'atoms' in ASE is exactly (probably corresponds to MLatom's 'molecular_database')
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        xyzfilename = f'{tmpdirname}/tmp.xyz'
-        molecule.write_file_with_xyz_coordinates(filename=xyzfilename)
-        mol = io.read(xyzfilename, index=':', format='xyz')[0]
+    mol = ase_atoms(molecule)
     
     if molecule.frequencies[0] > 0:
         if 'symmetry_number' not in molecule.__dict__.keys():
@@ -550,15 +550,132 @@ def optimize_grid(func, grid):
                 break
         return opt_params, min_val
  
+def RE_descriptors_and_jacobians(xyz, Req, calculate_jacobians=True):
+    '''
+    RE descriptors Req/r_ij of a stack of geometries and their Jacobians with respect to the Cartesian coordinates.
+
+    Arguments:
+        xyz (numpy array of shape (M, N, 3)): XYZ coordinates.
+        Req (numpy array of shape (N*(N-1)/2,)): reference distances in the order of np.triu_indices(N, 1).
+
+    Returns:
+        descriptors (M, P) and Jacobians (M, P, 3N) or None.
+    '''
+    xyz = np.asarray(xyz, dtype=float)
+    nmols, natoms = xyz.shape[:2]
+    iatoms, jatoms = np.triu_indices(natoms, 1)
+    rij = xyz[:, iatoms] - xyz[:, jatoms]
+    distances_squared = np.sum(rij**2, axis=2)
+    descriptors = Req / np.sqrt(distances_squared)
+    if not calculate_jacobians:
+        return descriptors, None
+    npairs = len(iatoms)
+    jacobians = np.zeros((nmols, npairs, natoms, 3))
+    dxdRi = -(descriptors / distances_squared)[:, :, np.newaxis] * rij
+    pairs = np.arange(npairs)
+    jacobians[:, pairs, iatoms] = dxdRi
+    jacobians[:, pairs, jatoms] = -dxdRi
+    return descriptors, jacobians.reshape(nmols, npairs, 3*natoms)
+
+def matern_polynomial(nn, sigma):
+    # exp(-r/sigma) * sum_k (nn+k)!/(2nn)! * C(nn,k) * (2r/sigma)^(nn-k) as a polynomial in r multiplying exp(-r/sigma)
+    from math import comb, factorial
+    coefficients = np.zeros(nn+1)
+    for kk in range(nn+1):
+        coefficients[nn-kk] = factorial(nn+kk) / factorial(2*nn) * comb(nn, kk) * (2.0/sigma)**(nn-kk)
+    return np.polynomial.Polynomial(coefficients)
+
+def kernel_terms(delta, kernel='Gaussian', sigma=1.0, nn=2, calculate_derivatives=False):
+    '''
+    Kernel values for descriptor differences delta = x_a - x_b of shape (A, B, P).
+
+    If derivatives are requested, also returns dk/dx_a of shape (A, B, P) and the terms h1 (A, B), h2 (A, B), w (A, B, P)
+    of the mixed second derivative d2k/dx_a dx_b = h1 * I + h2 * w w^T.
+    '''
+    if kernel.casefold() == 'Gaussian'.casefold():
+        distances_squared = np.sum(delta**2, axis=2)
+        value = np.exp(-distances_squared / (2 * sigma**2))
+        if not calculate_derivatives: return value, None, None, None, None
+        dk = -(value / sigma**2)[:, :, np.newaxis] * delta
+        return value, dk, value / sigma**2, -value / sigma**4, delta
+    elif kernel.casefold() == 'Laplacian'.casefold():
+        value = np.exp(-np.sum(np.abs(delta), axis=2) / sigma)
+        if not calculate_derivatives: return value, None, None, None, None
+        signs = np.sign(delta)
+        dk = -(value / sigma)[:, :, np.newaxis] * signs
+        return value, dk, np.zeros_like(value), -value / sigma**2, signs
+    elif kernel.casefold() == 'Matern'.casefold():
+        distances = np.sqrt(np.sum(delta**2, axis=2))
+        polynomial = matern_polynomial(nn, sigma)
+        exponential = np.exp(-distances / sigma)
+        value = exponential * polynomial(distances)
+        if not calculate_derivatives: return value, None, None, None, None
+        dpolynomial = polynomial.deriv()
+        d2polynomial = dpolynomial.deriv()
+        df = exponential * (dpolynomial(distances) - polynomial(distances) / sigma)
+        d2f = exponential * (d2polynomial(distances) - 2 * dpolynomial(distances) / sigma + polynomial(distances) / sigma**2)
+        nonzero = distances > 0
+        safe_distances = np.where(nonzero, distances, 1.0)
+        # f'(r)/r -> f''(0) for r -> 0
+        df_over_r = np.where(nonzero, df / safe_distances, d2f)
+        c2 = np.where(nonzero, (d2f - df_over_r) / safe_distances**2, 0.0)
+        dk = df_over_r[:, :, np.newaxis] * delta
+        return value, dk, -df_over_r, -c2, delta
+    else:
+        raise ValueError(f'Unsupported kernel {kernel}, use Gaussian, Laplacian or Matern')
+
+def kernel_blocks(Xa, Xb, Ja=None, Jb=None, kernel='Gaussian', sigma=1.0, nn=2,
+                  calculate_gradients_a=False, calculate_gradients_b=False, calculate_hessian=False):
+    '''
+    Kernel block between descriptor sets Xa (A, P) and Xb (B, P) computed with broadcasting.
+
+    Returns a dict with 'value' (A, B) and, if requested, 'gradients_a' = dk/dR_a (A, B, 3N), 'gradients_b' = dk/dR_b (A, B, 3N)
+    and 'hessian' = d2k/dR_a dR_b (A, B, 3N, 3N), where Ja and Jb are the descriptor Jacobians.
+    '''
+    delta = Xa[:, np.newaxis, :] - Xb[np.newaxis, :, :]
+    calculate_derivatives = calculate_gradients_a or calculate_gradients_b or calculate_hessian
+    value, dk, h1, h2, w = kernel_terms(delta, kernel=kernel, sigma=sigma, nn=nn, calculate_derivatives=calculate_derivatives)
+    blocks = {'value': value}
+    if calculate_gradients_a:
+        blocks['gradients_a'] = np.einsum('apd,abp->abd', Ja, dk)
+    if calculate_gradients_b:
+        blocks['gradients_b'] = -np.einsum('bpd,abp->abd', Jb, dk)
+    if calculate_hessian:
+        wa = np.einsum('apd,abp->abd', Ja, w)
+        wb = np.einsum('bpe,abp->abe', Jb, w)
+        blocks['hessian'] = h1[:, :, np.newaxis, np.newaxis] * np.einsum('apd,bpe->abde', Ja, Jb) \
+                          + h2[:, :, np.newaxis, np.newaxis] * wa[:, :, :, np.newaxis] * wb[:, :, np.newaxis, :]
+    return blocks
+
+def tiles(size, tile_size):
+    for start in range(0, size, tile_size):
+        yield slice(start, min(start + tile_size, size))
+
 class krr(ml_model):
+    kernel = 'Gaussian'
+    matern_order = 2
+    tile_size = 256
+    nystrom_rank = None
+
+    def kernel_settings(self):
+        kwargs = self.kernel_function_kwargs if self.kernel_function_kwargs else {}
+        return {'kernel': kwargs.get('kernel', self.kernel),
+                'sigma': self.hyperparameters['sigma'].value,
+                'nn': kwargs.get('nn', self.matern_order)}
+
     def train(self, molecular_database=None,
               property_to_learn='y',
               xyz_derivative_property_to_learn = None,
               save_model=True,
               invert_matrix=False,
               matrix_decomposition=None,
-              kernel_function_kwargs=None,prior=None):
-        
+              kernel_function_kwargs=None,prior=None,
+              nystrom_rank=None):
+        '''
+        Train KRR on RE descriptors. The kernel matrix and its derivative blocks are built tile by tile with broadcasting.
+        ``kernel_function_kwargs`` may contain 'Req', 'kernel' (Gaussian, Laplacian or Matern) and 'nn' (order of the Matern kernel).
+        ``nystrom_rank`` enables a Nystrom low-rank approximation with this many randomly chosen landmark structures (values only).
+        '''
         xyz = np.array([mol.xyz_coordinates for mol in molecular_database.molecules]).astype(float)
         yy = molecular_database.get_properties(property_name=property_to_learn)
         if prior == None:
@@ -574,10 +691,12 @@ class krr(ml_model):
         self.Ntrain = len(xyz) 
         self.train_xyz = xyz 
         self.kernel_function = self.gaussian_kernel_function
-        self.kernel_function_kwargs = kernel_function_kwargs
+        self.kernel_function_kwargs = kernel_function_kwargs if kernel_function_kwargs else {}
         self.kernel_matrix_size = 0 
         Natoms = len(xyz[0])
         self.Natoms = Natoms 
+        settings = self.kernel_settings()
+        Req = self.kernel_function_kwargs['Req']
 
         self.train_property = False 
         self.train_xyz_derivative_property = False 
@@ -589,29 +708,48 @@ class krr(ml_model):
         if xyz_derivative_property_to_learn != None:
             self.train_xyz_derivative_property = True
             self.kernel_matrix_size += 3*Natoms*len(yy)
-            yygrad = molecular_database.get_xyz_derivative_properties().reshape(3*Natoms*len(yy))
+            yygrad = molecular_database.get_xyz_derivative_properties(xyz_derivative_property_to_learn).reshape(3*Natoms*len(yy))
             yyref = np.concatenate((yyref,yygrad))
 
-        kernel_matrix = np.zeros((self.kernel_matrix_size,self.kernel_matrix_size))
-
-        kernel_matrix = kernel_matrix + np.identity(self.kernel_matrix_size)*self.hyperparameters['lambda'].value
-        for ii in range(len(yy)):
-            value_and_derivatives = self.kernel_function(xyz[ii],xyz[ii],calculate_value=self.train_property,calculate_gradients=self.train_xyz_derivative_property,calculate_Hessian=self.train_xyz_derivative_property,**self.kernel_function_kwargs)
-            kernel_matrix[ii][ii] += value_and_derivatives['value']
+        if nystrom_rank == None: nystrom_rank = self.nystrom_rank
+        if nystrom_rank != None and nystrom_rank < self.Ntrain:
             if self.train_xyz_derivative_property:
-                kernel_matrix[ii,len(yy)+ii*3*Natoms:len(yy)+(ii+1)*3*Natoms] += value_and_derivatives['gradients'].reshape(3*Natoms)
-                kernel_matrix[len(yy)+ii*3*Natoms:len(yy)+(ii+1)*3*Natoms,len(yy)+ii*3*Natoms:len(yy)+(ii+1)*3*Natoms] += value_and_derivatives['Hessian']
-            for jj in range(ii+1,len(yy)):
-                value_and_derivatives = self.kernel_function(xyz[ii],xyz[jj],calculate_value=self.train_property,calculate_gradients=self.train_xyz_derivative_property,calculate_Hessian=self.train_xyz_derivative_property,calculate_gradients_j=self.train_xyz_derivative_property,**self.kernel_function_kwargs)
-                kernel_matrix[ii][jj] += value_and_derivatives['value']
-                kernel_matrix[jj][ii] += value_and_derivatives['value']
+                raise ValueError('Nystrom approximation is only implemented for training on values')
+            self.train_nystrom(xyz, yy, Req, settings, nystrom_rank)
+            return
+
+        descriptors, jacobians = RE_descriptors_and_jacobians(xyz, Req, calculate_jacobians=self.train_xyz_derivative_property)
+        ndim = 3*Natoms
+        Ny = len(yy)
+        kernel_matrix = np.identity(self.kernel_matrix_size)*self.hyperparameters['lambda'].value
+        for tile_a in tiles(Ny, self.tile_size):
+            for tile_b in tiles(Ny, self.tile_size):
+                if tile_b.start < tile_a.start: continue
+                blocks = kernel_blocks(descriptors[tile_a], descriptors[tile_b],
+                                       Ja=None if jacobians is None else jacobians[tile_a],
+                                       Jb=None if jacobians is None else jacobians[tile_b],
+                                       calculate_gradients_a=self.train_xyz_derivative_property,
+                                       calculate_hessian=self.train_xyz_derivative_property, **settings)
+                kernel_matrix[tile_a, tile_b] += blocks['value']
+                if tile_b.start != tile_a.start:
+                    kernel_matrix[tile_b, tile_a] += blocks['value'].T
                 if self.train_xyz_derivative_property:
-                    kernel_matrix[jj,len(yy)+ii*3*Natoms:len(yy)+(ii+1)*3*Natoms] = value_and_derivatives['gradients'].reshape(3*Natoms)
-                    kernel_matrix[ii,len(yy)+jj*3*Natoms:len(yy)+(jj+1)*3*Natoms] = value_and_derivatives['gradients_j'].reshape(3*Natoms)
-                    kernel_matrix[len(yy)+ii*3*Natoms:len(yy)+(ii+1)*3*Natoms,len(yy)+jj*3*Natoms:len(yy)+(jj+1)*3*Natoms] += value_and_derivatives['Hessian']
-                    kernel_matrix[len(yy)+jj*3*Natoms:len(yy)+(jj+1)*3*Natoms,len(yy)+ii*3*Natoms:len(yy)+(ii+1)*3*Natoms] += value_and_derivatives['Hessian']
+                    # Row b, column block a: dk(a,b)/dR_a
+                    gradients_a = blocks['gradients_a']
+                    kernel_matrix[tile_b, Ny+tile_a.start*ndim:Ny+tile_a.stop*ndim] = \
+                        gradients_a.transpose(1, 0, 2).reshape(len(range(Ny)[tile_b]), -1)
+                    hessian = blocks['hessian'].transpose(0, 2, 1, 3).reshape(len(range(Ny)[tile_a])*ndim, len(range(Ny)[tile_b])*ndim)
+                    rows = slice(Ny+tile_a.start*ndim, Ny+tile_a.stop*ndim)
+                    columns = slice(Ny+tile_b.start*ndim, Ny+tile_b.stop*ndim)
+                    kernel_matrix[rows, columns] += hessian
+                    if tile_b.start != tile_a.start:
+                        kernel_matrix[columns, rows] += hessian.T
+                        blocks_ba = kernel_blocks(descriptors[tile_b], descriptors[tile_a], Ja=jacobians[tile_b],
+                                                  calculate_gradients_a=True, **settings)
+                        kernel_matrix[tile_a, Ny+tile_b.start*ndim:Ny+tile_b.stop*ndim] = \
+                            blocks_ba['gradients_a'].transpose(1, 0, 2).reshape(len(range(Ny)[tile_a]), -1)
         if self.train_xyz_derivative_property:
-            kernel_matrix[len(yy):,:len(yy)] = kernel_matrix[:len(yy),len(yy):].T
+            kernel_matrix[Ny:,:Ny] = kernel_matrix[:Ny,Ny:].T
 
 
         if invert_matrix:
@@ -620,7 +758,7 @@ class krr(ml_model):
             from scipy.linalg import cho_factor, cho_solve, lu_factor, lu_solve
             if matrix_decomposition==None:
                 try:
-                    c, low = cho_factor(kernel_matrix, overwrite_a=True, check_finite=False)
+                    c, low = cho_factor(kernel_matrix, overwrite_a=False, check_finite=False)
                     self.alphas = cho_solve((c, low), yyref, check_finite=False)
                 except:
                     c, low = lu_factor(kernel_matrix, overwrite_a=True, check_finite=False)
@@ -631,6 +769,28 @@ class krr(ml_model):
             elif matrix_decomposition.casefold()=='LU'.casefold():
                 c, low = lu_factor(kernel_matrix, overwrite_a=True, check_finite=False)
                 self.alphas = lu_solve((c, low), yyref, check_finite=False)
+
+    def train_nystrom(self, xyz, yy, Req, settings, nystrom_rank):
+        '''
+        Nystrom approximation: the model is expanded in kernels of nystrom_rank landmark structures,
+        (K_nm^T K_nm + lambda K_mm) alphas = K_nm^T y.
+        '''
+        from scipy.linalg import cho_factor, cho_solve, lstsq
+        landmarks = np.sort(np.random.default_rng(0).choice(len(xyz), size=nystrom_rank, replace=False))
+        descriptors, _ = RE_descriptors_and_jacobians(xyz, Req, calculate_jacobians=False)
+        K_nm = np.zeros((len(xyz), nystrom_rank))
+        for tile_a in tiles(len(xyz), self.tile_size):
+            K_nm[tile_a] = kernel_blocks(descriptors[tile_a], descriptors[landmarks], **settings)['value']
+        K_mm = K_nm[landmarks]
+        lhs = K_nm.T @ K_nm + self.hyperparameters['lambda'].value * K_mm
+        rhs = K_nm.T @ yy
+        try:
+            self.alphas = cho_solve(cho_factor(lhs, check_finite=False), rhs, check_finite=False)
+        except:
+            self.alphas = lstsq(lhs, rhs, check_finite=False)[0]
+        self.train_xyz = xyz[landmarks]
+        self.Ntrain = nystrom_rank
+        self.kernel_matrix_size = nystrom_rank
             
     def predict(self, molecular_database=None, molecule=None,
                 calculate_energy=False, calculate_energy_gradients=False,  calculate_hessian=False, # arguments if KREG is used as MLP ; hessian not implemented (possible with numerical differentiation)
@@ -640,30 +800,33 @@ class krr(ml_model):
             super().predict(molecular_database=molecular_database, molecule=molecule, calculate_energy=calculate_energy, calculate_energy_gradients=calculate_energy_gradients, calculate_hessian=calculate_hessian, property_to_predict = property_to_predict, xyz_derivative_property_to_predict = xyz_derivative_property_to_predict, hessian_to_predict = hessian_to_predict)
 
         Natoms = len(molDB.molecules[0].atoms)
-        kk_size = 0 
-        if self.train_property:
-            kk_size += self.Ntrain 
-        if self.train_xyz_derivative_property:
-            kk_size += self.Ntrain * Natoms*3
-
-        for mol in molDB.molecules:
-            kk = np.zeros(kk_size)
-            kk_der = np.zeros((kk_size,3*Natoms))
-            for ii in range(self.Ntrain):
-                value_and_derivatives = self.kernel_function(self.train_xyz[ii],mol.xyz_coordinates,calculate_gradients=self.train_xyz_derivative_property,**self.kernel_function_kwargs)
-                kk[ii] = value_and_derivatives['value']
-                if self.train_xyz_derivative_property:
-                    kk[self.Ntrain+ii*3*Natoms:self.Ntrain+(ii+1)*3*Natoms] = value_and_derivatives['gradients'].reshape(3*Natoms)
-
-                if xyz_derivative_property_to_predict:
-                    value_and_derivatives = self.kernel_function(mol.xyz_coordinates,self.train_xyz[ii],calculate_gradients=bool(xyz_derivative_property_to_predict),calculate_Hessian=self.train_xyz_derivative_property,**self.kernel_function_kwargs)
-                    kk_der[ii] = value_and_derivatives['gradients'].reshape(3*Natoms)
+        ndim = 3*Natoms
+        settings = self.kernel_settings()
+        Req = self.kernel_function_kwargs['Req']
+        calculate_gradients = bool(xyz_derivative_property_to_predict)
+        train_descriptors, train_jacobians = RE_descriptors_and_jacobians(self.train_xyz, Req, calculate_jacobians=self.train_xyz_derivative_property)
+        alphas_values = self.alphas[:self.Ntrain]
+        alphas_gradients = self.alphas[self.Ntrain:].reshape(self.Ntrain, ndim) if self.train_xyz_derivative_property else None
+
+        xyz = np.array([mol.xyz_coordinates for mol in molDB.molecules]).astype(float)
+        for tile in tiles(len(xyz), self.tile_size):
+            descriptors, jacobians = RE_descriptors_and_jacobians(xyz[tile], Req, calculate_jacobians=calculate_gradients)
+            blocks = kernel_blocks(train_descriptors, descriptors, Ja=train_jacobians, Jb=jacobians,
+                                   calculate_gradients_a=self.train_xyz_derivative_property,
+                                   calculate_gradients_b=calculate_gradients,
+                                   calculate_hessian=self.train_xyz_derivative_property and calculate_gradients, **settings)
+            values = alphas_values @ blocks['value'] + self.prior
+            if self.train_xyz_derivative_property:
+                values += np.einsum('ad,abd->b', alphas_gradients, blocks['gradients_a'])
+            if calculate_gradients:
+                gradients = np.einsum('a,abd->bd', alphas_values, blocks['gradients_b'])
                 if self.train_xyz_derivative_property:
-                    kk_der[self.Ntrain+ii*3*Natoms:self.Ntrain+(ii+1)*3*Natoms,:] = value_and_derivatives['Hessian'].T
-            gradients = np.matmul(self.alphas.reshape(1,len(self.alphas)),kk_der)[0]
-            mol.__dict__[property_to_predict] = np.sum(np.multiply(self.alphas, kk))+self.prior
-            for iatom in range(len(mol.atoms)):
-                mol.atoms[iatom].__dict__[xyz_derivative_property_to_predict] = gradients[3*iatom:3*iatom+3]
+                    gradients += np.einsum('ad,abde->be', alphas_gradients, blocks['hessian'])
+            for imol, mol in enumerate(molDB.molecules[tile]):
+                if property_to_predict: mol.__dict__[property_to_predict] = values[imol]
+                if calculate_gradients:
+                    for iatom in range(len(mol.atoms)):
+                        mol.atoms[iatom].__dict__[xyz_derivative_property_to_predict] = gradients[imol][3*iatom:3*iatom+3]
     
     def gaussian_kernel_function(self,coordi,coordj,calculate_value=True,calculate_gradients=False,calculate_gradients_j=False,calculate_Hessian=False,**kwargs):
         if 'Req' in kwargs:
@@ -458,7 +458,24 @@ class thermochemistry():
         self.molecule.ZPE_exclusive_atomization_energy_0K = atomization_energy + self.molecule.ZPE
         self.molecule.DeltaHf298 = DeltaHf298
         
-def numerical_gradients(molecule, model_with_function_to_predict_energy, eps=1e-5, kwargs_funtion_predict_energy={}, return_molecular_database=False):
+def numerical_gradients(molecule, model_with_function_to_predict_energy, eps=1e-5, kwargs_funtion_predict_energy={}, return_molecular_database=False,
+                        batched=False, difference='forward', parallel=False, nthreads=None):
+    '''
+    Finite-difference energy gradients.
+
+    With ``batched=True`` all displaced geometries are collected in one molecular database and predicted
+    with a single call of the model (or via :func:`run_in_parallel` with ``parallel=True``, e.g., for external programs).
+    ``difference`` can be 'forward' (3N+1 energies) or 'central' (6N energies) and is only used in the batched path.
+    '''
+    if batched:
+        coordinates = molecule.xyz_coordinates.reshape(-1)
+        displacements = finite_difference_displacements(len(coordinates), eps, difference)
+        molDB = displaced_molecular_database(molecule, coordinates + displacements)
+        energies, _ = predict_for_molecular_database(molDB, model_with_function_to_predict_energy, kwargs_funtion_predict_energy,
+                                                     parallel=parallel, nthreads=nthreads)
+        gradients = finite_difference_derivatives(energies, eps, difference)
+        if return_molecular_database: return gradients.reshape(-1,3), molDB
+        else:                         return gradients.reshape(-1,3)
     if return_molecular_database:
         molDB = data.molecular_database()
     coordinates = molecule.xyz_coordinates.reshape(-1)
@@ -489,7 +506,38 @@ def numerical_gradients(molecule, model_with_function_to_predict_energy, eps=1e-
     if return_molecular_database: return gradients.reshape(natoms,3), molDB
     else:                         return gradients.reshape(natoms,3)
 
-def numerical_hessian(molecule, model_with_function_to_predict_energy, eps=5.29167e-4, epsgrad=1e-5, kwargs_funtion_predict_energy={}):
+def numerical_hessian(molecule, model_with_function_to_predict_energy, eps=5.29167e-4, epsgrad=1e-5, kwargs_funtion_predict_energy={},
+                      batched=False, difference='forward', symmetrize=False, use_analytical_gradients=False, parallel=False, nthreads=None):
+    '''
+    Finite-difference Hessian.
+
+    With ``batched=True`` all displaced geometries are predicted with a single call of the model (or via :func:`run_in_parallel`
+    with ``parallel=True``). If ``use_analytical_gradients=True``, the model's energy gradients of the 3N+1 (forward) or 6N (central)
+    displaced geometries are differentiated; otherwise the gradients themselves are obtained by finite differences of energies
+    with step ``epsgrad``. ``symmetrize=True`` returns (H + H^T)/2.
+    '''
+    if batched:
+        coordinates = molecule.xyz_coordinates.reshape(-1)
+        ndim = len(coordinates)
+        outer_displacements = finite_difference_displacements(ndim, eps, difference)
+        if use_analytical_gradients:
+            molDB = displaced_molecular_database(molecule, coordinates + outer_displacements)
+            kwargs = dict(kwargs_funtion_predict_energy, calculate_energy_gradients=True)
+            _, gradients = predict_for_molecular_database(molDB, model_with_function_to_predict_energy, kwargs,
+                                                          parallel=parallel, nthreads=nthreads, calculate_energy_gradients=True)
+            gradients = gradients.reshape(len(outer_displacements), ndim)
+        else:
+            inner_displacements = finite_difference_displacements(ndim, epsgrad, difference)
+            displaced_coordinates = coordinates + outer_displacements[:, np.newaxis, :] + inner_displacements[np.newaxis, :, :]
+            molDB = displaced_molecular_database(molecule, displaced_coordinates.reshape(-1, ndim))
+            energies, _ = predict_for_molecular_database(molDB, model_with_function_to_predict_energy, kwargs_funtion_predict_energy,
+                                                         parallel=parallel, nthreads=nthreads)
+            energies = energies.reshape(len(outer_displacements), len(inner_displacements))
+            gradients = finite_difference_derivatives(energies.T, epsgrad, difference).T
+        hess = finite_difference_derivatives(gradients, eps, difference).T
+        if symmetrize: hess = 0.5 * (hess + hess.T)
+        return hess
+
     g1 = numerical_gradients(molecule, model_with_function_to_predict_energy, epsgrad, kwargs_funtion_predict_energy)
     coordinates1 = molecule.xyz_coordinates.reshape(-1)
     ndim = len(coordinates1)
@@ -504,4 +552,59 @@ def numerical_hessian(molecule, model_with_function_to_predict_energy, eps=5.291
         hess[:, i] = (g2.reshape(-1) - g1.reshape(-1)) / eps
         coordinates2[i] = x0
 
+    if symmetrize: hess = 0.5 * (hess + hess.T)
     return hess
+
+def finite_difference_displacements(ndim, eps, difference='forward'):
+    '''
+    Displacement vectors: +eps along every coordinate followed by the undisplaced geometry (forward)
+    or by -eps along every coordinate (central).
+    '''
+    if difference.casefold() == 'forward':
+        return np.vstack((np.eye(ndim) * eps, np.zeros((1, ndim))))
+    elif difference.casefold() == 'central':
+        return np.vstack((np.eye(ndim) * eps, -np.eye(ndim) * eps))
+    else:
+        raise ValueError(f'Unknown finite-difference scheme {difference}, use forward or central')
+
+def finite_difference_derivatives(values, eps, difference='forward'):
+    '''
+    Derivatives along the first axis of values evaluated at the displacements from :func:`finite_difference_displacements`.
+    '''
+    if difference.casefold() == 'forward':
+        ndim = len(values) - 1
+        return (values[:ndim] - values[ndim]) / eps
+    else:
+        ndim = len(values) // 2
+        return (values[:ndim] - values[ndim:]) / (2 * eps)
+
+def displaced_molecular_database(molecule, coordinates_list):
+    molDB = data.molecular_database()
+    natoms = len(molecule.atoms)
+    for coordinates in coordinates_list:
+        displaced_molecule = molecule.copy(atomic_labels=[], molecular_labels=[])
+        displaced_molecule.xyz_coordinates = coordinates.reshape(natoms, 3)
+        molDB.molecules.append(displaced_molecule)
+    return molDB
+
+def predict_energy_and_gradients(molecule=None, model=None, kwargs_predict={}, calculate_energy_gradients=False):
+    model.predict(molecule=molecule, **kwargs_predict)
+    if calculate_energy_gradients: return molecule.energy, molecule.get_energy_gradients()
+    else:                          return molecule.energy, None
+
+def predict_for_molecular_database(molecular_database, model, kwargs_predict={}, parallel=False, nthreads=None, calculate_energy_gradients=False):
+    '''
+    Energies (and gradients) of all molecules in a database from one call of the model or, with ``parallel=True``,
+    from independent calls distributed by :func:`run_in_parallel`.
+    '''
+    if parallel:
+        results = run_in_parallel(molecular_database=molecular_database, task=predict_energy_and_gradients,
+                                  task_kwargs={'model': model, 'kwargs_predict': kwargs_predict,
+                                               'calculate_energy_gradients': calculate_energy_gradients},
+                                  nthreads=nthreads)
+    else:
+        model.predict(molecular_database=molecular_database, **kwargs_predict)
+        results = [(mol.energy, mol.get_energy_gradients() if calculate_energy_gradients else None) for mol in molecular_database.molecules]
+    energies = np.array([result[0] for result in results]).astype(float)
+    gradients = np.array([result[1] for result in results]).astype(float) if calculate_energy_gradients else None
+    return energies, gradients
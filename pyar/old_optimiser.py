@@ -13,8 +13,9 @@ bulk_optimize(input_files, qc_params)
 import logging
 import os
 
-from pyar import file_manager
+from pyar import file_manager, profiling
 from pyar.Molecule import Molecule
+from pyar.interface import registry
 
 optimiser_logger = logging.getLogger('pyar.optimiser')
 
@@ -38,66 +39,34 @@ def optimise(molecule, qc_params):
         optimiser_logger.info(f'     {molecule.name:35s}: {molecule.energy:15.6f}')
         os.chdir(cwd)
         return True
-    software = qc_params['software']
-    
-    if software == 'mlatom_aiqm1':
-        from pyar.interface import mlatom_aiqm1
-        geometry = mlatom_aiqm1.MlatomAiqm1(molecule, qc_params)
-        # geometry.run()
-        # molecule.energy = geometry.energy
-        # molecule.coordinates = geometry.optimized_coordinates
-        # optimiser_logger.info(f'     {molecule.name:35s}: {geometry.energy:15.6f}')
-        
-        # os.chdir(cwd)
-        # return True
-    
-    elif software == "orca":
-        from pyar.interface import orca
-        geometry = orca.Orca(molecule, qc_params)
-    elif software == "xtb":
-        from pyar.interface import xtb
-        geometry = xtb.Xtb(molecule, qc_params)
-    elif software == 'xtb_turbo':
-        from pyar.interface import xtbturbo
-        geometry = xtbturbo.XtbTurbo(molecule, qc_params)
-    elif software == 'turbomole':
-        from pyar.interface import turbomole
-        geometry = turbomole.Turbomole(molecule, qc_params)
-    elif software == "mopac":
-        from pyar.interface import mopac
-        geometry = mopac.Mopac(molecule, qc_params)
-    elif software == "aimnet_2":
-        from pyar.interface import aimnet_2
-        geometry = aimnet_2.Aimnet2(molecule, qc_params)
-    elif software == "aiqm1_mlatom":
-         from pyar.interface import aiqm1_mlatom
-         geometry = aiqm1_mlatom.AIQM1(molecule, qc_params) # noqa: F401
-    elif software == "xtb-aimnet2":
-        from pyar.interface import xtb_aimnet2
-        geometry = xtb_aimnet2.XtbAimnet2(molecule, qc_params)
-    elif software == "xtb-aiqm1":
-        from pyar.interface import xtb_aiqm1
-        geometry = xtb_aiqm1.XtbAIQM1(molecule, qc_params)
-    elif software == 'obabel': 
-        from pyar.interface import babel
-        geometry = babel.OBabel(molecule)
-    
-    
-    optimize_status = geometry.optimize()
-    # if optimize_status is True or optimize_status == 'converged' or optimize_status == 'CycleExceeded':
-    if optimize_status is True:
-        molecule.energy = geometry.energy
-        # molecule.coordinates = geometry.optimized_coordinates
-        optimiser_logger.info(f'     {molecule.name:35s}: {float(geometry.energy):15.6f}')
-        # optimiser_logger.info(f'     {molecule.name:35s}: {geometry.energy}')
-    # elif optimize_status == 'SCFFailed':
-    #     from numpy.random import uniform
-    #     molecule.coordinates += uniform(-0.1, 0.1, (molecule.number_of_atoms, 3))
-    #     os.chdir(cwd)
-    #     optimize_status = optimise(molecule, qc_params)
-    else:
-        molecule.energy = None
-        molecule.coordinates = None
+    with file_manager.JobScratch(qc_params['software']) as scratch:
+        geometry = registry.make_geometry(molecule, qc_params)
+
+        with profiling.span(f"engine.{qc_params['software']}", molecule=molecule.name):
+            optimize_status = geometry.optimize()
+        profiling.count(f"status.{optimize_status}")
+        # if optimize_status is True or optimize_status == 'converged' or optimize_status == 'CycleExceeded':
+        if optimize_status is True:
+            molecule.energy = geometry.energy
+            # molecule.coordinates = geometry.optimized_coordinates
+            optimiser_logger.info(f'     {molecule.name:35s}: {float(geometry.energy):15.6f}')
+            # optimiser_logger.info(f'     {molecule.name:35s}: {geometry.energy}')
+        # elif optimize_status == 'SCFFailed':
+        #     from numpy.random import uniform
+        #     molecule.coordinates += uniform(-0.1, 0.1, (molecule.number_of_atoms, 3))
+        #     os.chdir(cwd)
+        #     optimize_status = optimise(molecule, qc_params)
+        elif optimize_status == 'CycleExceeded':
+            # Keep the partial energy so that the block optimization scheduler
+            # can rank the unfinished orientations
+            try:
+                molecule.energy = geometry.energy
+            except Exception:
+                molecule.energy = None
+        else:
+            molecule.energy = None
+            molecule.coordinates = None
+        scratch.succeeded = optimize_status is True or optimize_status == 'CycleExceeded'
     os.chdir(cwd)
     return optimize_status
 
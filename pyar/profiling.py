@@ -0,0 +1,149 @@
+"""
+Timing and profiling of a pyar run.
+
+Phases of the run are wrapped in spans (trial generation, QC jobs, output
+parsing, deduplication, clustering, checkpointing, ...), either with the
+span context manager or the timed decorator, and events are counted with
+count.  Totals are kept in memory, and if PYAR_TRACE names a file (pyar-cli
+--trace) every span and counter is appended to it as a JSON line, so that
+the pathway worker processes write to the same trace.  At the end of the
+run summary() gives the time per phase, and chrome_trace() converts the
+trace for chrome://tracing or Perfetto.
+
+    with profiling.span('tabu.trial_geometries', orientations=8):
+        ...
+
+    @profiling.timed('clustering.choose_geometries')
+    def choose_geometries(...):
+        ...
+"""
+import collections
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+profiling_logger = logging.getLogger('pyar.profiling')
+
+_totals = collections.defaultdict(lambda: [0, 0.0])
+_counters = collections.defaultdict(float)
+_lock = threading.Lock()
+_trace = {'pid': None, 'path': None, 'file': None}
+
+
+def trace_file():
+    return os.environ.get('PYAR_TRACE')
+
+
+def _write(record):
+    """Append a record to the trace, reopening the file in a forked worker or if PYAR_TRACE changed"""
+    path = trace_file()
+    if not path:
+        return
+    with _lock:
+        if _trace['pid'] != os.getpid() or _trace['path'] != path or _trace['file'] is None:
+            if _trace['file'] is not None and _trace['pid'] == os.getpid():
+                _trace['file'].close()
+            _trace['file'] = open(path, 'a')
+            _trace['pid'] = os.getpid()
+            _trace['path'] = path
+        _trace['file'].write(json.dumps(record) + '\n')
+        _trace['file'].flush()
+
+
+@contextmanager
+def span(name, **args):
+    """Time the block as a phase called name; args are stored in the trace"""
+    start = time.time()
+    try:
+        yield
+    finally:
+        duration = time.time() - start
+        with _lock:
+            _totals[name][0] += 1
+            _totals[name][1] += duration
+        _write({'name': name, 'start': start, 'duration': duration, 'pid': os.getpid(),
+                'tid': threading.get_ident(), 'args': args})
+
+
+def timed(name):
+    """Decorator timing every call of the function as a span called name"""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, value=1):
+    """Add value to the counter called name"""
+    with _lock:
+        _counters[name] += value
+        total = _counters[name]
+    _write({'name': name, 'counter': total, 'increment': value, 'time': time.time(), 'pid': os.getpid()})
+
+
+def read_trace(path):
+    records = []
+    with open(path) as fp:
+        for line in fp:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # A line cut short by a killed worker
+                continue
+    return records
+
+
+def totals(path=None):
+    """
+    Calls and seconds of every span and the value of every counter, from
+    the trace at path (all the processes of the run) or from this process
+    """
+    if path is None:
+        return {name: tuple(value) for name, value in _totals.items()}, dict(_counters)
+    spans = collections.defaultdict(lambda: [0, 0.0])
+    counters = collections.defaultdict(float)
+    for record in read_trace(path):
+        if 'duration' in record:
+            spans[record['name']][0] += 1
+            spans[record['name']][1] += record['duration']
+        else:
+            counters[record['name']] += record['increment']
+    return {name: tuple(value) for name, value in spans.items()}, dict(counters)
+
+
+def summary(path=None):
+    """Table of the time spent in every phase, longest first"""
+    spans, counters = totals(path)
+    lines = [f"{'Phase':40s} {'Calls':>8s} {'Total (s)':>12s} {'Mean (s)':>10s}"]
+    for name, (calls, seconds) in sorted(spans.items(), key=lambda item: -item[1][1]):
+        lines.append(f"{name:40s} {calls:8d} {seconds:12.2f} {seconds / calls:10.4f}")
+    if counters:
+        lines.append(f"{'Counter':40s} {'Value':>8s}")
+        for name, value in sorted(counters.items()):
+            lines.append(f"{name:40s} {value:8g}")
+    return '\n'.join(lines)
+
+
+def chrome_trace(path, output):
+    """Convert the JSON-lines trace at path to the Chrome trace event format"""
+    events = []
+    for record in read_trace(path):
+        if 'duration' in record:
+            events.append({'name': record['name'], 'cat': record['name'].split('.')[0], 'ph': 'X',
+                           'ts': record['start'] * 1e6, 'dur': record['duration'] * 1e6,
+                           'pid': record['pid'], 'tid': record['tid'], 'args': record['args']})
+        else:
+            events.append({'name': record['name'], 'ph': 'C', 'ts': record['time'] * 1e6,
+                           'pid': record['pid'], 'args': {record['name']: record['counter']}})
+    with open(output, 'w') as fp:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fp)
@@ -51,25 +51,42 @@ def get_distance_list(coordinates):
 
 
 def get_distance_matrix(coordinates):
-    dm = np.zeros((len(coordinates), len(coordinates)))
-    for i, c in enumerate(coordinates):
-        for j, d in enumerate(coordinates):
-            dm[i, j] = np.linalg.norm(c - d)
-    return dm
+    return scipy_distance.squareform(scipy_distance.pdist(coordinates))
 
 
 def get_bond_matrix(coordinates, covalent_radius):
     """return bond matrix"""
     dm = get_distance_matrix(coordinates)
-    bm = np.zeros((len(coordinates), len(coordinates)), dtype=int)
-    for i, c in enumerate(coordinates):
-        for j, d in enumerate(coordinates):
-            sum_of_covalent_radii = (covalent_radius[i] + covalent_radius[j]) * 1.3
-            if i != j and dm[i, j] < sum_of_covalent_radii:
-                bm[i, j] = 1
+    covalent_radius = np.asarray(covalent_radius, dtype=float)
+    sum_of_covalent_radii = (covalent_radius[:, np.newaxis] + covalent_radius[np.newaxis, :]) * 1.3
+    bm = (dm < sum_of_covalent_radii).astype(int)
+    np.fill_diagonal(bm, 0)
     return bm
 
 
+def get_bond_list(coordinates, covalent_radius):
+    """
+    Bonded atom pairs (i < j) found with a k-d tree, so that the cost
+    grows with the number of atoms instead of its square.
+
+    :return: (number_of_bonds, 2) array of atom indices in lexicographic order
+    """
+    from scipy.spatial import cKDTree
+    coordinates = np.asarray(coordinates, dtype=float)
+    covalent_radius = np.asarray(covalent_radius, dtype=float)
+    if len(coordinates) < 2:
+        return np.zeros((0, 2), dtype=int)
+    cutoff = 2 * covalent_radius.max() * 1.3
+    pairs = cKDTree(coordinates).query_pairs(cutoff, output_type='ndarray')
+    if len(pairs) == 0:
+        return np.zeros((0, 2), dtype=int)
+    pairs = np.sort(pairs, axis=1)
+    lengths = np.linalg.norm(coordinates[pairs[:, 0]] - coordinates[pairs[:, 1]], axis=1)
+    bonded = lengths < (covalent_radius[pairs[:, 0]] + covalent_radius[pairs[:, 1]]) * 1.3
+    pairs = pairs[bonded]
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
 def get_connectivity(coordinates, covalent_radius):
     """return connection graph"""
     import collections
@@ -90,6 +107,14 @@ def calculate_angle(a1, b1, c1):
             np.linalg.norm(v1) * np.linalg.norm(v2))) * 180 / pi
 
 
+def calculate_angles(a1, b1, c1):
+    """Vectorised calculate_angle for (M, 3) arrays of points"""
+    v1 = c1 - b1
+    v2 = c1 - a1
+    cos_theta = np.einsum('ij,ij->i', v1, v2) / (np.linalg.norm(v1, axis=1) * np.linalg.norm(v2, axis=1))
+    return np.arccos(cos_theta) * 180 / pi
+
+
 def hydrogen_bond_analysis(coordinates, covalent_radius, atomic_number, atoms_list):
     """return bond matrix"""
     dm = get_distance_matrix(coordinates)
@@ -126,3 +151,18 @@ def calculate_dihedral(p0, p1, p2, p3):
     x = np.dot(v, w)
     y = np.dot(np.cross(v, b1), w)
     return np.degrees(np.arctan2(y, x))
+
+
+def calculate_dihedrals(p0, p1, p2, p3):
+    """Vectorised calculate_dihedral for (M, 3) arrays of points"""
+    b0 = -1.0 * (p1 - p0)
+    b1 = p2 - p1
+    b2 = p3 - p2
+    b1 = b1 / np.linalg.norm(b1, axis=1)[:, np.newaxis]
+
+    v = b0 - np.einsum('ij,ij->i', b0, b1)[:, np.newaxis] * b1
+    w = b2 - np.einsum('ij,ij->i', b2, b1)[:, np.newaxis] * b1
+
+    x = np.einsum('ij,ij->i', v, w)
+    y = np.einsum('ij,ij->i', np.cross(v, b1), w)
+    return np.degrees(np.arctan2(y, x))
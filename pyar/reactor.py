@@ -8,7 +8,7 @@ import numpy as np
 from pyar.checkpt import dumpchk, readchk, updtchk
 import pyar.interface.babel
 import pyar.scan
-from pyar import tabu, file_manager
+from pyar import tabu, file_manager, profiling
 from pyar.data_analysis import clustering
 from pyar.optimiser import optimise
 
@@ -23,6 +23,7 @@ def print_header(gamma_max, gamma_min, hm_orientations, software):
     pass
 
 
+@profiling.timed('reactor.react')
 def react(reactant_a, reactant_b, gamma_min, gamma_max, hm_orientations, qc_params,
           site, proximity_factor, tabu_on=None, grid_on=None):
     """
@@ -132,6 +133,7 @@ def react(reactant_a, reactant_b, gamma_min, gamma_max, hm_orientations, qc_para
     return
 
 
+@profiling.timed('reactor.optimize_all')
 def optimize_all(gamma_id, orientations, chkdict, product_dir, qc_param):
     gamma = qc_param['gamma']
     cwd = os.getcwd()
@@ -52,36 +52,47 @@ def get_rsmd(mol):
 
 def make_internal_coordinates(mol):
     """
-
+    Bonds, angles and dihedrals from a sparse bond graph: angles are built
+    from pairs of neighbours of each atom and dihedrals from the neighbour
+    sets of the two ends of each bond, so the cost scales with the number
+    of bonds.
 
     :rtype: list of internal coordinates
     """
-    coordinates = mol.coordinates
+    coordinates = np.asarray(mol.coordinates, dtype=float)
     covalent_radius = mol.covalent_radius
-    dm = pyar.property.get_distance_matrix(coordinates)
-    bm = pyar.property.get_bond_matrix(coordinates, covalent_radius)
-    bl = []
-    for a_i, a_j in product(range(len(coordinates)), range(len(coordinates))):
-        if bm[a_i, a_j]:
-            seq = [a_i, a_j]
-            if seq[::-1] not in [i[0] for i in bl]:
-                bl.append([seq, dm[a_i, a_j]])
-    al = []
-    for a_i, a_j, k in product(range(len(coordinates)), repeat=3):
-        if a_i != a_j and a_j != k and a_i != k and bm[a_i, a_j] and bm[a_j, k]:
-            seq = [a_i, a_j, k]
-            if seq[::-1] not in [i[0] for i in al]:
-                al.append([seq, pyar.property.calculate_angle(coordinates[a_i], coordinates[a_j], coordinates[k])])
-
-    dl = []
-    for a_i, a_j, k, l in product(range(len(coordinates)), repeat=4):
-        if a_i != a_j and a_i != k and a_i != l and a_j != k and a_j != l and k != l and bm[a_i, a_j] and bm[a_j, k] and bm[k, l]:
-            seq = [a_i, a_j, k, l]
-            if seq[::-1] not in [i[0] for i in dl]:
-                dl.append([seq, pyar.property.calculate_dihedral(a_i, a_j, k, l)])
+    bonds = pyar.property.get_bond_list(coordinates, covalent_radius)
+    neighbours = [[] for _ in range(len(coordinates))]
+    for a_i, a_j in bonds:
+        neighbours[a_i].append(a_j)
+        neighbours[a_j].append(a_i)
+
+    bond_lengths = np.linalg.norm(coordinates[bonds[:, 0]] - coordinates[bonds[:, 1]], axis=1)
+    bl = [[[int(a_i), int(a_j)], d] for (a_i, a_j), d in zip(bonds, bond_lengths)]
+
+    angles = [(a_i, a_j, k) for a_j in range(len(coordinates))
+              for a_i, k in itertools.combinations(sorted(neighbours[a_j]), 2)]
+    angles = _lexsorted(angles, 3)
+    angle_values = pyar.property.calculate_angles(coordinates[angles[:, 0]], coordinates[angles[:, 1]],
+                                                  coordinates[angles[:, 2]])
+    al = [[[int(i) for i in seq], v] for seq, v in zip(angles, angle_values)]
+
+    dihedrals = []
+    for a_j, k in bonds:
+        for a_i, l in product(neighbours[a_j], neighbours[k]):
+            if a_i != k and l != a_j and a_i != l:
+                dihedrals.append((a_i, a_j, k, l) if a_i < l else (l, k, a_j, a_i))
+    dihedrals = _lexsorted(dihedrals, 4)
+    dihedral_values = pyar.property.calculate_dihedrals(*(coordinates[dihedrals[:, n]] for n in range(4)))
+    dl = [[[int(i) for i in seq], v] for seq, v in zip(dihedrals, dihedral_values)]
     return [bl, al, dl]
 
 
+def _lexsorted(index_tuples, width):
+    indices = np.array(index_tuples, dtype=int).reshape(-1, width)
+    return indices[np.lexsort(indices.T[::-1])]
+
+
 def sorted_coulomb_matrix(cm):
     """
     From: https://github.com/pythonpanda/coulomb_matrix/
@@ -98,26 +109,84 @@ def sorted_coulomb_matrix(cm):
     return sorted_matrix.ravel()
 
 
+def atomic_charges(atoms_list):
+    from pyar.data import new_atomic_data as atomic_data
+    return np.array([atomic_data.atomic_number[c.capitalize()] if isinstance(c, str) else c for c in atoms_list],
+                    dtype=float)
+
+
 def coulomb_matrix(atoms_list, coordinates):
     """
 
     :return: Coulomb Matrix
 
     """
-    from pyar.data import new_atomic_data as atomic_data
-    # charges = [atomic_data.atomic_number[c.capitalize()] for c in atoms_list]
-    charges = [atomic_data.atomic_number[c.capitalize()] if isinstance(c, str) else c for c in atoms_list]
-    number_of_atoms = len(atoms_list)
-    coords = coordinates
-    c_matrix = np.zeros((number_of_atoms, number_of_atoms))
-    for i, j in product(range(number_of_atoms), range(number_of_atoms)):
-        if i == j:
-            c_matrix[i, j] = 0.5 * charges[i]**2.4
-        else:
-            r_ij = np.linalg.norm(coords[i, :] - coords[j, :])
-            c_matrix[i, j] = charges[i] * charges[j] / r_ij
+    charges = atomic_charges(atoms_list)
+    coords = np.asarray(coordinates, dtype=float)
+    return coulomb_matrices(charges[np.newaxis, :], coords[np.newaxis, :, :])[0]
+
+
+def coulomb_matrices(charges, coordinates, mask=None):
+    """
+    Coulomb matrices of a stack of molecules built with broadcasting.
+
+    :param charges: (B, N) nuclear charges, zero for padding atoms
+    :param coordinates: (B, N, 3) coordinates, padded to the largest molecule
+    :param mask: (B, N) True for real atoms; defaults to charges != 0
+    :return: (B, N, N) Coulomb matrices, rows and columns of padding atoms are zero
+    """
+    charges = np.asarray(charges, dtype=float)
+    coordinates = np.asarray(coordinates, dtype=float)
+    if mask is None:
+        mask = charges != 0
+    number_of_atoms = charges.shape[1]
+    r_ij = np.linalg.norm(coordinates[:, :, np.newaxis, :] - coordinates[:, np.newaxis, :, :], axis=-1)
+    pair_mask = mask[:, :, np.newaxis] & mask[:, np.newaxis, :]
+    off_diagonal = pair_mask & ~np.eye(number_of_atoms, dtype=bool)
+    c_matrix = np.zeros_like(r_ij)
+    np.divide(charges[:, :, np.newaxis] * charges[:, np.newaxis, :], r_ij, out=c_matrix, where=off_diagonal)
+    diagonal = np.arange(number_of_atoms)
+    c_matrix[:, diagonal, diagonal] = np.where(mask, 0.5 * charges ** 2.4, 0.0)
     return c_matrix
 
+
+def pad_molecules(atoms_lists, coordinates_list):
+    """
+    Stack molecules with different numbers of atoms.
+
+    :return: charges (B, N), coordinates (B, N, 3) and mask (B, N)
+    """
+    number_of_atoms = np.array([len(atoms_list) for atoms_list in atoms_lists])
+    n_max = number_of_atoms.max()
+    charges = np.zeros((len(atoms_lists), n_max))
+    coordinates = np.zeros((len(atoms_lists), n_max, 3))
+    mask = np.arange(n_max)[np.newaxis, :] < number_of_atoms[:, np.newaxis]
+    for i, (atoms_list, coords) in enumerate(zip(atoms_lists, coordinates_list)):
+        charges[i, :number_of_atoms[i]] = atomic_charges(atoms_list)
+        coordinates[i, :number_of_atoms[i]] = coords
+    return charges, coordinates, mask
+
+
+def fingerprints(atoms_lists, coordinates_list):
+    """
+    Coulomb-matrix eigenvalue fingerprints of many molecules at once.
+
+    Molecules are padded to the largest one; the eigenvalues are computed
+    with one eigvalsh call per distinct number of atoms so that padding
+    does not add spurious zero eigenvalues.
+
+    :return: (B, N_max) eigenvalues in descending order, zero padded
+    """
+    charges, coordinates, mask = pad_molecules(atoms_lists, coordinates_list)
+    c_matrices = coulomb_matrices(charges, coordinates, mask)
+    number_of_atoms = mask.sum(axis=1)
+    eigenvalues = np.zeros(mask.shape)
+    for n in np.unique(number_of_atoms):
+        selected = number_of_atoms == n
+        eigenvalues[selected, :n] = np.linalg.eigvalsh(c_matrices[selected, :n, :n])[:, ::-1]
+    return eigenvalues
+
+
 #last old version
 # def coulomb_matrix(atoms_list, coordinates):
 #     """
@@ -185,9 +254,8 @@ def coulomb_matrix(atoms_list, coordinates):
 
 
 def fingerprint(atoms_list, coordinates):
-    eigenvalues = np.linalg.eigvals(coulomb_matrix(atoms_list, coordinates))
-    # eigenvalues[::-1].sort()
-    eigenvalues = np.sort(eigenvalues)[::-1]
+    # The Coulomb matrix is symmetric, eigvalsh returns real eigenvalues in ascending order
+    eigenvalues = np.linalg.eigvalsh(coulomb_matrix(atoms_list, coordinates))[::-1]
     return eigenvalues
 
 def cutoff_func(r, Rc):
@@ -0,0 +1,188 @@
+"""
+Share the cores of the machine between concurrent QC jobs.
+
+The cores are split into (concurrent jobs x threads per job).  The thread
+count of a job is passed to the engines through the environment
+(OMP_NUM_THREADS, MKL_NUM_THREADS, ...) and, for the programs that read it
+from their input, through qc_params['nprocs'] (ORCA %pal, MOPAC THREADS).
+Optionally every job is pinned to its own set of cores.
+
+Functions
+---------
+
+available_cores()
+split_cores(jobs, threads_per_job, cores)
+thread_environment(threads, software)
+exported_threads()
+set_threads(threads, software, keep_existing)
+pin(cores)
+plan(software, qc_params, parallel_jobs, threads_per_job)
+plan_threads(software, qc_params, parallel_jobs, nprocs, calibrate)
+autotune(calibrate, cores, candidates, max_jobs)
+calibration_run(molecule, qc_params)
+"""
+import logging
+import os
+import time
+
+resources_logger = logging.getLogger('pyar.resources')
+
+# Engines built on xtb need a large OpenMP stack
+_xtb_engines = ('xtb', 'xtb_turbo', 'xtb-aimnet2', 'xtb-aiqm1')
+
+
+def available_cores():
+    """Cores this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split_cores(jobs, threads_per_job, cores=None):
+    """Disjoint sets of threads_per_job cores for each of the jobs, wrapping around if there are too few"""
+    cores = cores or available_cores()
+    return [tuple(cores[(i * threads_per_job + k) % len(cores)] for k in range(threads_per_job))
+            for i in range(jobs)]
+
+
+def thread_environment(threads, software=None):
+    """Environment variables setting the number of threads of a job"""
+    threads = str(threads)
+    environment = {'OMP_NUM_THREADS': threads,
+                   'MKL_NUM_THREADS': threads,
+                   'OPENBLAS_NUM_THREADS': threads}
+    if software in _xtb_engines:
+        environment['OMP_STACKSIZE'] = os.environ.get('OMP_STACKSIZE', '1G')
+        environment['OMP_MAX_ACTIVE_LEVELS'] = '1'
+    if software == 'turbomole':
+        environment['PARNODES'] = threads
+    return environment
+
+
+def exported_threads():
+    """OMP_NUM_THREADS as exported by the user, or None"""
+    value = os.environ.get('OMP_NUM_THREADS', '')
+    return int(value) if value.isdigit() and int(value) > 0 else None
+
+
+def set_threads(threads, software=None, keep_existing=True):
+    """
+    Set the thread environment of this process; the QC programs started
+    from it inherit it.  Variables the user has already exported are kept
+    unless keep_existing is False.
+    """
+    environment = thread_environment(threads, software)
+    if keep_existing:
+        kept = {name: os.environ[name] for name in environment if name in os.environ}
+        if kept:
+            resources_logger.info('Keeping ' + ', '.join(f'{name}={value}' for name, value in kept.items()))
+        environment = {name: value for name, value in environment.items() if name not in kept}
+    os.environ.update(environment)
+
+
+def pin(cores):
+    """Bind this process, and the programs it starts, to the cores"""
+    if not cores or not hasattr(os, 'sched_setaffinity'):
+        return
+    try:
+        os.sched_setaffinity(0, cores)
+    except OSError as e:
+        resources_logger.warning(f'Could not pin to cores {cores}: {e}')
+
+
+def plan(software, qc_params, parallel_jobs=1, threads_per_job=None, cores=None):
+    """
+    Split the cores between parallel_jobs jobs.
+
+    :param threads_per_job: threads of each job; cores // parallel_jobs if None
+    :return: number of concurrent jobs and threads per job
+    """
+    from pyar.interface.registry import ENGINES
+    n_cores = len(cores or available_cores())
+    spec = ENGINES.get(software)
+    if spec is not None and not spec.threaded:
+        return min(parallel_jobs, n_cores), 1
+    if threads_per_job is None:
+        threads_per_job = max(1, n_cores // max(1, parallel_jobs))
+    jobs = max(1, min(parallel_jobs, n_cores // threads_per_job))
+    if jobs * threads_per_job > n_cores:
+        resources_logger.warning(f'{jobs} jobs x {threads_per_job} threads oversubscribe {n_cores} cores')
+    return jobs, threads_per_job
+
+
+def plan_threads(software, qc_params, parallel_jobs=1, nprocs=None, calibrate=None, cores=None):
+    """
+    Threads per job of a run, from nprocs (--nprocs), an exported
+    OMP_NUM_THREADS, autotune with calibrate, or else the plan.  Sets
+    qc_params['nprocs'] and the thread environment; exported thread
+    variables are kept only when OMP_NUM_THREADS gave the thread count, so
+    that the engines never run more threads than planned.
+
+    :return: number of concurrent jobs and threads per job
+    """
+    threads_per_job = nprocs
+    if threads_per_job is None and calibrate is None:
+        threads_per_job = exported_threads()
+    from_environment = nprocs is None and threads_per_job is not None
+    if threads_per_job is None and calibrate is not None:
+        threads_per_job = autotune(calibrate, cores, max_jobs=parallel_jobs)
+    jobs, threads_per_job = plan(software, qc_params, parallel_jobs, threads_per_job, cores)
+    qc_params['nprocs'] = threads_per_job
+    set_threads(threads_per_job, software,
+                keep_existing=from_environment and threads_per_job == exported_threads())
+    return jobs, threads_per_job
+
+
+def autotune(calibrate, cores=None, candidates=None, max_jobs=None):
+    """
+    Choose the threads per job giving the highest throughput.
+
+    :param calibrate: function(threads) running one short job with that
+        many threads and returning the wall time in seconds
+    :param candidates: thread counts to try; powers of two up to the number of cores if None
+    :param max_jobs: most jobs that can run at the same time; no limit if None
+    :return: threads per job
+    """
+    n_cores = len(cores or available_cores())
+    if candidates is None:
+        candidates = [2 ** k for k in range(n_cores.bit_length()) if 2 ** k <= n_cores]
+    best, best_throughput = 1, 0.0
+    for threads in candidates:
+        elapsed = max(calibrate(threads), 1e-6)
+        jobs = n_cores // threads if max_jobs is None else min(max_jobs, n_cores // threads)
+        throughput = jobs / elapsed
+        resources_logger.info(f'    {threads:3d} threads per job: {elapsed:8.2f} s, '
+                              f'{throughput * 3600:10.1f} jobs/hour')
+        if throughput > best_throughput:
+            best, best_throughput = threads, throughput
+    return best
+
+
+def calibration_run(molecule, qc_params, directory='calibration'):
+    """
+    Function(threads) optimising a copy of the molecule with that many
+    threads in directory, for autotune
+    """
+    import copy
+    import shutil
+    from pyar.old_optimiser import optimise
+
+    def calibrate(threads):
+        cwd = os.getcwd()
+        os.makedirs(directory, exist_ok=True)
+        os.chdir(directory)
+        trial = copy.deepcopy(molecule)
+        trial.name = f'calibration_{threads}'
+        shutil.rmtree(f'job_{trial.name}', ignore_errors=True)
+        saved = dict(os.environ)
+        set_threads(threads, qc_params['software'], keep_existing=False)
+        start = time.time()
+        try:
+            optimise(trial, dict(qc_params, nprocs=threads))
+        finally:
+            os.environ.clear()
+            os.environ.update(saved)
+            os.chdir(cwd)
+        return time.time() - start
+
+    return calibrate
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Permutation-invariant RMSD between molecular structures.
+
+Two structures are put in their principal-axes frames, every sign
+combination of the axes (and optionally their mirror images) is tried as
+a starting orientation, atoms of the same element are matched with the
+Hungarian algorithm and the alignment is refined with Kabsch rotations
+until the assignment no longer changes.
+"""
+import itertools
+import multiprocessing
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+
+def kabsch_rotation(p, q, allow_reflection=False):
+    """
+    Rotation matrix that best superimposes the centred coordinates p onto q.
+
+    :param p: (N, 3) coordinates centred at the origin
+    :param q: (N, 3) coordinates centred at the origin
+    :param allow_reflection: accept improper rotations
+    :return: (3, 3) matrix r such that p @ r ~ q
+    """
+    h = p.T @ q
+    u, s, vt = np.linalg.svd(h)
+    d = np.sign(np.linalg.det(u @ vt))
+    if allow_reflection or d >= 0:
+        return u @ vt
+    return u @ np.diag([1.0, 1.0, -1.0]) @ vt
+
+
+def kabsch_rmsd(p, q, allow_reflection=False):
+    """RMSD of p and q (same atom order) after optimal superposition"""
+    p = p - p.mean(axis=0)
+    q = q - q.mean(axis=0)
+    r = kabsch_rotation(p, q, allow_reflection)
+    return np.sqrt(np.mean(np.sum((p @ r - q) ** 2, axis=1)))
+
+
+def principal_axes(coordinates):
+    """
+    Centre the coordinates and return them with the principal axes of the
+    (unit-mass) inertia tensor as the columns of a (3, 3) matrix.
+    """
+    centred = coordinates - coordinates.mean(axis=0)
+    inertia = np.sum(centred ** 2) * np.eye(3) - centred.T @ centred
+    _, axes = np.linalg.eigh(inertia)
+    return centred, axes
+
+
+def starting_orientations():
+    """Sign flips of the principal axes"""
+    for signs in itertools.product([1.0, -1.0], repeat=3):
+        yield np.diag(signs)
+
+
+def element_assignment(atoms_list, reference, candidate):
+    """
+    Element-wise optimal assignment of candidate atoms to reference atoms.
+
+    :return: permutation such that candidate[permutation] matches reference
+    """
+    permutation = np.zeros(len(atoms_list), dtype=int)
+    for element in set(atoms_list):
+        indices = np.array([i for i, a in enumerate(atoms_list) if a == element])
+        cost = np.sum((reference[indices, np.newaxis, :] - candidate[np.newaxis, indices, :]) ** 2, axis=-1)
+        rows, columns = linear_sum_assignment(cost)
+        permutation[indices[rows]] = indices[columns]
+    return permutation
+
+
+def permutation_invariant_rmsd(atoms_list_a, coordinates_a, atoms_list_b, coordinates_b,
+                               allow_reflection=True, max_iterations=20):
+    """
+    RMSD between two structures that may differ by a relabelling of atoms
+    of the same element.
+
+    :param atoms_list_a: element symbols of the reference
+    :param coordinates_a: (N, 3) coordinates of the reference
+    :param atoms_list_b: element symbols of the candidate
+    :param coordinates_b: (N, 3) coordinates of the candidate
+    :param allow_reflection: also compare with the mirror image of the candidate
+    :param max_iterations: maximum number of assignment/Kabsch cycles per starting orientation
+    :return: rmsd and the permutation p such that candidate atom p[i] corresponds to reference atom i
+    """
+    atoms_list_a = [str(a).capitalize() for a in atoms_list_a]
+    atoms_list_b = [str(a).capitalize() for a in atoms_list_b]
+    if sorted(atoms_list_a) != sorted(atoms_list_b):
+        return np.inf, None
+
+    # Reorder the candidate so that elements appear in the same positions as in the reference
+    order_b = np.argsort(atoms_list_b, kind='stable')
+    order_a = np.argsort(atoms_list_a, kind='stable')
+    to_reference_layout = np.empty(len(atoms_list_a), dtype=int)
+    to_reference_layout[order_a] = order_b
+    candidate = np.asarray(coordinates_b, dtype=float)[to_reference_layout]
+
+    reference, axes_a = principal_axes(np.asarray(coordinates_a, dtype=float))
+    candidate, axes_b = principal_axes(candidate)
+    reference = reference @ axes_a
+    candidate = candidate @ axes_b
+
+    # The overall transformation of the candidate is improper (a mirror image)
+    # if the determinants of both axes frames and of the flip multiply to -1
+    parity = np.linalg.det(axes_a) * np.linalg.det(axes_b)
+    best_rmsd, best_permutation = np.inf, None
+    for flip in starting_orientations():
+        if not allow_reflection and parity * np.linalg.det(flip) < 0:
+            continue
+        current = candidate @ flip
+        permutation = None
+        for _ in range(max_iterations):
+            new_permutation = element_assignment(atoms_list_a, reference, current)
+            if permutation is not None and np.array_equal(new_permutation, permutation):
+                break
+            permutation = new_permutation
+            matched = current[permutation]
+            rotation = kabsch_rotation(matched, reference)
+            current = current @ rotation
+        rmsd = np.sqrt(np.mean(np.sum((current[permutation] - reference) ** 2, axis=1)))
+        if rmsd < best_rmsd:
+            best_rmsd, best_permutation = rmsd, to_reference_layout[permutation]
+    return best_rmsd, best_permutation
+
+
+def molecule_rmsd(molecule_a, molecule_b, allow_reflection=True):
+    """permutation_invariant_rmsd for two pyar Molecule objects"""
+    rmsd, _ = permutation_invariant_rmsd(molecule_a.atoms_list, molecule_a.coordinates,
+                                         molecule_b.atoms_list, molecule_b.coordinates,
+                                         allow_reflection=allow_reflection)
+    return rmsd
+
+
+def _molecule_rmsd_pair(args):
+    return molecule_rmsd(*args)
+
+
+def rmsd_matrix(references, candidates=None, allow_reflection=True, processes=1):
+    """
+    Permutation-invariant RMSDs of many candidates against a reference set.
+
+    :param references: list of Molecule objects
+    :param candidates: list of Molecule objects; the references themselves if None
+    :param processes: number of worker processes
+    :return: (len(references), len(candidates)) array
+    """
+    symmetric = candidates is None
+    if symmetric:
+        candidates = references
+        pairs = [(i, j) for i, j in itertools.combinations(range(len(references)), 2)]
+    else:
+        pairs = [(i, j) for i in range(len(references)) for j in range(len(candidates))]
+    jobs = [(references[i], candidates[j], allow_reflection) for i, j in pairs]
+    if processes > 1 and len(jobs) > 1:
+        with multiprocessing.Pool(processes) as pool:
+            values = pool.map(_molecule_rmsd_pair, jobs, chunksize=max(1, len(jobs) // (4 * processes)))
+    else:
+        values = [_molecule_rmsd_pair(job) for job in jobs]
+    matrix = np.zeros((len(references), len(candidates)))
+    for (i, j), value in zip(pairs, values):
+        matrix[i, j] = value
+        if symmetric:
+            matrix[j, i] = value
+    return matrix
+
+
+def main():
+    import argparse
+    from pyar.Molecule import Molecule
+    parser = argparse.ArgumentParser(description='Permutation-invariant RMSD between xyz files')
+    parser.add_argument('files', metavar='file', nargs='+', help='Coordinate files')
+    parser.add_argument('--no-mirror', action='store_true', help='Do not compare with mirror images')
+    parser.add_argument('-np', '--processes', type=int, default=1, help='Number of worker processes')
+    args = parser.parse_args()
+    molecules = [Molecule.from_xyz(f) for f in args.files]
+    matrix = rmsd_matrix(molecules, allow_reflection=not args.no_mirror, processes=args.processes)
+    for f, row in zip(args.files, matrix):
+        print(f"{f:>30} " + " ".join(f"{v:8.4f}" for v in row))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ import time
 
 import numpy as np
 
+import pyar.property
 import pyar.tabu
 from pyar import old_optimiser
 from pyar.data_analysis import clustering
@@ -16,10 +17,10 @@ def generate_guess_for_bonding(molecule_id, seed, monomer, a, b,
     my_bounds = [(-0.5, 0.5), (-0.5, 0.5), (-0.5, 0.5), (0, 2 * np.pi),
                  (0, 2 * np.pi), (0, 2 * np.pi)]
     orientations = []
-    fun = partial(ab_dist, a, b, monomer, seed)
+    fun = partial(ab_dist_batch, *contact_geometry(seed, monomer, a, b))
     for i in range(number_of_orientations):
         x = global_opt(fun, my_bounds,
-                       polish=True, disp=True, workers=-1)
+                       polish=True, disp=True, vectorized=True, updating='deferred')
         print(x.message)
         filename_prefix = "aai_"
         each_orientation = pyar.tabu.merge_two_molecules(x.x, seed, monomer,
@@ -44,6 +45,77 @@ def ab_dist(a, b, monomer, seed, pts):
     return np.linalg.norm(coordinates[a] - coordinates[b])
 
 
+def contact_geometry(seed, monomer, a, b, distance_scaling=1.5):
+    """
+    The arrays needed by ab_dist_batch: the seed moved to the origin, the
+    monomer relative to its centroid, the centroid, the squared contact
+    distances of all seed-monomer atom pairs, and the site atoms (b counted
+    from the first atom of the monomer).
+    """
+    seed_coordinates = seed.coordinates - pyar.property.get_centroid(seed.coordinates)
+    monomer_centroid = np.asarray(monomer.centroid, dtype=float)
+    monomer_coordinates = monomer.coordinates - pyar.property.get_centroid(monomer.coordinates)
+    contact = distance_scaling * (np.asarray(seed.covalent_radius)[:, np.newaxis]
+                                  + np.asarray(monomer.covalent_radius)[np.newaxis, :])
+    rotate = monomer.number_of_atoms > 1
+    return seed_coordinates, monomer_coordinates, monomer_centroid, contact ** 2, a, b - seed.number_of_atoms, rotate
+
+
+def euler_matrices(phi, theta, psi):
+    """Batched Z-X-Z rotation matrices of Molecule.rotate_3d, shape (S, 3, 3)"""
+    zeros, ones = np.zeros_like(phi), np.ones_like(phi)
+    matrix_d = np.array(((np.cos(phi), np.sin(phi), zeros),
+                         (-np.sin(phi), np.cos(phi), zeros),
+                         (zeros, zeros, ones)))
+    matrix_c = np.array(((ones, zeros, zeros),
+                         (zeros, np.cos(theta), np.sin(theta)),
+                         (zeros, -np.sin(theta), np.cos(theta))))
+    matrix_b = np.array(((np.cos(psi), np.sin(psi), zeros),
+                         (-np.sin(psi), np.cos(psi), zeros),
+                         (zeros, zeros, ones)))
+    return np.einsum('ijs,jks,kls->sil', matrix_b, matrix_c, matrix_d)
+
+
+def ab_dist_batch(seed_coordinates, monomer_coordinates, monomer_centroid, contact_squared, a, b, rotate, pts):
+    """
+    The a-b distance of the orientations merge_two_molecules would make
+    for a whole population of vectors at once.
+
+    The monomer starts at -D * direction and moves towards the seed until
+    the first pair of atoms comes within the contact distance.  Instead of
+    taking small steps, the position is solved for: atoms i and j touch
+    when |lambda * direction + s_i - m_j| equals the contact distance,
+    and the first contact is the largest such lambda over all pairs.
+
+    :param pts: (6,) or (6, S) array of x, y, z, theta, phi, psi
+    :return: distance, scalar or (S,)
+    """
+    pts = np.asarray(pts, dtype=float)
+    single = pts.ndim == 1
+    if single:
+        pts = pts[:, np.newaxis]
+    direction = pts[:3].T
+    if rotate:
+        rotations = euler_matrices(pts[3], pts[4], pts[5])
+        monomer = np.einsum('sij,nj->sni', rotations, monomer_coordinates) + monomer_centroid
+    else:
+        monomer = np.broadcast_to(monomer_coordinates, (pts.shape[1],) + monomer_coordinates.shape)
+    initial_distance = (np.max(np.linalg.norm(seed_coordinates, axis=1))
+                        + np.max(np.linalg.norm(monomer, axis=-1), axis=1) + 0.5)
+
+    separation = seed_coordinates[np.newaxis, :, np.newaxis, :] - monomer[:, np.newaxis, :, :]
+    dd = np.maximum(np.einsum('sk,sk->s', direction, direction), 1e-12)[:, np.newaxis, np.newaxis]
+    dw = np.einsum('sk,sijk->sij', direction, separation)
+    discriminant = dw ** 2 - dd * (np.einsum('sijk,sijk->sij', separation, separation) - contact_squared)
+    upper_root = np.where(discriminant >= 0, (-dw + np.sqrt(np.maximum(discriminant, 0.0))) / dd, -np.inf)
+    first_contact = np.minimum(upper_root.reshape(len(direction), -1).max(axis=1), initial_distance)
+    first_contact = np.maximum(first_contact, 0.0)
+
+    b_position = monomer[:, b, :] - first_contact[:, np.newaxis] * direction
+    distance = np.linalg.norm(seed_coordinates[a] - b_position, axis=1)
+    return distance[0] if single else distance
+
+
 def generate_guess_for_bonding_brute_force(molecule_id, seed, monomer, a, b, number_of_orientations, d_scale):
     tabu_check_for_angles = monomer.number_of_atoms != 1
     saved_pts = []
@@ -88,6 +160,113 @@ def generate_guess_for_bonding_brute_force(molecule_id, seed, monomer, a, b, num
     return orientations
 
 
+def restraint_terms(coordinates, a, b, target, force_constant):
+    """Harmonic restraint energy and gradient on the a-b distance"""
+    vector = coordinates[a] - coordinates[b]
+    distance = np.linalg.norm(vector)
+    energy = 0.5 * force_constant * (distance - target) ** 2
+    gradient = np.zeros_like(coordinates)
+    gradient[a] = force_constant * (distance - target) * vector / distance
+    gradient[b] = -gradient[a]
+    return energy, gradient
+
+
+def relax_at_distance(engine, atoms_list, coordinates, a, b, target, method='restraint',
+                      force_constant=5.0, gtol=1e-4, max_steps=500):
+    """
+    Minimise the energy with the a-b distance held at target.
+
+    :param engine: function(atoms_list, coordinates) returning energy and gradient
+    :param method: 'restraint' adds a harmonic term force_constant/2 (r - target)^2
+        (Hartree/Angstrom^2); 'constraint' keeps r = target exactly (SLSQP)
+    :return: energy (without the restraint), coordinates
+    """
+    from scipy.optimize import minimize
+    shape = coordinates.shape
+
+    def objective(x):
+        xyz = x.reshape(shape)
+        energy, gradient = engine(atoms_list, xyz)
+        gradient = np.asarray(gradient, dtype=float)
+        if method == 'restraint':
+            restraint_energy, restraint_gradient = restraint_terms(xyz, a, b, target, force_constant)
+            energy, gradient = energy + restraint_energy, gradient + restraint_gradient
+        return energy, gradient.ravel()
+
+    if method == 'constraint':
+        def bond_constraint(x):
+            xyz = x.reshape(shape)
+            return np.linalg.norm(xyz[a] - xyz[b]) - target
+
+        def bond_constraint_jacobian(x):
+            xyz = x.reshape(shape)
+            vector = xyz[a] - xyz[b]
+            jacobian = np.zeros(shape)
+            jacobian[a] = vector / np.linalg.norm(vector)
+            jacobian[b] = -jacobian[a]
+            return jacobian.ravel()
+
+        result = minimize(objective, coordinates.ravel(), jac=True, method='SLSQP',
+                          constraints={'type': 'eq', 'fun': bond_constraint, 'jac': bond_constraint_jacobian},
+                          options={'maxiter': max_steps, 'ftol': gtol ** 2})
+    else:
+        result = minimize(objective, coordinates.ravel(), jac=True, method='L-BFGS-B',
+                          options={'maxiter': max_steps, 'gtol': gtol})
+    final_coordinates = result.x.reshape(shape)
+    energy, _ = engine(atoms_list, final_coordinates)
+    return energy, final_coordinates
+
+
+def relaxed_scan(engine, molecule, a, b, final_distance, number_of_points=None, step=0.1, **relax_options):
+    """
+    Step the a-b distance from its current value to final_distance, relaxing
+    everything else at each point from the geometry of the previous point.
+
+    :param engine: function(atoms_list, coordinates) returning energy and gradient
+    :param molecule: starting geometry
+    :param number_of_points: points of the scan; from step if None
+    :param relax_options: passed to relax_at_distance
+    :return: list of (target distance, distance, energy, coordinates)
+    """
+    coordinates = np.array(molecule.coordinates, dtype=float)
+    start_distance = np.linalg.norm(coordinates[a] - coordinates[b])
+    if number_of_points is None:
+        number_of_points = max(2, int(abs(final_distance - start_distance) / step) + 1)
+    profile = []
+    for target in np.linspace(start_distance, final_distance, number_of_points):
+        energy, coordinates = relax_at_distance(engine, molecule.atoms_list, coordinates, a, b, target,
+                                                **relax_options)
+        distance = np.linalg.norm(coordinates[a] - coordinates[b])
+        profile.append((target, distance, energy, coordinates.copy()))
+    return profile
+
+
+def write_scan(profile, atoms_list, xyz_file):
+    """Write the scan as a multi-frame xyz file with the energies in the titles"""
+    with open(xyz_file, 'w') as fp:
+        for target, distance, energy, coordinates in profile:
+            fp.write(f"{len(atoms_list):3d}\n")
+            fp.write(f"r = {distance:.4f} target = {target:.4f} energy: {energy}\n")
+            for symbol, c in zip(atoms_list, coordinates):
+                fp.write(f"{symbol:<2}{c[0]:12.5f}{c[1]:12.5f}{c[2]:12.5f}\n")
+
+
+def scan_orientations(engine, molecules, a, b, final_distance, max_workers=None, **scan_options):
+    """
+    relaxed_scan for several starting orientations at the same time.
+
+    Threads are used, so that engines holding models or processes need not
+    be copied; the numerical work of the engines runs outside the GIL.
+
+    :return: list of profiles, in the order of the molecules
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(relaxed_scan, engine, m, a, b, final_distance, **scan_options)
+                   for m in molecules]
+        return [f.result() for f in futures]
+
+
 def scan_distance(input_molecules, site_atoms, number_of_orientations,
                   quantum_chemistry_parameters):
     a_molecule = input_molecules[0]
@@ -101,6 +280,21 @@ def scan_distance(input_molecules, site_atoms, number_of_orientations,
                                                  int(number_of_orientations),
                                                  d_scale=proximity_factor)
 
+    engine = None
+    if quantum_chemistry_parameters['software'] != 'orca':
+        from pyar.engines import get_engine
+        engine = get_engine(quantum_chemistry_parameters)
+    if engine is not None:
+        final_distance = input_molecules[0].covalent_radius[a_atom] + \
+                         input_molecules[0].covalent_radius[b_atom]
+        profiles = scan_orientations(engine, input_molecules, a_atom, b_atom, final_distance,
+                                     max_workers=quantum_chemistry_parameters.get('nprocs'))
+        from pyar import file_manager
+        file_manager.make_directories('scans')
+        for each_molecule, profile in zip(input_molecules, profiles):
+            write_scan(profile, each_molecule.atoms_list, os.path.join('scans', f'scan_{each_molecule.name}.xyz'))
+        return profiles
+
     for each_molecule in input_molecules:
         coordinates = each_molecule.coordinates
         start_dist = np.linalg.norm(coordinates[a_atom] - coordinates[b_atom])
@@ -13,6 +13,7 @@ from numpy import pi, cos, sin
 from scipy.spatial.distance import cosine
 from scipy.stats import qmc
 
+from pyar import profiling
 from pyar.Molecule import Molecule
 # from pyar.property import get_connectivity
 import networkx as nx
@@ -254,6 +255,7 @@ def generate_points(number_of_orientations, tabu_on, d_threshold=0.95):
 
     return np.array(result_points)
 
+@profiling.timed('tabu.trial_geometries')
 def create_trial_geometries(molecule_id, seed, monomer,
                             number_of_orientations,
                             tabu_on, grid_on, site):
@@ -0,0 +1,23 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def run_in_tmp_path(tmp_path, monkeypatch):
+    """Run every test in its own directory, so that logs and job files stay out of the tree"""
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def cli():
+    """The pyar-cli script as a module; its log handler is closed afterwards"""
+    import importlib.machinery
+    import importlib.util
+    import logging
+    import os
+    path = os.path.join(os.path.dirname(__file__), os.pardir, 'pyar', 'scripts', 'pyar-cli')
+    loader = importlib.machinery.SourceFileLoader('pyar_cli', path)
+    module = importlib.util.module_from_spec(importlib.util.spec_from_loader('pyar_cli', loader))
+    loader.exec_module(module)
+    yield module
+    logging.getLogger('pyar').removeHandler(module.handler)
+    module.handler.close()
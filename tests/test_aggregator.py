@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+from pyar.aggregator import EnergyWindowScheduler
+
+
+def orientation(name, energy):
+    return SimpleNamespace(name=name, energy=energy)
+
+
+def block_rounds(scheduler, never_converging):
+    """Simulate add_one: everything but never_converging converges after two rounds"""
+    not_converged = [orientation(f'trial_{n}', -1.0) for n in range(8)]
+    rounds = 0
+    while scheduler.rounds_left(not_converged, rounds):
+        scheduler.spend(len(not_converged))
+        rounds += 1
+        converged = [m for m in not_converged if m.name not in never_converging and rounds >= 2]
+        scheduler.observe(converged)
+        not_converged = scheduler.prune([m for m in not_converged if m not in converged], rounds)
+    return rounds
+
+
+def test_rounds_are_capped_per_seed():
+    for window in (None, 5.0):
+        scheduler = EnergyWindowScheduler(window, max_rounds=10)
+        assert block_rounds(scheduler, {'trial_0'}) == 10
+        assert block_rounds(scheduler, {'trial_0'}) == 10
+
+
+def test_without_window_nothing_is_pruned():
+    scheduler = EnergyWindowScheduler(None)
+    scheduler.observe([orientation('a', -10.0)])
+    stuck = [orientation('b', 0.5)]
+    assert scheduler.prune(stuck, 1) == stuck
+    assert scheduler.prune(stuck, 2) == stuck
+
+
+def test_only_converged_energies_set_the_minimum():
+    scheduler = EnergyWindowScheduler(1.0)
+    scheduler.observe([orientation('a', -1.0)])
+    unfinished = [orientation('b', -5.0), orientation('c', 0.0), orientation('d', -0.9)]
+    scheduler.prune(unfinished, 1)
+    assert scheduler.best_energy == -1.0
+    kept = scheduler.prune(unfinished, 2)
+    # b is below the minimum, c has no energy, d did not improve and is 62 kcal/mol above
+    assert [m.name for m in kept] == ['b', 'c']
+
+
+def test_prefix_trie_grows_the_same_aggregates_as_the_flat_loop(monkeypatch, caplog):
+    import logging
+    from collections import namedtuple
+    from pyar import aggregator
+
+    monomers = [namedtuple('Monomer', 'name')(name) for name in 'aabb']
+    pathways = sorted(aggregator.select_pathways(monomers, 200), key=lambda p: [m.name for m in p])
+    names = [''.join(m.name for m in pathway) for pathway in pathways]
+    assert len(names) == 6
+
+    # Every aggregate the loop over the pathways grew, one add_one per prefix
+    flat = [path[:depth] for path in names for depth in range(2, len(path) + 1)]
+
+    grown = []
+
+    def add_one(key, seeds, monomer, *args):
+        grown.append(key)
+        return [f'{key}_seed']
+
+    monkeypatch.setattr(aggregator, 'add_one', add_one)
+    levels = aggregator.prefix_levels(pathways, first_pathway=0)
+    with caplog.at_level(logging.INFO, logger='pyar.aggregator'):
+        aggregator.grow_pathway_tree(levels, lambda node, seeds: (node.key, (node.key, seeds, node.monomer)))
+
+    assert set(grown) == set(flat)
+    assert len(grown) == len(set(grown)) < len(flat)
+    assert set(grown) >= set(names)
+    started = [r.getMessage().split()[-1] for r in caplog.records if r.getMessage().lstrip().startswith('Path:')]
+    assert sorted(started) == names
+
+
+def test_similar_molecules_are_removed_among_those_with_an_energy(monkeypatch):
+    from pyar import aggregator
+
+    def remove_similar(molecules):
+        assert all(m.energy is not None for m in molecules)
+        return [m for m in molecules if m.name != 'b']
+
+    monkeypatch.setattr(aggregator.clustering, 'remove_similar', remove_similar)
+    molecules = [orientation('a', -1.0), orientation('b', -1.0), orientation('c', None), orientation('d', -2.0)]
+    # One missing energy no longer turns off the removal for the others
+    assert [m.name for m in aggregator.remove_similar_with_energy(molecules)] == ['a', 'c', 'd']
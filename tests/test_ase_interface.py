@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+ase = pytest.importorskip('ase')
+
+from ase import units  # noqa: E402
+from ase.md.verlet import VelocityVerlet  # noqa: E402
+
+from pyar.engines import morse_engine  # noqa: E402
+from pyar.mlatom import data  # noqa: E402
+from pyar.mlatom.interfaces.ase_interface import MLatomCalculator, ase_atoms, optimize_geometry  # noqa: E402
+
+
+class MorseModel:
+    """Shallow Morse pair potential with the predict interface of an MLatom model; records every call"""
+
+    def __init__(self):
+        self.engine = morse_engine(depth=0.02, width=1.0)
+        self.calls = []
+
+    def predict(self, molecule=None, calculate_energy=True, calculate_energy_gradients=False):
+        # A label left by the previous call must have been removed by the calculator
+        assert 'model_call' not in molecule.__dict__
+        atoms_list = [atom.element_symbol for atom in molecule.atoms]
+        energy, gradient = self.engine(atoms_list, molecule.xyz_coordinates)
+        self.calls.append((molecule, np.array(molecule.xyz_coordinates), energy))
+        molecule.energy = energy
+        molecule.model_call = len(self.calls)
+        for atom, atom_gradient in zip(molecule.atoms, gradient):
+            atom.energy_gradients = atom_gradient
+
+
+def water():
+    return data.molecule.from_numpy(np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 1.1], [1.05, 0.0, -0.3]]),
+                                    np.array([8, 1, 1]))
+
+
+def test_ase_atoms():
+    atoms = ase_atoms(water())
+    assert atoms.get_chemical_symbols() == ['O', 'H', 'H']
+    assert np.allclose(atoms.get_positions()[1], [0.0, 0.0, 1.1])
+
+
+def test_optimisation_trajectory():
+    model = MorseModel()
+    initial = water()
+    trajectory = optimize_geometry(initial, model, convergence_criterion_for_forces=1e-3, maximum_number_of_steps=100)
+
+    # One step per evaluation, from the initial geometry to the last one
+    assert 1 < len(trajectory.steps) == len(model.calls) <= 101
+    assert np.allclose(trajectory.steps[0].molecule.xyz_coordinates, initial.xyz_coordinates)
+    for step, (_, coordinates, energy) in zip(trajectory.steps, model.calls):
+        assert np.allclose(step.molecule.xyz_coordinates, coordinates)
+        assert step.molecule.energy == pytest.approx(energy)
+    assert trajectory.steps[-1].molecule.energy < trajectory.steps[0].molecule.energy
+    forces = -trajectory.steps[-1].molecule.get_energy_gradients() * units.Hartree
+    assert np.abs(forces).max() < 1e-3 * 1.01
+    # The calculator works on one private copy of the molecule
+    assert len({id(molecule) for molecule, _, _ in model.calls}) == 1
+    assert model.calls[0][0] is not initial
+    assert 'energy' not in initial.__dict__
+
+
+def test_trajectory_buffers_grow_during_md():
+    model = MorseModel()
+    atoms = ase_atoms(water())
+    calculator = MLatomCalculator(model=model, save_optimization_trajectory=True, trajectory_buffer_size=4)
+    atoms.calc = calculator
+    VelocityVerlet(atoms, timestep=0.2 * units.fs).run(10)
+
+    assert calculator.number_of_steps == len(model.calls) >= 11
+    assert len(calculator.trajectory_energies) >= calculator.number_of_steps
+    assert np.allclose(calculator.trajectory_coordinates[calculator.number_of_steps - 1], atoms.get_positions())
+    trajectory = calculator.get_optimization_trajectory()
+    assert [step.step for step in trajectory.steps] == list(range(calculator.number_of_steps))
+    assert np.allclose([step.molecule.energy for step in trajectory.steps], [call[2] for call in model.calls])
@@ -0,0 +1,147 @@
+import sys
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from scipy.spatial.distance import cdist
+from sklearn.cluster import DBSCAN
+from sklearn.metrics import adjusted_rand_score
+
+from pyar.data_analysis import clustering
+from pyar.data_analysis.clustering import (SCALABLE_ALGORITHMS, determine_dbscan_params, generate_labels, k_distances,
+                                           rbf_kernel_clustering, tiled_k_distances)
+
+
+def two_clusters(n=100, dimensions=5, separation=20.0, seed=0):
+    rng = np.random.default_rng(seed)
+    first = rng.normal(0.0, 1.0, size=(n, dimensions))
+    second = rng.normal(separation, 1.0, size=(n, dimensions))
+    return np.vstack([first, second])
+
+
+def test_eps_separates_two_clusters():
+    dt = two_clusters()
+    eps, min_samples = determine_dbscan_params(dt, min_samples=4)
+    assert min_samples == 4
+    # Larger than the typical neighbour distance inside a cluster,
+    # smaller than the closest pair of points from different clusters
+    assert np.median(k_distances(dt, 3)) <= eps < cdist(dt[:100], dt[100:]).min()
+    labels = DBSCAN(eps=eps, min_samples=min_samples).fit_predict(dt)
+    assert len(set(labels) - {-1}) == 2
+    assert np.sum(labels == -1) < 0.25 * len(dt)
+
+
+def test_exact_and_approximate_k_distances_agree():
+    dt = two_clusters(n=60)
+    assert np.allclose(tiled_k_distances(dt, 3, tile_size=16), k_distances(dt, 3))
+    assert np.isclose(determine_dbscan_params(dt, 4, exact=True, tile_size=16)[0],
+                      determine_dbscan_params(dt, 4)[0])
+
+
+def test_default_nearest_neighbour_path_stays_linear_in_memory():
+    n, dimensions = 2000, 50
+    dt = two_clusters(n=n // 2, dimensions=dimensions)
+    tracemalloc.start()
+    try:
+        determine_dbscan_params(dt, min_samples=4)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # The tree query keeps a few copies of the data and the (N, k) neighbour arrays
+    assert peak < 4 * dt.nbytes < n * n * 8
+
+
+def test_peak_memory_is_below_a_dense_distance_array():
+    n, dimensions = 2000, 50
+    dt = two_clusters(n=n // 2, dimensions=dimensions)
+    tracemalloc.start()
+    try:
+        determine_dbscan_params(dt, min_samples=4, exact=True, tile_size=128)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # A broadcast (N, N, D) difference array would need n * n * dimensions * 8 bytes
+    assert peak < n * n * 8
+
+
+def three_tight_clusters(n=20, dimensions=5, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = np.array([[0.0] * dimensions, [3.0] * dimensions, [-3.0] + [3.0] * (dimensions - 1)])
+    labels = np.repeat(np.arange(len(centres)), n)
+    return centres[labels] + rng.normal(0.0, 0.01, (len(labels), dimensions)), labels
+
+
+def test_rbf_kernel_chooses_the_number_of_clusters():
+    dt, expected = three_tight_clusters()
+    # maximum_number_of_seeds is an upper bound, not the number of clusters
+    labels = generate_labels(dt, 'rbf_kernel', maximum_number_of_seeds=8)
+    assert len(set(labels)) == 3
+    assert adjusted_rand_score(expected, labels) == 1.0
+    assert adjusted_rand_score(expected, rbf_kernel_clustering(dt, n_clusters=3)) == 1.0
+
+
+def candidates(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [SimpleNamespace(name=f'm{i}', atoms_list=['H', 'H'], coordinates=rng.normal(0.0, 1.0, (2, 3)),
+                            energy=-1.0 - 0.001 * i) for i in range(n)]
+
+
+@pytest.mark.parametrize('algorithm', SCALABLE_ALGORITHMS)
+def test_scalable_selection_returns_exactly_the_number_of_seeds(algorithm, monkeypatch):
+    molecules = candidates(60)
+    dt, _ = three_tight_clusters()
+    monkeypatch.setattr(clustering, 'mbtr_features', lambda ms: dt[:len(ms)])
+    # Three natural clusters, but eight seeds are asked for
+    selected = clustering.choose_representatives(molecules, 8, algorithm, projection='none')
+    assert len(selected) == 8
+    assert len({m.name for m in selected}) == 8
+    assert molecules[-1] in selected
+    # Fewer clusters found than seeds asked for are padded with the lowest energies
+    monkeypatch.setattr(clustering, 'scalable_labels', lambda dt, algorithm, n: np.zeros(len(dt), dtype=int))
+    selected = clustering.choose_representatives(molecules, 5, algorithm, projection='none')
+    assert [m.name for m in selected] == ['m59', 'm58', 'm57', 'm56', 'm55']
+
+
+def test_minibatch_kmeans_starts_from_the_previous_centres(monkeypatch):
+    dt, expected = three_tight_clusters()
+    monkeypatch.setattr(clustering, '_previous_centres', {})
+    cold = clustering.scalable_labels(dt, 'minibatch_kmeans', 3)
+    centres = clustering._previous_centres[(3, dt.shape[1])]
+    inits = []
+    real = clustering.MiniBatchKMeans
+
+    def recording(**kwargs):
+        inits.append(kwargs.get('init'))
+        return real(**kwargs)
+
+    monkeypatch.setattr(clustering, 'MiniBatchKMeans', recording)
+    warm = clustering.scalable_labels(dt[::-1], 'minibatch_kmeans', 3)
+    assert inits[0] is centres
+    assert adjusted_rand_score(expected, cold) == adjusted_rand_score(expected[::-1], warm) == 1.0
+    clustering.scalable_labels(dt, 'minibatch_kmeans', 3, warm_start=False)
+    assert inits[1] is None
+
+
+@pytest.mark.parametrize('arguments, algorithm, projection', [
+    ([], None, None),
+    (['-ca', 'minibatch_kmeans', '--clustering-projection', 'random'], 'minibatch_kmeans', 'random'),
+    (['--clustering-algorithm', 'birch', '--clustering-projection', 'none'], 'birch', 'none')])
+def test_clustering_options(arguments, algorithm, projection, cli, monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['pyar-cli', '-a', '-N', '8', '--software', 'xtb', 'water.xyz'] + arguments)
+    run_parameters = vars(cli.argument_parse())
+    assert run_parameters['clustering_algorithm'] == algorithm
+    assert run_parameters['clustering_projection'] == projection
+
+
+def test_projection_from_the_environment(monkeypatch):
+    molecules = candidates(40)
+    dt = np.random.default_rng(1).normal(0.0, 1.0, (40, 64))
+    used = []
+    monkeypatch.setattr(clustering, 'mbtr_features', lambda ms: dt[:len(ms)])
+    monkeypatch.setattr(clustering, 'project_features',
+                        lambda dt, projection, n_components: used.append(projection) or dt[:, :n_components])
+    monkeypatch.setenv('PYAR_CLUSTERING_ALGORITHM', 'minibatch_kmeans')
+    monkeypatch.setenv('PYAR_CLUSTERING_PROJECTION', 'random')
+    assert len(clustering.choose_geometries(molecules, 6)) == 6
+    assert used == ['random']
@@ -0,0 +1,97 @@
+import os
+
+import pandas as pd
+import pytest
+
+from pyar import crawler
+
+
+def write_xyz(path, energy):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f"2\n{path.stem}:{energy}\nH 0.0 0.0 0.0\nH 0.0 0.0 0.74\n")
+
+
+@pytest.fixture
+def run(tmp_path):
+    run = tmp_path / 'run'
+    write_xyz(run / 'result_a.xyz', -1.0)
+    write_xyz(run / 'aggregates' / 'ag_a_001' / 'result_b.xyz', -1.1)
+    write_xyz(run / 'aggregates' / 'tmp_scratch' / 'deep' / 'result_c.xyz', -1.2)
+    write_xyz(run / 'aggregates' / 'ag_a_001' / 'trial_d.xyz', -1.3)
+    return run
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    """Paths handed to parse_file"""
+    paths = []
+    parse_file = crawler.parse_file
+
+    def recording(job):
+        paths.append(job[0])
+        return parse_file(job)
+
+    monkeypatch.setattr(crawler, 'parse_file', recording)
+    return paths
+
+
+def crawl(starting_point):
+    return crawler.collect_data(str(starting_point), processes=1, identities=False)
+
+
+def test_excluded_directories_are_not_entered(run, monkeypatch):
+    walked = []
+    walk = os.walk
+
+    def recording(top):
+        for root, dirs, files in walk(top):
+            walked.append(root)
+            yield root, dirs, files
+
+    monkeypatch.setattr(crawler.os, 'walk', recording)
+    found = crawler.find_files(str(run), 'tmp', 'result')
+    assert sorted(found) == sorted(str(p) for p in (run / 'result_a.xyz',
+                                                    run / 'aggregates' / 'ag_a_001' / 'result_b.xyz'))
+    assert not any('tmp_scratch' in root for root in walked)
+    # Only the path below the starting directory is matched, not the directory above it
+    assert len(crawler.find_files(str(run), os.path.basename(os.path.dirname(run)), 'result')) == 3
+
+
+def test_recrawl_parses_only_changed_files(run, parsed):
+    df = crawl(run)
+    assert len(df) == 2 and len(parsed) == 2
+    assert sorted(df['energy']) == [-1.1, -1.0]
+
+    parsed.clear()
+    crawl(run)
+    assert parsed == []
+
+    # Another spelling of the same directory finds the same rows
+    os.chdir(run.parent)
+    for spelling in ('run', './run/', os.path.join('run', 'aggregates', os.pardir)):
+        df = crawl(spelling)
+        assert parsed == []
+        assert len(df) == 2
+
+    result_b = run / 'aggregates' / 'ag_a_001' / 'result_b.xyz'
+    write_xyz(result_b, -1.5)
+    stat = os.stat(result_b)
+    os.utime(result_b, (stat.st_atime, stat.st_mtime + 10))
+    df = crawl(run)
+    assert parsed == [str(result_b)]
+    assert sorted(df['energy']) == [-1.5, -1.0]
+
+    parsed.clear()
+    os.remove(run / 'result_a.xyz')
+    df = crawl(run)
+    assert parsed == []
+    assert list(df['path']) == [str(result_b)]
+
+
+def test_csv_names_are_given_below_the_starting_directory(run):
+    os.chdir(run.parent)
+    crawl('./run')
+    table = pd.read_csv('data.csv')
+    assert sorted(table['Name']) == [os.path.join('./run', 'aggregates', 'ag_a_001', 'result_b.xyz'),
+                                     os.path.join('./run', 'result_a.xyz')]
+    assert set(table['lineage']) == {'.', os.path.join('aggregates', 'ag_a_001')}
@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pyar.representations
+
+from pyar.data_analysis.dedup import DedupIndex, formula
+
+
+def structure(name, atoms_list, coordinates, energy):
+    return SimpleNamespace(name=name, atoms_list=atoms_list, coordinates=np.asarray(coordinates, dtype=float),
+                           energy=energy)
+
+
+def hydrogen(name, distance, energy=-1.0):
+    return structure(name, ['H', 'H'], [[0.0, 0.0, 0.0], [0.0, 0.0, distance]], energy)
+
+
+def test_formula_is_in_hill_order():
+    assert formula(['O', 'H', 'H']) == 'H2O'
+    assert formula(['O', 'h', 'C', 'H', 'H', 'H']) == 'CH4O'
+    assert formula(['Cl', 'N', 'C', 'H']) == 'CHClN'
+    assert formula(['Na', 'Cl']) == 'ClNa'
+
+
+def test_duplicates_are_found_across_a_bucket_boundary():
+    # With spectrum_resolution 0.5 the distances 1.2 and 1.3 round to
+    # different buckets, but they are less than half a bin apart
+    for first, second in ((1.2, 1.3), (1.3, 1.2)):
+        index = DedupIndex()
+        assert index.add(hydrogen('a', first))
+        assert not index.add(hydrogen('b', second))
+        assert [m.name for m in index] == ['a']
+
+
+def test_lower_energy_duplicate_replaces_the_stored_one():
+    index = DedupIndex()
+    index.add(hydrogen('a', 0.74, -1.000001))
+    assert not index.add(hydrogen('b', 0.75, -1.000004))
+    assert [m.name for m in index] == ['b']
+    assert not index.add(hydrogen('c', 0.74, -1.000002))
+    assert [m.name for m in index] == ['b']
+    assert index.add(hydrogen('d', 0.74, -1.1))
+    assert len(index) == 2
+
+
+def test_index_agrees_with_comparing_every_pair():
+    rng = np.random.default_rng(7)
+    water = np.array([[0.0, 0.0, 0.0], [0.96, 0.0, 0.0], [-0.24, 0.93, 0.0]])
+    stream = []
+    kinds = rng.integers(12, size=120)
+    for n, kind in enumerate(kinds):
+        coordinates = water * (1.0 + 0.03 * kind) + rng.normal(0.0, 0.01, water.shape)
+        energy = -76.0 - 0.001 * kind + rng.uniform(-2e-6, 2e-6)
+        stream.append(structure(f'w{n}', ['O', 'H', 'H'], coordinates, energy))
+
+    index = DedupIndex()
+    new = index.update(stream)
+
+    unique = []
+    for molecule in stream:
+        fingerprint = pyar.representations.fingerprint(molecule.atoms_list, molecule.coordinates)
+        for i, stored in enumerate(unique):
+            if abs(stored.energy - molecule.energy) < 1e-5 and np.linalg.norm(
+                    pyar.representations.fingerprint(stored.atoms_list, stored.coordinates) - fingerprint) < 1.0:
+                if molecule.energy < stored.energy:
+                    unique[i] = molecule
+                break
+        else:
+            unique.append(molecule)
+
+    assert len(new) == len(set(m.name for m in new))
+    assert sorted(m.name for m in index) == sorted(m.name for m in unique)
+    assert len(index) == len(set(kinds))
@@ -0,0 +1,101 @@
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+import pytest
+
+from pyar import engines
+
+
+class FakeCalculator(object):
+    """Stands in for tblite.interface.Calculator; the energy is the sum of the positions"""
+    instances = []
+
+    def __init__(self, method, numbers, positions, charge=0, uhf=0):
+        self.positions = np.array(positions)
+        FakeCalculator.instances.append(self)
+
+    def set(self, name, value):
+        pass
+
+    def update(self, positions):
+        self.positions = np.array(positions)
+
+    def singlepoint(self):
+        time.sleep(0.001)
+        return {'energy': float(np.sum(self.positions)), 'gradient': np.ones_like(self.positions)}
+
+
+@pytest.fixture
+def fake_tblite(monkeypatch):
+    tblite = types.ModuleType('tblite')
+    tblite.interface = types.ModuleType('tblite.interface')
+    tblite.interface.Calculator = FakeCalculator
+    monkeypatch.setitem(sys.modules, 'tblite', tblite)
+    monkeypatch.setitem(sys.modules, 'tblite.interface', tblite.interface)
+    FakeCalculator.instances = []
+    yield
+    engines._xtb_calculators.__dict__.clear()
+
+
+def test_threads_do_not_share_calculators(fake_tblite):
+    engine = engines.xtb_library_engine()
+    atoms_list = ['H', 'H']
+    errors = []
+
+    def scan(offset):
+        calculators = engines.xtb_calculators()
+        engines_of_thread = set()
+        for step in range(50):
+            coordinates = np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 0.7 + offset + 0.01 * step]])
+            energy, gradient = engine(atoms_list, coordinates)
+            expected = np.sum(coordinates) / engines.bohr_to_angstrom
+            if not np.isclose(energy, expected):
+                errors.append((offset, step, energy, expected))
+            engines_of_thread.update(id(c) for c in calculators.values())
+        if len(engines_of_thread) != 1:
+            errors.append((offset, 'calculator was replaced'))
+
+    threads = [threading.Thread(target=scan, args=(float(i),)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(FakeCalculator.instances) == 4
+
+
+def test_calculator_is_reused_within_a_thread(fake_tblite):
+    engine = engines.xtb_library_engine()
+    for z in (0.7, 0.8, 0.9):
+        engine(['H', 'H'], np.array([[0.0, 0.0, 0.0], [0.0, 0.0, z]]))
+    assert len(FakeCalculator.instances) == 1
+
+
+def test_xtb_library_h2():
+    if engines.xtb_library() is None:
+        pytest.skip('neither tblite nor xtb-python is installed')
+    engine = engines.xtb_library_engine()
+    energy, gradient = engine(['H', 'H'], np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 0.74]]))
+    assert np.isfinite(energy) and energy < 0.0
+    assert gradient.shape == (2, 3)
+
+
+def test_optimise_with_engine_uses_the_xtb_criteria():
+    water = np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 1.3], [1.2, 0.0, -0.3]])
+    for level in ('loose', 'tight'):
+        energy_threshold, gradient_threshold = engines.xtb_convergence_thresholds[level]
+        engine = engines.morse_engine()
+        energy, coordinates, converged = engines.optimise_with_engine(
+            engine, ['O', 'H', 'H'], water, gradient_threshold=gradient_threshold,
+            energy_threshold=energy_threshold)
+        assert converged
+        final_energy, gradient = engine(['O', 'H', 'H'], coordinates)
+        assert np.isclose(energy, final_energy)
+        assert np.linalg.norm(gradient) * engines.bohr_to_angstrom <= gradient_threshold
+
+    energy, coordinates, converged = engines.optimise_with_engine(engines.morse_engine(), ['O', 'H', 'H'], water,
+                                                                  max_cycles=2, gradient_threshold=1e-6)
+    assert not converged and np.isfinite(energy)
@@ -0,0 +1,70 @@
+import os
+
+from pyar import file_manager
+
+
+def test_job_scratch_counts_only_the_output(tmp_path, monkeypatch):
+    job_dir = tmp_path / 'job_water'
+    scratch = tmp_path / 'scratch'
+    job_dir.mkdir()
+    scratch.mkdir()
+    (job_dir / 'trial_water.xyz').write_text('x' * 1000)
+    accounting_file = tmp_path / 'scratch_usage.csv'
+    monkeypatch.setenv('PYAR_SCRATCH_ACCOUNTING', str(accounting_file))
+    monkeypatch.chdir(job_dir)
+
+    with file_manager.JobScratch('xtb', root=str(scratch)) as job:
+        assert os.getcwd() == job.directory
+        with open('result_water.xyz', 'w') as fp:
+            fp.write('y' * 300)
+        with open('intermediate.tmp', 'w') as fp:
+            fp.write('z' * 5000)
+        os.remove('intermediate.tmp')
+        job.succeeded = True
+
+    assert os.getcwd() == str(job_dir)
+    assert (job_dir / 'result_water.xyz').read_text() == 'y' * 300
+    assert not os.listdir(scratch)
+    # The unchanged input is not output, and deleted files are not counted
+    assert file_manager.scratch_usage(str(accounting_file)) == {'xtb': (1, 300)}
+
+
+def test_failed_job_keeps_its_scratch(tmp_path, monkeypatch):
+    scratch = tmp_path / 'scratch'
+    scratch.mkdir()
+    monkeypatch.chdir(tmp_path)
+    with file_manager.JobScratch('orca', root=str(scratch)) as job:
+        job.succeeded = False
+    assert os.path.isdir(job.directory)
+
+
+def test_job_failing_part_way_keeps_its_restart_files(tmp_path, monkeypatch):
+    job_dir = tmp_path / 'job_water'
+    scratch = tmp_path / 'scratch'
+    job_dir.mkdir()
+    scratch.mkdir()
+    monkeypatch.chdir(job_dir)
+
+    class EngineCrashed(Exception):
+        pass
+
+    try:
+        with file_manager.JobScratch('turbomole', root=str(scratch)) as job:
+            for name in ('control', 'coord', 'mos', 'job.last', 'trial_water.gbw'):
+                with open(name, 'w') as fp:
+                    fp.write(name)
+            raise EngineCrashed
+    except EngineCrashed:
+        pass
+
+    assert os.getcwd() == str(job_dir)
+    # Turbomole restarts from control, coord and mos; its scratch files stay behind
+    assert sorted(os.listdir(job_dir)) == ['control', 'coord', 'mos', 'trial_water.gbw']
+    assert sorted(os.listdir(job.directory)) == ['control', 'coord', 'job.last', 'mos', 'trial_water.gbw']
+
+    # An ORCA job brings its orbitals back, and a rerun is staged in with them
+    with file_manager.JobScratch('orca', root=str(scratch)) as job:
+        assert os.path.exists('mos')
+        with open('water.gbw', 'w') as fp:
+            fp.write('orbitals')
+    assert (job_dir / 'water.gbw').read_text() == 'orbitals'
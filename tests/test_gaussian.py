@@ -0,0 +1,11 @@
+import numpy as np
+
+from pyar.Molecule import Molecule
+from pyar.interface.gaussian import Gaussian
+
+
+def test_nprocshared_is_the_thread_count(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    molecule = Molecule(['H', 'H'], np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 0.74]]), name='h2')
+    geometry = Gaussian(molecule, {'nprocs': 8, 'basis': 'def2-SVP', 'method': 'B3LYP', 'scf_cycles': 64})
+    assert geometry.keyword.splitlines()[0] == '%nprocshared=8'
@@ -0,0 +1,125 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from pyar.interface.mlatom_aiqm1 import wait_for_termination
+
+
+def write_log_incrementally(log_file, lines, delay=0.05):
+    def write():
+        for line in lines:
+            time.sleep(delay)
+            with open(log_file, 'a') as fp:
+                fp.write(line + '\n')
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    return writer
+
+
+def test_normal_termination(tmp_path):
+    log_file = str(tmp_path / 'gaussian.log')
+    writer = write_log_incrementally(log_file, [' Entering Gaussian System', ' SCF Done:  E(RHF) =  -1.0',
+                                                ' Normal termination of Gaussian 16 at Mon Jan  1.'])
+    termination = wait_for_termination(log_file, timeout=10.0, poll_interval=0.01)
+    writer.join()
+    assert termination.status == 'normal'
+    assert 'Normal termination' in termination.last_line
+
+
+def test_error_termination(tmp_path):
+    log_file = str(tmp_path / 'gaussian.log')
+    writer = write_log_incrementally(log_file, [' Entering Gaussian System',
+                                                ' Error termination via Lnk1e in l502.exe'])
+    termination = wait_for_termination(log_file, timeout=10.0, poll_interval=0.01)
+    writer.join()
+    assert termination.status == 'error'
+
+
+def test_timeout_while_running(tmp_path):
+    log_file = str(tmp_path / 'gaussian.log')
+    with open(log_file, 'w') as fp:
+        fp.write(' Entering Gaussian System\n')
+    termination = wait_for_termination(log_file, timeout=0.2, poll_interval=0.01)
+    assert termination.status == 'timeout'
+    assert termination.waited >= 0.2
+
+
+def test_missing_log(tmp_path):
+    termination = wait_for_termination(str(tmp_path / 'gaussian.log'), timeout=0.1, poll_interval=0.01)
+    assert termination.status == 'missing'
+
+
+def molecule_from(atomic_numbers, coordinates, seed=0):
+    from pyar.mlatom import data
+    rng = np.random.default_rng(seed)
+    coordinates = np.array(coordinates, dtype=float) + rng.normal(0.0, 0.02, (len(atomic_numbers), 3))
+    return data.molecule.from_numpy(coordinates, np.array(atomic_numbers))
+
+
+def chno_molecules():
+    """CHNO molecules of two to six atoms"""
+    return [molecule_from([8, 1, 1], [[0, 0, 0.12], [0, 0.76, -0.47], [0, -0.76, -0.47]], 1),
+            molecule_from([6, 1, 1, 1, 1], [[0, 0, 0], [0.63, 0.63, 0.63], [-0.63, -0.63, 0.63],
+                                            [-0.63, 0.63, -0.63], [0.63, -0.63, -0.63]], 2),
+            molecule_from([1, 1], [[0, 0, 0], [0, 0, 0.74]], 3),
+            molecule_from([1, 6, 7], [[0, 0, -1.07], [0, 0, 0], [0, 0, 1.16]], 4),
+            molecule_from([6, 8, 1, 1, 1, 1], [[-0.05, 0.66, 0], [-0.05, -0.76, 0], [-1.08, 0.99, 0],
+                                               [0.44, 1.07, 0.89], [0.44, 1.07, -0.89], [0.87, -1.06, 0]], 5),
+            molecule_from([7, 1, 1, 1], [[0, 0, 0.11], [0, 0.94, -0.26], [0.81, -0.47, -0.26],
+                                         [-0.81, -0.47, -0.26]], 6)]
+
+
+def test_padded_batch_matches_the_molecules_one_by_one():
+    pytest.importorskip('torchani')
+    from pyar.mlatom import aiqm1, data
+
+    ensemble = [aiqm1.ani_nns_in_aiqm1(model_index=i) for i in range(2)]
+    molecules = chno_molecules()
+    database = data.molecular_database()
+    database.molecules.extend(molecules)
+    # Batches of four leave a second batch of two, padded to a different size
+    batched = aiqm1.predict_ani_nns_ensemble(ensemble, database, calculate_energy_gradients=True, batch_size=4)
+
+    for imol, molecule in enumerate(molecules):
+        energies, gradients = [], []
+        for member in ensemble:
+            one = molecule.copy()
+            member.predict_for_molecule(molecule=one, calculate_energy_gradients=True)
+            energies.append(one.energy)
+            gradients.append(one.get_energy_gradients())
+        assert batched['energy'][imol] == pytest.approx(np.mean(energies), abs=1e-9)
+        assert batched['energy_standard_deviation'][imol] == pytest.approx(np.std(energies), abs=1e-9)
+        assert np.allclose(batched['energy_gradients'][imol], np.mean(gradients, axis=0), atol=1e-8)
+
+
+def test_only_polyatomic_chno_molecules_are_batched(monkeypatch):
+    pytest.importorskip('torchani')
+    from pyar.mlatom import aiqm1, data
+
+    model = aiqm1.aiqm1()
+    batches = []
+
+    def predict_batch(molecular_database, **kwargs):
+        batches.append(list(molecular_database.molecules))
+        for molecule in molecular_database.molecules:
+            molecule.energy = -1.0
+            molecule.aiqm1_nn = SimpleNamespace(standard_deviation=lambda properties: None)
+
+    monkeypatch.setattr(model.aiqm1_model, 'predict', predict_batch)
+    water, methane = chno_molecules()[:2]
+    hydrogen_atom = molecule_from([1], [[0, 0, 0]])
+    hydrogen_atom.multiplicity = 2
+    chlorine = molecule_from([17, 17], [[0, 0, 0], [0, 0, 1.99]])
+    database = data.molecular_database()
+    database.molecules.extend([water, hydrogen_atom, chlorine, methane])
+    model.predict(molecular_database=database)
+
+    assert batches == [[water, methane]]
+    # A single atom falls back to the atomic energy, a non-CHNO molecule is not calculated
+    assert hydrogen_atom.energy == aiqm1.aiqm1.atomic_energies['AIQM1'][1]
+    assert not hasattr(chlorine, 'energy')
+    assert np.isclose(water.energy, -1.0)
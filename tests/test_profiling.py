@@ -0,0 +1,108 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from pyar import profiling
+
+PACKAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+WATER = """3
+water
+O   0.000   0.000   0.000
+H   0.000   0.000   0.960
+H   0.930   0.000  -0.240
+"""
+
+
+@pytest.fixture
+def trace(tmp_path, monkeypatch):
+    path = str(tmp_path / 'trace.jsonl')
+    monkeypatch.setenv('PYAR_TRACE', path)
+    return path
+
+
+def test_nested_spans(trace):
+    @profiling.timed('test.inner')
+    def inner():
+        time.sleep(0.01)
+
+    with profiling.span('test.outer', level=1):
+        inner()
+        inner()
+
+    records = [r for r in profiling.read_trace(trace) if 'duration' in r]
+    # A span is written when it ends, so the inner ones come first
+    assert [r['name'] for r in records] == ['test.inner', 'test.inner', 'test.outer']
+    outer = records[-1]
+    assert outer['args'] == {'level': 1}
+    for r in records[:2]:
+        assert outer['start'] <= r['start'] and r['start'] + r['duration'] <= outer['start'] + outer['duration']
+    spans, _ = profiling.totals(trace)
+    assert spans['test.inner'][0] == 2
+    assert spans['test.outer'][1] >= spans['test.inner'][1] >= 0.02
+
+
+def test_json_lines_and_chrome_trace(trace, tmp_path):
+    with profiling.span('test.phase'):
+        profiling.count('test.events')
+        profiling.count('test.events', 2)
+    with open(trace, 'a') as fp:
+        # A worker killed while writing leaves a partial line
+        fp.write('{"name": "test.ph')
+
+    spans, counters = profiling.totals(trace)
+    assert spans['test.phase'][0] == 1
+    assert counters == {'test.events': 3}
+    assert 'test.phase' in profiling.summary(trace)
+
+    output = str(tmp_path / 'chrome.json')
+    profiling.chrome_trace(trace, output)
+    with open(output) as fp:
+        events = json.load(fp)['traceEvents']
+    complete = [e for e in events if e['ph'] == 'X']
+    assert [e['name'] for e in complete] == ['test.phase']
+    assert complete[0]['cat'] == 'test' and complete[0]['dur'] > 0
+    assert [e['args'] for e in events if e['ph'] == 'C'] == [{'test.events': 1}, {'test.events': 3}]
+    counter = [e for e in events if e['ph'] == 'C'][0]
+    assert complete[0]['ts'] <= counter['ts'] <= complete[0]['ts'] + complete[0]['dur']
+
+
+def test_trace_follows_pyar_trace(tmp_path, monkeypatch):
+    for name in ('first.jsonl', 'second.jsonl'):
+        monkeypatch.setenv('PYAR_TRACE', str(tmp_path / name))
+        profiling.count(f'test.{name}')
+        assert [r['name'] for r in profiling.read_trace(str(tmp_path / name))] == [f'test.{name}']
+
+
+def run_cli(tmp_path, *arguments):
+    """Run pyar-cli on water with a fake xtb; the aggregation stops with sys.exit for lack of -as"""
+    (tmp_path / 'water.xyz').write_text(WATER)
+    xtb = tmp_path / 'xtb'
+    xtb.write_text('#!/bin/sh\necho "xtb version 6.6.1"\n')
+    xtb.chmod(0o755)
+    env = dict(os.environ, PYAR_XTB_EXE=str(xtb), PYTHONPATH=os.path.abspath(PACKAGE))
+    env.pop('PYAR_TRACE', None)
+    result = subprocess.run([sys.executable, os.path.join(PACKAGE, 'pyar', 'scripts', 'pyar-cli'),
+                             '-a', '-N', '2', '--software', 'xtb', *arguments, 'water.xyz'],
+                            cwd=str(tmp_path), env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            universal_newlines=True, timeout=120)
+    with open(tmp_path / 'pyar.log') as fp:
+        return result, fp.read()
+
+
+def test_timing_is_reported_when_the_run_exits_early(tmp_path):
+    result, log = run_cli(tmp_path, '--trace', 'trace.jsonl', '--chrome-trace', 'chrome.json')
+    assert result.returncode == 1
+    assert '-as <int>' in log
+    assert 'Time per phase' in log
+    assert os.path.exists(tmp_path / 'chrome.json')
+
+
+def test_no_timing_without_a_trace(tmp_path):
+    result, log = run_cli(tmp_path)
+    assert result.returncode == 1
+    assert 'Time per phase' not in log
@@ -0,0 +1,16 @@
+import pytest
+
+from pyar.interface import registry
+
+
+def test_mlatom_aiqm1_finds_gaussian_through_gauss_exedir(monkeypatch):
+    monkeypatch.delenv('GAUSS_EXEDIR', raising=False)
+    assert registry.mlatom_gaussian() is None
+    with pytest.raises(registry.EngineNotAvailable, match='GAUSS_EXEDIR'):
+        registry.check_engine('mlatom_aiqm1')
+
+    # g16 itself need not be on PATH
+    monkeypatch.setenv('PATH', '')
+    monkeypatch.setenv('GAUSS_EXEDIR', '/opt/g09/bsd:/opt/g09')
+    assert registry.mlatom_gaussian() == '/opt/g09/g09'
+    assert registry.check_engine('mlatom_aiqm1') is registry.ENGINES['mlatom_aiqm1']
@@ -0,0 +1,58 @@
+import os
+
+from pyar import resources
+
+
+def clear_thread_environment(monkeypatch):
+    for name in resources.thread_environment(1):
+        monkeypatch.delenv(name, raising=False)
+
+
+def test_nprocs_overrides_exported_threads(monkeypatch):
+    clear_thread_environment(monkeypatch)
+    monkeypatch.setenv('OMP_NUM_THREADS', '3')
+    qc_params = {}
+    jobs, threads = resources.plan_threads('orca', qc_params, parallel_jobs=2, nprocs=2, cores=list(range(8)))
+    assert (jobs, threads) == (2, 2)
+    assert qc_params['nprocs'] == 2
+    assert os.environ['OMP_NUM_THREADS'] == os.environ['MKL_NUM_THREADS'] == '2'
+
+
+def test_exported_threads_set_the_plan(monkeypatch):
+    clear_thread_environment(monkeypatch)
+    monkeypatch.setenv('OMP_NUM_THREADS', '3')
+    monkeypatch.setenv('MKL_NUM_THREADS', '1')
+    qc_params = {}
+    jobs, threads = resources.plan_threads('orca', qc_params, parallel_jobs=2, cores=list(range(8)))
+    assert (jobs, threads) == (2, 3)
+    assert qc_params['nprocs'] == 3
+    assert os.environ['OMP_NUM_THREADS'] == '3'
+    assert os.environ['MKL_NUM_THREADS'] == '1'
+
+
+def test_planned_and_autotuned_threads_override_the_environment(monkeypatch):
+    clear_thread_environment(monkeypatch)
+    qc_params = {}
+    assert resources.plan_threads('orca', qc_params, parallel_jobs=4, cores=list(range(8))) == (4, 2)
+    assert os.environ['OMP_NUM_THREADS'] == '2'
+
+    monkeypatch.setenv('OMP_NUM_THREADS', '8')
+    jobs, threads = resources.plan_threads('orca', qc_params, parallel_jobs=2, cores=list(range(8)),
+                                           calibrate=lambda threads: 1.0 / threads)
+    assert threads == 4
+    assert os.environ['OMP_NUM_THREADS'] == '4'
+
+
+def test_exported_threads(monkeypatch):
+    monkeypatch.setenv('OMP_NUM_THREADS', '6')
+    assert resources.exported_threads() == 6
+    for value in ('0', 'four', ''):
+        monkeypatch.setenv('OMP_NUM_THREADS', value)
+        assert resources.exported_threads() is None
+
+
+def test_plan_does_not_oversubscribe():
+    cores = list(range(8))
+    assert resources.plan('orca', {}, parallel_jobs=4, cores=cores) == (4, 2)
+    assert resources.plan('orca', {}, parallel_jobs=4, threads_per_job=4, cores=cores) == (2, 4)
+    assert resources.plan('obabel', {}, parallel_jobs=4, cores=cores) == (4, 1)
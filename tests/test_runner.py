@@ -0,0 +1,123 @@
+import os
+import stat
+import time
+
+import numpy as np
+import pytest
+
+from pyar import interface
+from pyar.interface import runner
+
+FAKE_ENGINE = """#!/bin/sh
+case "$1" in
+    ok) echo "optimization converged"; exit 0 ;;
+    crash) echo "segmentation fault"; exit 139 ;;
+    scf) echo "SCF NOT CONVERGED"; exit 1 ;;
+    cycles) echo "The optimization did not converge"; exit 0 ;;
+    hang) sleep 60 & echo $! > child.pid; wait ;;
+esac
+"""
+
+FAKE_ORCA = """#!/bin/sh
+cat > trial_water.xyz << END
+3
+Coordinates from ORCA-job trial_water
+  O   0.000000   0.000000   0.100000
+  H   0.000000   0.000000   1.000000
+  H   0.900000   0.000000  -0.200000
+END
+echo "FINAL SINGLE POINT ENERGY       -76.123456"
+echo "The optimization did not converge but reached the maximum number of"
+"""
+
+
+def write_script(path, text):
+    path.write_text(text)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def alive(pid):
+    """True if the process runs; a killed child that nobody reaped is a zombie"""
+    try:
+        with open(f'/proc/{pid}/stat') as fp:
+            return fp.read().rsplit(')', 1)[1].split()[0] not in 'ZX'
+    except FileNotFoundError:
+        return False
+    except OSError:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        return True
+
+
+@pytest.fixture
+def fake_engine(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return write_script(tmp_path / 'fake_engine', FAKE_ENGINE)
+
+
+def status_of(result, output_file='engine.out'):
+    return runner.classify(result, output_file, success=lambda text: 'converged' in text,
+                           cycle_exceeded=['The optimization did not converge'],
+                           scf_failure=['SCF NOT CONVERGED'])
+
+
+@pytest.mark.parametrize('mode, expected', [('ok', True), ('crash', 'Crashed'), ('scf', 'SCFFailed'),
+                                            ('cycles', 'CycleExceeded')])
+def test_classification(fake_engine, mode, expected):
+    result = runner.run([fake_engine, mode], 'engine.out')
+    assert status_of(result) == expected
+
+
+def test_timeout_kills_the_process_group(fake_engine):
+    start = time.time()
+    result = runner.run([fake_engine, 'hang'], 'engine.out', timeout=0.5)
+    assert result.timed_out
+    assert time.time() - start < 10
+    assert status_of(result) == 'Timeout'
+    with open('child.pid') as fp:
+        child = int(fp.read())
+    assert not alive(child)
+
+
+def test_timeout_from_the_environment(fake_engine, monkeypatch):
+    monkeypatch.setenv('PYAR_JOB_TIMEOUT', '0.5')
+    assert runner.run([fake_engine, 'hang'], 'engine.out').timed_out
+
+
+def test_missing_program_is_a_crash(fake_engine):
+    result = runner.run([fake_engine + '_missing'], 'engine.out')
+    assert status_of(result) == 'Crashed'
+
+
+def test_fallbacks(fake_engine):
+    prepared = []
+    attempts = [('default', [fake_engine, 'scf'], lambda: prepared.append('default')),
+                ('fallback', [fake_engine, 'ok'], lambda: prepared.append('fallback'))]
+    assert runner.run_with_fallbacks(attempts, 'engine.out', status_of) is True
+    assert prepared == ['default', 'fallback']
+
+    # A timeout or an exceeded cycle count is not retried
+    for mode, expected in (('hang', 'Timeout'), ('cycles', 'CycleExceeded')):
+        attempts = [('default', [fake_engine, mode], None), ('fallback', [fake_engine, 'ok'], None)]
+        assert runner.run_with_fallbacks(attempts, 'engine.out', status_of, timeout=0.5) == expected
+
+
+def test_orca_cycle_exceeded_keeps_the_last_geometry(tmp_path, monkeypatch):
+    from pyar.Molecule import Molecule
+    from pyar.interface.orca import Orca
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('PYAR_ORCA_EXE', write_script(tmp_path / 'orca', FAKE_ORCA))
+    interface.clear_executable_cache()
+    try:
+        molecule = Molecule(['O', 'H', 'H'], np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 0.96], [0.93, 0.0, -0.24]]),
+                            name='water')
+        geometry = Orca(molecule, {'method': 'r2SCAN-3c', 'basis': '', 'nprocs': 1, 'scf_cycles': 100})
+        assert geometry.optimize() == 'CycleExceeded'
+    finally:
+        interface.clear_executable_cache()
+    assert geometry.energy == pytest.approx(-76.123456)
+    assert np.allclose(molecule.coordinates[0], [0.0, 0.0, 0.1])
+    assert np.allclose(Molecule.from_xyz('trial_water.xyz').coordinates, molecule.coordinates, atol=1e-4)
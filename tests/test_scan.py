@@ -0,0 +1,36 @@
+import numpy as np
+
+from pyar.Molecule import Molecule
+from pyar.engines import lennard_jones_engine, morse_engine
+from pyar.scan import relaxed_scan
+
+
+def water():
+    return Molecule(['O', 'H', 'H'], np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 0.96], [0.93, 0.0, -0.24]]),
+                    name='water')
+
+
+def test_relaxed_scan_follows_the_targets():
+    profile = relaxed_scan(morse_engine(), water(), 0, 1, 1.5, number_of_points=6, method='constraint')
+    targets = [target for target, distance, energy, coordinates in profile]
+    distances = [distance for target, distance, energy, coordinates in profile]
+    energies = [energy for target, distance, energy, coordinates in profile]
+    assert len(profile) == 6
+    assert np.isclose(targets[0], 0.96) and np.isclose(targets[-1], 1.5)
+    assert np.allclose(distances, targets, atol=1e-4)
+    assert np.all(np.isfinite(energies))
+    # Stretching the O-H bond beyond its minimum raises the energy
+    assert energies[-1] > energies[0]
+
+
+def test_restrained_scan_stays_near_the_targets():
+    profile = relaxed_scan(morse_engine(), water(), 0, 1, 1.5, number_of_points=6)
+    # The harmonic restraint lets the bond fall a little short of a stretched target
+    assert np.allclose([p[1] for p in profile], [p[0] for p in profile], atol=2e-2)
+    assert np.all(np.isfinite([p[2] for p in profile]))
+
+
+def test_relaxed_scan_with_lennard_jones():
+    profile = relaxed_scan(lennard_jones_engine(), water(), 0, 1, 1.3, step=0.1, method='constraint')
+    assert np.allclose([p[1] for p in profile], [p[0] for p in profile], atol=1e-4)
+    assert np.all(np.isfinite([p[2] for p in profile]))
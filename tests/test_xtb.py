@@ -0,0 +1,39 @@
+import numpy as np
+
+import pyar.engines
+from pyar.Molecule import Molecule
+from pyar.interface.xtb import Xtb
+
+
+def test_cycle_exceeded_keeps_the_partial_geometry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pyar.engines, 'get_engine', lambda *args: pyar.engines.morse_engine())
+    start = np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 1.5], [1.4, 0.0, -0.3]])
+    molecule = Molecule(['O', 'H', 'H'], start.copy(), name='water')
+    geometry = Xtb(molecule, {'xtb_driver': 'library', 'opt_threshold': 'normal'})
+
+    assert geometry.optimize(max_cycles=2) == 'CycleExceeded'
+    partial = Molecule.from_xyz('trial_water.xyz')
+    assert not np.allclose(partial.coordinates, start)
+    assert np.allclose(partial.coordinates, molecule.coordinates, atol=1e-4)
+
+    # The next round starts from the partial geometry and goes on from there
+    next_round = Xtb(molecule, {'xtb_driver': 'library', 'opt_threshold': 'normal'})
+    assert np.allclose(next_round.start_coordinates, partial.coordinates, atol=1e-4)
+    assert next_round.optimize() is True
+
+
+def test_subprocess_is_the_default_driver(tmp_path, monkeypatch):
+    from pyar import interface
+    xtb = tmp_path / 'xtb'
+    xtb.write_text('#!/bin/sh\n')
+    xtb.chmod(0o755)
+    monkeypatch.setenv('PYAR_XTB_EXE', str(xtb))
+    monkeypatch.setattr(pyar.engines, 'get_engine', lambda *args: pyar.engines.morse_engine())
+    interface.clear_executable_cache()
+    try:
+        molecule = Molecule(['H', 'H'], np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 0.74]]), name='h2')
+        assert Xtb(molecule, {'opt_threshold': 'normal'}).engine is None
+        assert Xtb(molecule, {'xtb_driver': 'auto', 'opt_threshold': 'normal'}).engine is not None
+    finally:
+        interface.clear_executable_cache()